@@ -1,20 +1,12 @@
 from notifier import queue_message
-from database import redis_client
-import json
+from kline_codec import load_bars
 
 def _get_latest_5m_close(symbol):
-    key = f"historical_data:{symbol}:5m"
     try:
-        if not redis_client.exists(key):
+        bars = load_bars(symbol, "5m")
+        if not len(bars):
             return None
-        fields = redis_client.hkeys(key)
-        if not fields:
-            return None
-        latest_ts = max(int(x) for x in fields)
-        raw = redis_client.hget(key, latest_ts)
-        if not raw:
-            return None
-        return json.loads(raw).get("Close")
+        return float(bars["Close"][-1])
     except Exception:
         return None
 
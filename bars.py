@@ -0,0 +1,81 @@
+# bars.py
+"""
+列式K线容器：每个字段一个 numpy 数组（timestamp / open / high / low / close / volume / taker_buy_volume）
+
+- Bars.from_records：kline_codec 记录数组（KLINE_STORE.view / Redis blob / 归档）→ 各列连续数组
+- Bars.from_rows：旧的逐根 dict 行 → 列（仅作兼容适配）
+- as_bars：三种输入统一成 Bars，供结构分析 / 15m 辅助函数 / calculate_signal 使用
+"""
+import numpy as np
+
+# 列名 → 记录数组 / dict 行里的字段名
+FIELDS = {
+    "timestamp": "Timestamp",
+    "open": "Open",
+    "high": "High",
+    "low": "Low",
+    "close": "Close",
+    "volume": "Volume",
+    "taker_buy_volume": "TakerBuyVolume",
+}
+
+
+class Bars:
+    __slots__ = tuple(FIELDS)
+
+    def __init__(self, timestamp, open, high, low, close, volume, taker_buy_volume):
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.taker_buy_volume = taker_buy_volume
+
+    @classmethod
+    def from_records(cls, rec: np.ndarray) -> "Bars":
+        """记录数组 → 各列连续拷贝（每列一次 memcpy 级别的拷贝，之后全是连续内存运算）"""
+        return cls(*(np.ascontiguousarray(rec[name]) for name in FIELDS.values()))
+
+    @classmethod
+    def from_rows(cls, rows) -> "Bars":
+        """逐根 dict 行 → 列；缺失字段记 NaN（时间戳缺失记 0），成交量兼容 Vol / volume"""
+        def col(key, *alt):
+            out = []
+            for r in rows:
+                v = r.get(key)
+                for a in alt:
+                    if v is not None:
+                        break
+                    v = r.get(a)
+                out.append(np.nan if v is None else float(v))
+            return np.array(out, dtype=float)
+
+        ts = np.array([int(r.get("Timestamp") or 0) for r in rows], dtype=np.int64)
+        return cls(
+            ts, col("Open"), col("High"), col("Low"), col("Close"),
+            col("Volume", "Vol", "volume"), col("TakerBuyVolume"),
+        )
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    def __getitem__(self, item) -> "Bars":
+        if not isinstance(item, slice):
+            raise TypeError("Bars 只支持切片，单根请直接取列：bars.close[-1]")
+        return Bars(*(getattr(self, f)[item] for f in FIELDS))
+
+    def to_records(self) -> np.ndarray:
+        from kline_codec import KLINE_DTYPE
+        out = np.empty(len(self), dtype=KLINE_DTYPE)
+        for f, name in FIELDS.items():
+            out[name] = getattr(self, f)
+        return out
+
+
+def as_bars(rows) -> Bars:
+    if isinstance(rows, Bars):
+        return rows
+    if getattr(rows, "dtype", None) is not None and rows.dtype.names:
+        return Bars.from_records(rows)
+    return Bars.from_rows(rows)
@@ -0,0 +1,135 @@
+# batch_indicators.py
+"""
+全市场 EMA / ATR 批量计算：同一周期、同样根数的币种堆成矩阵，一次向量化算完
+
+- 矩阵按时间为行、币种为列（N, S）：递推每一步是一行连续内存上的向量运算，
+  Python 循环次数只与根数有关，与币种数无关
+- 种子与递推同 talib，结果与 talib 一致到浮点舍入误差：
+    EMA：前 p 根 SMA 作种子，之后 ema = (x - prev) * k + prev，k = 2 / (p + 1)
+    ATR：TR[0] 不用；TR[1..p] 的 SMA 作种子，之后 Wilder 平滑 prev + (tr - prev) * (1 / p)
+- 输出字段与 calculate_signal 相同：close / ema / atr / atr_ma20 / atr_ratio
+"""
+import numpy as np
+from config import EMA_CONFIG
+from kline_store import KLINE_STORE
+
+ATR_PERIOD = 14
+ATR_MA_WINDOW = 20
+MIN_BARS = 5  # 与 calculate_signal 一致：不足 5 根不计算
+
+
+def ema_matrix(closes: np.ndarray, p: int) -> np.ndarray:
+    """closes: (N, S) → EMA (N, S)，前 p-1 行为 NaN；N < p 时全 NaN"""
+    n, s = closes.shape
+    out = np.full((n, s), np.nan)
+    if n < p:
+        return out
+    k = 2.0 / (p + 1)
+    prev = out[p - 1]
+    np.mean(closes[:p], axis=0, out=prev)
+    for i in range(p, n):
+        cur = out[i]
+        np.subtract(closes[i], prev, out=cur)
+        cur *= k
+        cur += prev
+        prev = cur
+    return out
+
+
+def true_range_matrix(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray) -> np.ndarray:
+    """TR (N, S)，第 0 行为 NaN"""
+    tr = np.full(highs.shape, np.nan)
+    prev_close = closes[:-1]
+    h, l = highs[1:], lows[1:]
+    tr[1:] = np.maximum(np.maximum(h - l, np.abs(h - prev_close)), np.abs(l - prev_close))
+    return tr
+
+
+def atr_matrix(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, p: int = ATR_PERIOD) -> np.ndarray:
+    """ATR (N, S)，前 p 行为 NaN；N <= p 时全 NaN"""
+    n, s = closes.shape
+    out = np.full((n, s), np.nan)
+    if n <= p:
+        return out
+    tr = true_range_matrix(highs, lows, closes)
+    k = 1.0 / p
+    prev = out[p]
+    np.mean(tr[1:p + 1], axis=0, out=prev)
+    for i in range(p + 1, n):
+        cur = out[i]
+        np.subtract(tr[i], prev, out=cur)
+        cur *= k
+        cur += prev
+        prev = cur
+    return out
+
+
+def _compute_group(symbols: list[str], views: list[np.ndarray], interval: str) -> dict[str, dict]:
+    closes = np.stack([v["Close"] for v in views], axis=1)
+    highs = np.stack([v["High"] for v in views], axis=1)
+    lows = np.stack([v["Low"] for v in views], axis=1)
+    n = closes.shape[0]
+
+    emas = {p: ema_matrix(closes, p)[-1] for p in EMA_CONFIG.get(interval, [])}
+
+    atr = atr_matrix(highs, lows, closes)
+    atr_last = atr[-1]
+    # 同组根数相同 → 有效 ATR 个数相同：取最后 min(20, 有效数) 个
+    n_valid = max(n - ATR_PERIOD, 0)
+    if n_valid:
+        w = min(ATR_MA_WINDOW, n_valid)
+        # 转成每币种一行再求和：与逐币种 np.nanmean 的求和顺序相同
+        atr_ma20 = np.ascontiguousarray(atr[-w:].T).sum(axis=1) / w
+    else:
+        atr_ma20 = np.full(len(symbols), np.nan)
+
+    ema_last = {f"EMA_{p}": v.tolist() for p, v in emas.items()}
+    atr_list = atr_last.tolist()
+    ma_list = atr_ma20.tolist()
+    close_list = closes[-1].tolist()
+
+    def _f(x):
+        return x if np.isfinite(x) else None
+
+    out = {}
+    for i, sym in enumerate(symbols):
+        atr_current = _f(atr_list[i])
+        close = close_list[i]
+        out[sym] = {
+            "close": close,
+            "ema": {name: _f(v[i]) for name, v in ema_last.items()},
+            "atr": atr_current,
+            "atr_ma20": _f(ma_list[i]),
+            "atr_ratio": float(atr_current / close) if atr_current is not None and close != 0.0 else None,
+        }
+    return out
+
+
+def compute_batch(symbols, interval: str) -> dict[str, dict]:
+    """单周期：从K线存储取全部币种，按根数分组后批量计算"""
+    groups: dict[int, tuple[list[str], list[np.ndarray]]] = {}
+    for sym in symbols:
+        v = KLINE_STORE.view(sym, interval)
+        if len(v) < MIN_BARS:
+            continue
+        syms, views = groups.setdefault(len(v), ([], []))
+        syms.append(sym)
+        views.append(v)
+
+    out = {}
+    for syms, views in groups.values():
+        out.update(_compute_group(syms, views, interval))
+    return out
+
+
+def compute_batch_pairs(pairs) -> dict[tuple[str, str], dict]:
+    """(symbol, interval) 集合 → {(symbol, interval): 批量指标}"""
+    by_tf: dict[str, list[str]] = {}
+    for sym, tf in pairs:
+        by_tf.setdefault(tf, []).append(sym)
+
+    out = {}
+    for tf, syms in by_tf.items():
+        for sym, res in compute_batch(syms, tf).items():
+            out[(sym, tf)] = res
+    return out
@@ -0,0 +1,128 @@
+# batch_planner.py
+"""
+自适应投喂分批：按 token 估算装箱，按近期延迟 / 超时率调整每批 token 预算
+
+- 每个币种的 token 数用 referee_gate.estimate_tokens 估算（序列化后的快照）
+- 装箱：按 token 从大到小放进当前最轻的一批（每批不超过 max_symbols 个币种），
+  批数 = max(总 token / 预算, 币种数 / max_symbols) 向上取整；批内保持原有币种顺序
+- 各批并发投喂，整轮耗时 ≈ 最慢一批，所以预算按“单批延迟”调：
+    push_batch_to_ai 每批记一条 (prompt token, 耗时, 是否成功, 是否真的有尝试超时)，保留最近 LLM_LATENCY_WINDOW 条
+    每轮结束 end_round()，只看上次调整之后新观测到的样本（同一批慢样本不会被连续几轮反复计入，把预算一路压到下限）：
+      本轮超过截止时间、超时率 > LLM_BATCH_TIMEOUT_RATE_MAX 或 p90 延迟 > 截止时间 * 0.8  → 预算 × 0.7
+      p90 延迟 < 截止时间 * 0.4 且无超时                                 → 预算 × 1.15
+    样本够时再用整个窗口做 延迟 ≈ a + b * token 的线性拟合，把预算压到预计延迟不超过 截止时间 * 0.6
+    （拟合只给上限、不累乘，用整个窗口不会越压越小）
+  截止时间 = LLM_ROUND_DEADLINE_SEC（给一次重试留出余量）
+"""
+import math
+from collections import deque
+from config import (
+    LLM_BATCH_TARGET_TOKENS, LLM_BATCH_MIN_TOKENS, LLM_BATCH_MAX_TOKENS,
+    LLM_ROUND_DEADLINE_SEC, LLM_LATENCY_WINDOW, LLM_BATCH_TIMEOUT_RATE_MAX,
+)
+from referee_gate import estimate_tokens
+
+MIN_FIT_SAMPLES = 8
+
+
+def pack_symbols(tokens: dict[str, int], max_tokens: int, max_symbols: int) -> list[list[str]]:
+    """{symbol: token} → 每批的币种列表（顺序同输入）"""
+    if not tokens:
+        return []
+    total = sum(tokens.values())
+    n = max(math.ceil(total / max(max_tokens, 1)), math.ceil(len(tokens) / max(max_symbols, 1)), 1)
+    n = min(n, len(tokens))
+
+    loads = [0] * n
+    members: list[list[str]] = [[] for _ in range(n)]
+    for sym in sorted(tokens, key=tokens.get, reverse=True):
+        open_bins = [i for i in range(n) if len(members[i]) < max_symbols]
+        i = min(open_bins, key=loads.__getitem__)
+        loads[i] += tokens[sym]
+        members[i].append(sym)
+
+    order = {s: k for k, s in enumerate(tokens)}
+    return [sorted(m, key=order.__getitem__) for m in members if m]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class BatchPlanner:
+    def __init__(self):
+        self.target = LLM_BATCH_TARGET_TOKENS
+        self.deadline_ms = LLM_ROUND_DEADLINE_SEC * 1000
+        # (prompt token, 耗时 ms | None, 成功, 超时)
+        self.window: deque[tuple[int, float | None, bool, bool]] = deque(maxlen=LLM_LATENCY_WINDOW)
+        self.fresh = 0  # 上次调整之后新增的样本数
+
+    # ------------------------------
+    # 估算 / 装箱
+    # ------------------------------
+    @staticmethod
+    def symbol_tokens(dataset: dict) -> dict[str, int]:
+        return {s: estimate_tokens(v) for s, v in dataset.items() if s not in ("positions", "balance_info") and v}
+
+    def plan(self, dataset: dict, max_symbols: int) -> list[list[str]]:
+        return pack_symbols(self.symbol_tokens(dataset), self.target, max_symbols)
+
+    # ------------------------------
+    # 观测 / 调整
+    # ------------------------------
+    def observe(self, tokens: int, latency_ms: float | None, ok: bool, timeout: bool):
+        self.window.append((tokens, latency_ms, ok, timeout))
+        self.fresh = min(self.fresh + 1, len(self.window))
+
+    def _fit_cap(self) -> int | None:
+        """延迟 ≈ a + b * token 的最小二乘；预计延迟不超过 截止时间 * 0.6 时的最大 token"""
+        pts = [(t, ms) for t, ms, ok, _ in self.window if ok and ms is not None]
+        if len(pts) < MIN_FIT_SAMPLES:
+            return None
+        n = len(pts)
+        mx = sum(t for t, _ in pts) / n
+        my = sum(ms for _, ms in pts) / n
+        var = sum((t - mx) ** 2 for t, _ in pts)
+        if var <= 0:
+            return None
+        b = sum((t - mx) * (ms - my) for t, ms in pts) / var
+        if b <= 0:
+            return None
+        a = my - b * mx
+        return int((self.deadline_ms * 0.6 - a) / b)
+
+    def end_round(self, round_ms: float | None = None) -> dict:
+        """每轮投喂结束（round_ms：本轮投喂阶段总耗时）：按上次调整后的新样本调整预算，返回本次调整的依据"""
+        recent = list(self.window)[len(self.window) - self.fresh:]
+        self.fresh = 0
+
+        latencies = [ms for _, ms, ok, _ in recent if ok and ms is not None]
+        timeouts = sum(1 for *_, to in recent if to)
+        timeout_rate = timeouts / len(recent) if recent else 0.0
+        p90 = _percentile(latencies, 0.9) if latencies else None
+
+        before = self.target
+        over_deadline = round_ms is not None and round_ms > self.deadline_ms
+        if over_deadline or timeout_rate > LLM_BATCH_TIMEOUT_RATE_MAX or (p90 is not None and p90 > self.deadline_ms * 0.8):
+            self.target *= 0.7
+        elif p90 is not None and p90 < self.deadline_ms * 0.4 and not timeouts:
+            self.target *= 1.15
+        cap = self._fit_cap()
+        if cap is not None:
+            self.target = min(self.target, cap)
+        self.target = int(min(max(self.target, LLM_BATCH_MIN_TOKENS), LLM_BATCH_MAX_TOKENS))
+
+        return {
+            "round_ms": round_ms,
+            "over_deadline": over_deadline,
+            "p90_ms": round(p90, 2) if p90 is not None else None,
+            "timeout_rate": round(timeout_rate, 3),
+            "samples": len(recent),
+            "fit_cap": cap,
+            "target_before": before,
+            "target": self.target,
+        }
+
+
+BATCH_PLANNER = BatchPlanner()
@@ -0,0 +1,310 @@
+# benchmark.py
+"""
+热点路径基准：指标计算 / 结构识别 / 裁判 / 投喂数据构建 / 响应 JSON 提取
+
+- 完全离线：Redis 换成进程内 fakeredis，account_positions 换成空账户桩（不连币安）；
+  导入本模块即切换成离线环境，只作为脚本使用
+- 数据源：
+    synthetic  几何随机游走K线（固定种子，可复现）
+    archive    本地归档（kline_archive）里录制的真实K线，每个周期取最后 N 根
+- 规模：--symbols × --bars 的每个组合各跑一遍，每项计时 --repeat 次（先预热一次），取中位数 / 最小值
+- 计时项：
+    calculate_signal          全部币种 × 全部周期走一遍串行路径（talib + 结构 + 落地，每次前清空状态）
+    MarketStructure.analyze   各周期整窗结构识别（无状态）
+    referee_snapshot          每币种一次裁判
+    _build_dataset_json       按 5 币种一批构建投喂 JSON
+    _extract_all_json         每批一份模拟模型响应（<reasoning> + <decision>）
+- 结果写成 JSON（--out），带 git 版本 / Python / numpy 版本，不同版本之间直接对比
+
+用法：
+    python benchmark.py --symbols 10,100,500 --bars 301,501,801 --repeat 5 --out bench.json
+    python benchmark.py --source archive --symbols 50 --bars 301
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import platform
+import statistics
+import subprocess
+
+
+# ==========================================================
+# 离线环境（必须在导入项目模块之前）
+# ==========================================================
+def _setup_offline():
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("❌ benchmark 需要 fakeredis：pip install fakeredis")
+    import redis
+
+    server = fakeredis.FakeServer()
+
+    def _client(*args, **kwargs):
+        return fakeredis.FakeStrictRedis(server=server, decode_responses=kwargs.get("decode_responses", False))
+
+    redis.StrictRedis = redis.Redis = _client
+
+    stub = types.ModuleType("account_positions")
+    stub.account_snapshot = {"balance": 10000.0, "available": 10000.0, "total_unrealized": 0.0, "positions": []}
+    stub.tp_sl_cache = {}
+    stub.get_account_status = lambda: stub.account_snapshot
+    sys.modules["account_positions"] = stub
+
+
+_setup_offline()
+
+import numpy as np
+from config import timeframes, KLINE_LIMITS, STRUCTURE_PARAMS, KLINE_ARCHIVE_DIR
+from kline_codec import KLINE_DTYPE, INTERVAL_MS
+from kline_store import KLINE_STORE
+from kline_archive import KlineArchive
+from market_structure import MarketStructure
+from payload_builder import referee_snapshot
+from signal_memo import MEMO
+from signal_round import SignalRound
+from indicators import calculate_signal_single, forget_signal
+import deepseek_batch_pusher as pusher
+
+
+# ==========================================================
+# 数据生成
+# ==========================================================
+END_TS = 1_700_000_000_000 // INTERVAL_MS["4h"] * INTERVAL_MS["4h"]
+
+
+def synthetic_bars(seed: int, interval: str, n: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    step = INTERVAL_MS[interval]
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    span = np.abs(rng.normal(0, 0.006, n)) * close
+    bars = np.empty(n, dtype=KLINE_DTYPE)
+    bars["Timestamp"] = END_TS - step * np.arange(n, 0, -1)
+    bars["Open"] = open_
+    bars["Close"] = close
+    bars["High"] = np.maximum(open_, close) + span
+    bars["Low"] = np.minimum(open_, close) - span
+    bars["Volume"] = rng.lognormal(8, 1, n)
+    bars["TakerBuyVolume"] = bars["Volume"] * rng.beta(5, 5, n)
+    return bars
+
+
+def synthetic_source(n_symbols: int, n_bars: int) -> dict[str, dict[str, np.ndarray]]:
+    return {
+        f"B{i:04d}USDT": {tf: synthetic_bars(i * 7 + j, tf, n_bars) for j, tf in enumerate(timeframes)}
+        for i in range(n_symbols)
+    }
+
+
+def archive_source(archive_dir: str, n_symbols: int, n_bars: int) -> dict[str, dict[str, np.ndarray]]:
+    """归档里各周期都有的币种；数量不够时循环复用（改名）"""
+    archive = KlineArchive(archive_dir)
+    names = None
+    for tf in timeframes:
+        d = os.path.join(archive_dir, tf)
+        found = {f[:-4] for f in os.listdir(d) if f.endswith(".bin")} if os.path.isdir(d) else set()
+        names = found if names is None else names & found
+    names = sorted(names or [])
+    if not names:
+        sys.exit(f"❌ 归档 {archive_dir} 里没有同时包含 {timeframes} 的币种")
+
+    data = {sym: {tf: np.array(archive.tail(sym, tf, n_bars)) for tf in timeframes} for sym in names}
+    out = {}
+    for i in range(n_symbols):
+        sym = names[i % len(names)]
+        out[sym if i < len(names) else f"{sym}#{i // len(names)}"] = data[sym]
+    return out
+
+
+def fake_preloaded(symbols) -> dict:
+    return {
+        "funding": {s: 0.0001 for s in symbols},
+        "oi": {s: 123456.0 for s in symbols},
+        "p24": {
+            s: {"lastPrice": 100.0, "highPrice": 105.0, "lowPrice": 95.0,
+                "priceChangePercent": 1.23, "quoteVolume": 1.5e8}
+            for s in symbols
+        },
+    }
+
+
+def fake_response(symbols) -> str:
+    reasoning = " ".join(f"{s} 4H 区间下沿，15m 假突破回收，量能放大，倾向做多。" for s in symbols) * 4
+    decision = [
+        {"symbol": s, "action": "open_long" if i % 2 else "wait", "stop_loss": 95.0,
+         "take_profit": 110.0, "position_size": 100, "confidence": 0.7}
+        for i, s in enumerate(symbols)
+    ]
+    return f"<reasoning>{reasoning}</reasoning>\n<decision>{json.dumps(decision, ensure_ascii=False)}</decision>"
+
+
+# ==========================================================
+# 计时
+# ==========================================================
+def _time(fn, repeat: int, calls: int, setup=None) -> dict:
+    if setup:
+        setup()
+    fn()  # 预热
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    median = statistics.median(samples)
+    return {
+        "calls": calls,
+        "median_ms": round(median * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "per_call_us": round(median * 1e6 / calls, 3) if calls else None,
+    }
+
+
+def _load(data: dict[str, dict[str, np.ndarray]], n_bars: int):
+    for tf in timeframes:
+        KLINE_LIMITS[tf] = n_bars + 1  # 环形缓冲容量 = limit - 1
+    for sym, _ in KLINE_STORE.keys():
+        KLINE_STORE.drop_symbol(sym)
+    for sym, by_tf in data.items():
+        for tf, bars in by_tf.items():
+            KLINE_STORE.load(sym, tf, bars)
+
+
+def run_case(data: dict, n_bars: int, repeat: int) -> dict[str, dict]:
+    symbols = list(data)
+    _load(data, n_bars)
+    out = {}
+
+    # --- calculate_signal：每次前清空记忆化 / 增量状态，测完整计算 ---
+    def reset():
+        for sym in symbols:
+            forget_signal(sym)
+        pusher.batch_cache.clear()
+
+    def signals():
+        rnd = SignalRound()
+        for sym in symbols:
+            calculate_signal_single(sym, None, None, rnd)
+        rnd.flush()
+
+    out["calculate_signal"] = _time(signals, repeat, len(symbols) * len(timeframes), setup=reset)
+
+    # --- MarketStructure.analyze ---
+    windows = [(MarketStructure(**STRUCTURE_PARAMS[tf]), KLINE_STORE.bars(sym, tf))
+               for sym in symbols for tf in timeframes if tf in STRUCTURE_PARAMS]
+
+    def structures():
+        for ms, rows in windows:
+            ms.analyze(rows)
+
+    out["MarketStructure.analyze"] = _time(structures, repeat, len(windows))
+
+    # --- referee_snapshot（用上面算好的快照） ---
+    snaps = [tuple(MEMO.peek(sym, tf) for tf in ("4h", "1h", "15m")) for sym in symbols]
+
+    def referees():
+        for tf4h, tf1h, tf15m in snaps:
+            referee_snapshot(tf4h, tf1h, tf15m)
+
+    out["referee_snapshot"] = _time(referees, repeat, len(snaps))
+
+    # --- _build_dataset_json（按 5 币种一批，同 push_batch_to_ai） ---
+    dataset = {sym: dict(cycles) for sym, cycles in pusher.batch_cache.items()}
+    batches = [
+        {k: dataset[k] for k in symbols[i:i + 5] if k in dataset}
+        for i in range(0, len(symbols), 5)
+    ]
+    preloaded = fake_preloaded(symbols)
+
+    def datasets():
+        for batch in batches:
+            json.dumps(pusher._build_dataset_json(batch, preloaded), ensure_ascii=False)
+
+    out["_build_dataset_json"] = _time(datasets, repeat, len(batches))
+
+    # --- _extract_all_json ---
+    responses = [fake_response(list(batch)) for batch in batches]
+
+    def extracts():
+        for r in responses:
+            pusher._extract_all_json(r)
+
+    out["_extract_all_json"] = _time(extracts, repeat, len(responses))
+    return out
+
+
+def _git_version() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="离线热点路径基准")
+    ap.add_argument("--symbols", default="10,100,500", help="逗号分隔的币种数")
+    ap.add_argument("--bars", default="301,501,801", help="逗号分隔的每周期K线根数")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--source", choices=["synthetic", "archive"], default="synthetic")
+    ap.add_argument("--archive-dir", default=KLINE_ARCHIVE_DIR)
+    ap.add_argument("--out", default="benchmark.json", help="结果 JSON 路径")
+    args = ap.parse_args(argv)
+
+    sizes = [int(x) for x in args.symbols.split(",")]
+    bar_counts = [int(x) for x in args.bars.split(",")]
+    limits = dict(KLINE_LIMITS)
+
+    report = {
+        "meta": {
+            "version": _git_version(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "source": args.source,
+            "repeat": args.repeat,
+            "timeframes": list(timeframes),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": [],
+    }
+
+    # 基准本身的打印（批次拆分等）不计入输出
+    log = sys.stdout
+    try:
+        for n_symbols in sizes:
+            for n_bars in bar_counts:
+                if args.source == "archive":
+                    data = archive_source(args.archive_dir, n_symbols, n_bars)
+                else:
+                    data = synthetic_source(n_symbols, n_bars)
+                sys.stdout = open(os.devnull, "w")
+                try:
+                    cases = run_case(data, n_bars, args.repeat)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = log
+                for name, stat in cases.items():
+                    report["results"].append({"symbols": n_symbols, "bars": n_bars, "case": name, **stat})
+                    print(f"⏱ {n_symbols:>4} 币 × {n_bars:>4} 根 | {name:<24} "
+                          f"{stat['median_ms']:>10.3f} ms | {stat['per_call_us']:>10.3f} µs/次")
+    finally:
+        KLINE_LIMITS.clear()
+        KLINE_LIMITS.update(limits)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 结果已写入 {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
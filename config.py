@@ -16,6 +16,35 @@ CLAUDE_URL = "https://api.aibtc.vip/v1/chat/completions"
 
 AI_PROVIDER = "claude"  # 这里不能改
 
+#多端点路由：OpenAI 兼容的 (url, model, key) 列表，按 EWMA 延迟 / 失败率 / 吞吐选最优健康端点，连续失败熔断
+LLM_ENDPOINTS = [
+    {"name": "aibtc", "url": CLAUDE_URL, "model": CLAUDE_MODEL, "api_key": CLAUDE_API_KEY},
+    # {"name": "backup", "url": "https://example.com/v1/chat/completions", "model": "deepseek-chat", "api_key": "..."},
+]
+LLM_EWMA_ALPHA = 0.3              # 端点统计 EWMA 系数
+LLM_BREAKER_FAILURES = 3          # 连续失败多少次熔断
+LLM_BREAKER_COOLDOWN_SEC = 60     # 熔断冷却秒数，之后放一个探测请求
+
+#流式投喂：SSE 边收边解析 <decision>，每条需执行的决策立即下单，不等整批/全部批次返回
+LLM_STREAM_ENABLED = True
+
+#投喂自适应分批：按币种 token 估算装箱，每批 token 预算随近期单批延迟 / 超时率自动调整
+LLM_BATCH_ADAPTIVE = True              # False = 固定每批 5 个币种
+LLM_BATCH_MAX_SYMBOLS = 8              # 每批币种上限（压缩币种另见 REFEREE_GATE_COMPRESSED_PER_BATCH）
+LLM_BATCH_TARGET_TOKENS = 6000         # 初始每批 token 预算
+LLM_BATCH_MIN_TOKENS = 1500
+LLM_BATCH_MAX_TOKENS = 20000
+LLM_ROUND_DEADLINE_SEC = 30            # 投喂阶段截止时间（各批并发，约等于最慢一批）
+LLM_LATENCY_WINDOW = 50                # 最近多少批的延迟 / 超时参与调整
+LLM_BATCH_TIMEOUT_RATE_MAX = 0.1       # 窗口超时率超过该值时收缩预算
+
+#投喂请求执行：整轮截止时间（LLM_ROUND_DEADLINE_SEC）内重试，超过近期 p90 未返回时发对冲请求，先返回的胜出
+LLM_HEDGE_ENABLED = True
+LLM_HEDGE_MIN_SAMPLES = 10             # 成功样本不足时不对冲
+LLM_HEDGE_MIN_DELAY_SEC = 3            # 对冲等待下限
+LLM_RETRY_BUDGET = 4                   # 每轮所有批次共享的重试 + 对冲次数
+LLM_MIN_ATTEMPT_SEC = 3                # 距截止时间不足该秒数不再发起新尝试
+
 # ===== 固定币种监控池 =====
 monitor_symbols = ['ETHUSDT', 'SOLUSDT']
 # monitor_symbols = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT']
@@ -45,12 +74,46 @@ KLINE_LIMITS = {
     "4h": 801,
 }
 
+#K线同步：True=增量（只拉上次之后的新K线，冷启动/缺口时回退全量）  False=每轮全量
+KLINE_INCREMENTAL_SYNC = True
+
+#K线下载：共享 aiohttp Session 上的并发上限；按 X-MBX-USED-WEIGHT-1M 节流（币安期货 2400/分钟）
+KLINE_FETCH_CONCURRENCY = 16
+KLINE_WEIGHT_LIMIT_1M = 2400
+
+#K线 WebSocket 流：收盘K线实时写入，REST 增量同步只补缺（冷启动/断线）
+KLINE_STREAM_ENABLED = True
+KLINE_STREAM_URL = "wss://fstream.binance.com/stream"
+KLINE_STREAM_CLOSE_WAIT = 3  # 15m 收盘后最多等待多少秒让全部币种的收盘推送到齐
+
+#高周期本地重采样：已预热后 1h/4h 由 15m 合成，不再单独下载（启动时校验与交易所对齐）
+RESAMPLE_ENABLED = True
+RESAMPLE_TIMEFRAMES = {"1h": "15m", "4h": "15m"}
+
+#本地K线归档：每个 (symbol, interval) 一个只追加的内存映射文件，重启从磁盘预热、回补优先读本地
+KLINE_ARCHIVE_ENABLED = True
+KLINE_ARCHIVE_DIR = "data/klines"
+
+#EMA/ATR 增量状态：每根新K线 O(1) 更新，检查点存 Redis（indicator_state），窗口过短时回退批量计算
+INDICATOR_STATE_ENABLED = True
+
 #结构计算
 STRUCTURE_PARAMS = {
     "15m": {"swing_size": 4, "keep_pivots": 10, "trend_vote_lookback": 3, "range_pivot_k": 3},
     "1h":  {"swing_size": 6, "keep_pivots": 12, "trend_vote_lookback": 3, "range_pivot_k": 3},
     "4h":  {"swing_size": 10, "keep_pivots": 14, "trend_vote_lookback": 3, "range_pivot_k": 3},
 }
+#结构增量计算：每个 (symbol, interval) 常驻一个 IncrementalMarketStructure，新K线只确认新 pivot
+STRUCTURE_INCREMENTAL = True
+
+#指标并行计算：币种按 crc32 固定分片到常驻 worker 进程（fork），结构增量状态留在各自 worker 里
+INDICATOR_WORKERS = 0                 # 0 = CPU 核数；1 = 关闭并行
+INDICATOR_PARALLEL_MIN_SYMBOLS = 64   # 本轮币种数低于该值时走串行（进程间传输不划算）
+INDICATOR_WORKER_TIMEOUT_SEC = 20     # 每个计算阶段等 worker 的上限，超时的分片回退主进程串行计算
+
+#裁判前置过滤（仅 scan 轮）：NO_TRADE 的币种不投喂 / 只投喂裁判结论，持仓币种始终原样投喂
+REFEREE_GATE_MODE = "compress"          # off / drop / compress
+REFEREE_GATE_COMPRESSED_PER_BATCH = 20  # compress 模式下每个投喂批次最多附带的压缩币种数
 
 # 每个话题在 TG 群里的 message_thread_id
 TOPIC_MAP = {
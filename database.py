@@ -5,19 +5,26 @@ redis_client = redis.StrictRedis(
     host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True
 )
 
+# 二进制值（K线 packed blob）专用，不做 utf-8 解码
+redis_bin_client = redis.StrictRedis(
+    host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=False
+)
+
 def clear_redis():
     keep = {
         "deepseek_analysis_request_history",
         "deepseek_analysis_response_history",
         "profit:ultra_simple",
-        "trading_records"
+        "trading_records",
+        "indicator_state",
     }
 
     keys = redis_client.keys("*")
     deleted = 0
 
     for key in keys:
-        if key not in keep:
+        # K线 blob 是进程内K线存储的 write-behind 副本，保留用于重启预热
+        if key not in keep and not key.startswith("kline_bin:"):
             redis_client.delete(key)
             deleted += 1
 
@@ -0,0 +1,127 @@
+# decision_stream.py
+"""
+流式（SSE）模型响应的增量解析：边收边解析 <decision> 里的 JSON 决策，每解析完一条立即回调
+
+- SSE：OpenAI 兼容格式，每行 "data: {...}"，增量文本在 choices[0].delta.content，"data: [DONE]" 结束
+- <decision> 块是一个 JSON 数组；按字符扫描（跟踪字符串 / 转义 / 花括号深度），
+  数组里每个顶层对象闭合时单独 json.loads，带 symbol 和 action 的才算一条决策
+- 模型可能输出 HTML 转义（&lt;decision&gt;）：每个分片单独 html.unescape，
+  分片末尾不完整的实体（"&l"）留到下一个分片再解
+- 完整文本最后仍交给 _extract_all_json 做最终解析；这里只负责“尽早拿到决策”
+"""
+import re
+import json
+import html
+import logging
+
+_OPEN = re.compile(r"<decision>", re.I)
+_CLOSE = "</decision>"
+_PARTIAL_ENTITY = re.compile(r"&[#a-zA-Z0-9]{0,10}$")
+
+
+class DecisionStreamParser:
+    def __init__(self):
+        self.text = ""           # 已解码的完整文本
+        self._pending = ""       # 尚未解码的分片尾部（不完整的 HTML 实体）
+        self._start = None       # <decision> 之后的位置
+        self._pos = 0            # 扫描位置
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self._obj_start = None
+        self.done = False
+        self.decisions: list[dict] = []
+
+    def feed(self, chunk: str) -> list[dict]:
+        """追加一段增量文本，返回本次新解析出的决策"""
+        raw = self._pending + chunk
+        m = _PARTIAL_ENTITY.search(raw)
+        if m:
+            raw, self._pending = raw[:m.start()], raw[m.start():]
+        else:
+            self._pending = ""
+        self.text += html.unescape(raw)
+        return self._scan()
+
+    def close(self) -> list[dict]:
+        """流结束：冲掉残留分片"""
+        if self._pending:
+            self.text += html.unescape(self._pending)
+            self._pending = ""
+        return self._scan()
+
+    def _scan(self) -> list[dict]:
+        if self.done:
+            return []
+        if self._start is None:
+            m = _OPEN.search(self.text, max(0, self._pos - len("<decision>")))
+            if not m:
+                self._pos = len(self.text)
+                return []
+            self._start = self._pos = m.end()
+
+        out = []
+        text = self.text
+        i = self._pos
+        while i < len(text):
+            c = text[i]
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_str = False
+            elif c == '"':
+                self._in_str = True
+            elif c == "{":
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif c == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    decision = self._decode(text[self._obj_start:i + 1])
+                    if decision is not None:
+                        out.append(decision)
+                    self._obj_start = None
+            elif c == "<" and self._depth == 0:
+                tail = text[i:i + len(_CLOSE)].lower()
+                if tail == _CLOSE:
+                    self.done = True
+                    break
+                if _CLOSE.startswith(tail):
+                    break  # 被分片截断的 </decision>，等下一个分片
+            i += 1
+        self._pos = i
+        self.decisions.extend(out)
+        return out
+
+    @staticmethod
+    def _decode(block: str) -> dict | None:
+        try:
+            obj = json.loads(block)
+        except Exception as e:
+            logging.warning(f"⚠️ 流式决策 JSON 解析失败: {e}")
+            return None
+        if isinstance(obj, dict) and "action" in obj and obj.get("symbol"):
+            return obj
+        return None
+
+
+async def iter_sse_content(resp):
+    """aiohttp 响应 → (增量文本, finish_reason) 序列"""
+    async for raw in resp.content:
+        line = raw.decode("utf-8", errors="replace").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except Exception:
+            continue
+        choice = (event.get("choices") or [{}])[0]
+        delta = (choice.get("delta") or {}).get("content") or ""
+        yield delta, choice.get("finish_reason")
@@ -7,11 +7,17 @@ from decimal import Decimal
 import time
 import re
 from concurrent.futures import ThreadPoolExecutor
-from config import CLAUDE_API_KEY, CLAUDE_MODEL, CLAUDE_URL, AI_PROVIDER, timeframes
+from config import AI_PROVIDER, timeframes, REFEREE_GATE_COMPRESSED_PER_BATCH, LLM_STREAM_ENABLED
+from config import LLM_BATCH_ADAPTIVE, LLM_BATCH_MAX_SYMBOLS, LLM_ROUND_DEADLINE_SEC
 from database import redis_client
 from volume_stats import get_open_interest, get_funding_rate, get_24hr_change
 from account_positions import account_snapshot, tp_sl_cache
 from trend_alignment import calculate_trend_alignment
+from referee_gate import gate_dataset, record as record_gate, estimate_tokens
+from batch_planner import BATCH_PLANNER
+from llm_executor import LLM_EXECUTOR, RoundBudget, AttemptError
+from llm_router import LLM_ROUTER
+from decision_stream import DecisionStreamParser, iter_sse_content
 
 _preload_executor = ThreadPoolExecutor(max_workers=12)
 
@@ -305,10 +311,10 @@ def merge_llm_responses(batch_results: list):
     }
 
 # ================== 持仓拆分 ==================
-def split_positions_batch(account, dataset_all, max_symbols=5):
+def split_positions_batch(account, dataset_all, max_symbols=5, planner=None):
     """
     拆分持仓批次，每个批次只包含一部分持仓币种 + positions + balance_info
-    支持部分币种缺失数据
+    支持部分币种缺失数据；传 planner 时按 token 预算装箱（每批最多 max_symbols 个）
     """
     positions = account.get("positions", [])
     if not positions:
@@ -335,9 +341,13 @@ def split_positions_batch(account, dataset_all, max_symbols=5):
         print("⚠️ 所有持仓币种数据缺失，跳过持仓拆分")
         return []
 
+    if planner is not None:
+        groups = planner.plan(symbol_data, max_symbols)
+    else:
+        groups = [symbols[i:i + max_symbols] for i in range(0, len(symbols), max_symbols)]
+
     batches = []
-    for i in range(0, len(symbols), max_symbols):
-        batch_symbols = symbols[i:i+max_symbols]
+    for batch_symbols in groups:
         batch = {"positions": positions, "balance_info": balance_info}
         for s in batch_symbols:
             batch[s] = symbol_data[s]
@@ -347,10 +357,28 @@ def split_positions_batch(account, dataset_all, max_symbols=5):
     return batches
 
 # ================== 批次拆分 ==================
-def split_dataset_by_symbol_limit(dataset: dict, max_symbols=5):
+def fold_compressed(batches: list[dict], compressed: dict, per_batch=REFEREE_GATE_COMPRESSED_PER_BATCH) -> int:
+    """
+    裁判压缩的币种（只带裁判结论，几十个 token）轮流附到已有批次里，不单独占一次 LLM 往返；
+    每批最多附 per_batch 个，没有可附的批次就不投喂。返回附上的个数
+    """
+    if not batches:
+        return 0
+    items = list(compressed.items())[:per_batch * len(batches)]
+    for i, (symbol, data) in enumerate(items):
+        batches[i % len(batches)][symbol] = data
+    return len(items)
+
+
+def is_vetoed(sig: dict, compressed) -> bool:
+    """裁判判了 NO_TRADE（压缩投喂）的币种：模型给出的交易动作一律不执行，只认 wait / hold"""
+    return sig.get("symbol") in compressed and sig.get("action") not in ("wait", "hold")
+
+
+def split_dataset_by_symbol_limit(dataset: dict, max_symbols=5, planner=None):
     """
     拆分非持仓币种批次，每批最多 max_symbols 个币种
-    支持部分币种缺少数据
+    支持部分币种缺少数据；传 planner 时按 token 预算装箱
     """
     batches = []
 
@@ -364,9 +392,13 @@ def split_dataset_by_symbol_limit(dataset: dict, max_symbols=5):
         print("⚠️ 非持仓币种数据为空，跳过拆分")
         return batches
 
-    for i in range(0, len(items), max_symbols):
-        batch = dict(items[i:i + max_symbols])
-        batches.append(batch)
+    if planner is not None:
+        data = dict(items)
+        batches.extend({k: data[k] for k in group} for group in planner.plan(data, max_symbols))
+    else:
+        for i in range(0, len(items), max_symbols):
+            batch = dict(items[i:i + max_symbols])
+            batches.append(batch)
 
     print(f"✅ 拆分非持仓批次数量: {len(batches)}")
     return batches
@@ -433,13 +465,21 @@ def _build_dataset_json(dataset, preloaded=None):
         
         for interval in cycles.keys():
             data = cycles[interval]
+            if interval == "referee":  # 裁判过滤压缩后的币种：只带裁判结论
+                market_data["referee"] = data
+                continue
             ind = data.get("indicators") or {}
-            market_data["timeframes"][interval] = {
-                "indicators": {
+            indicators = {
+                k: round(v, 6) if isinstance(v, float) else v
+                for k, v in ind.items()
+            }
+            # 注册表特征是嵌套字典，同样保留 6 位（字段说明见 prompt.txt）
+            if isinstance(ind.get("features"), dict):
+                indicators["features"] = {
                     k: round(v, 6) if isinstance(v, float) else v
-                    for k, v in ind.items()
+                    for k, v in ind["features"].items()
                 }
-            }
+            market_data["timeframes"][interval] = {"indicators": indicators}
 
         output["markets"][symbol] = market_data
     
@@ -467,9 +507,45 @@ Please strictly follow the [System Instructions] to complete the multi-timeframe
 """.strip()
 
 # ================== AIBTC.VIP 批量投喂 ==================
-async def _push_single_batch_claude(dataset, preloaded, batch_idx, total_batches):
+async def _read_stream(resp, batch_idx, attempt_start, on_decision=None, progress=None):
+    """消费 SSE 流：拼出完整文本，每解析出一条决策立即回调 on_decision；progress 记录首 token 耗时"""
+    parser = DecisionStreamParser()
+    parts = []
+    finish_reason = None
+    first_decision_ms = None
+    first_token_ms = None
+
+    def emit(decisions):
+        nonlocal first_decision_ms
+        for d in decisions:
+            if first_decision_ms is None:
+                first_decision_ms = round((time.perf_counter() - attempt_start) * 1000, 2)
+                print(f"⚡ 批次 {batch_idx} 首条决策 {d.get('symbol')} {d.get('action')} | {first_decision_ms}ms")
+            if on_decision is not None:
+                try:
+                    on_decision(d)
+                except Exception as e:
+                    logging.warning(f"⚠️ 决策提前分发失败 {d.get('symbol')}: {e}")
+
+    async for delta, reason in iter_sse_content(resp):
+        if delta:
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - attempt_start) * 1000, 2)
+                if progress is not None:
+                    progress["first_token_ms"] = first_token_ms
+            parts.append(delta)
+            emit(parser.feed(delta))
+        if reason:
+            finish_reason = reason
+    emit(parser.close())
+    return "".join(parts), finish_reason, first_decision_ms, first_token_ms
+
+async def _push_single_batch_claude(dataset, preloaded, batch_idx, total_batches, on_decision=None, budget=None):
     """
     使用 AIBTC.VIP 模型进行批次投喂，兼容 Unicode/HTML 转义，保证 signals 完整
+    LLM_STREAM_ENABLED 时走 SSE 流式：<decision> 里每条决策一解析完就交给 on_decision（可提前下单）
+    请求经 LLM_EXECUTOR：本轮截止时间内重试（共享 budget 额度），超过 p90 未返回时发对冲请求
+    每次尝试由 LLM_ROUTER 选端点（对冲 / 重试优先换一个端点），结果回灌端点的延迟 / 吞吐 / 失败率
     """
     loop = asyncio.get_running_loop()
     json_data = await loop.run_in_executor(None, _build_dataset_json, dataset, preloaded)
@@ -477,31 +553,36 @@ async def _push_single_batch_claude(dataset, preloaded, batch_idx, total_batches
     system_prompt = await loop.run_in_executor(None, _read_prompt)
 
     payload = {
-        "model": CLAUDE_MODEL,
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ],
         "temperature": 0,
         "max_tokens": 8000,
-        "stream": False
+        "stream": LLM_STREAM_ENABLED
     }
 
-    max_retries = 3
-    base_timeout = 15  # 超时基准秒数
+    if budget is None:
+        budget = RoundBudget(LLM_ROUND_DEADLINE_SEC)
 
-    for attempt in range(max_retries):
-        attempt_start = time.perf_counter()
-        current_timeout = base_timeout * (attempt + 1)
+    used_endpoints = set()
 
+    async def attempt(rec, timeout_sec, emit):
+        """单次请求：成功返回 (HTTP 状态, 原始文本, 首条决策耗时)，失败抛 AttemptError"""
+        attempt_start = time.perf_counter()
+        ep = LLM_ROUTER.pick(exclude=used_endpoints)
+        used_endpoints.add(ep.name)
+        rec["endpoint"] = ep.name
+        tag = ("对冲" if rec["hedge"] else f"第{rec['attempt']}次") + f"@{ep.name}"
+        progress = {"first_token_ms": None}
         try:
             session = await get_http_session()
 
             async with session.post(
-                CLAUDE_URL,
-                json=payload,
-                headers={"Authorization": f"Bearer {CLAUDE_API_KEY}"},
-                timeout=aiohttp.ClientTimeout(total=current_timeout)
+                ep.url,
+                json={**payload, "model": ep.model},
+                headers={"Authorization": f"Bearer {ep.api_key}"},
+                timeout=aiohttp.ClientTimeout(total=timeout_sec)
             ) as resp:
 
                 status = resp.status
@@ -509,117 +590,118 @@ async def _push_single_batch_claude(dataset, preloaded, batch_idx, total_batches
                 if status != 200:
                     raise aiohttp.ClientError(f"HTTP {status}")
 
-                raw_text = await resp.text()
-                attempt_time = round((time.perf_counter() - attempt_start) * 1000, 2)
-
-                print(
-                    f"✅ AIBTC.VIP 批次 {batch_idx} 第{attempt+1}次返回 | "
-                    f"{attempt_time}ms | HTTP {status}"
-                )
-
-                content = None
-                reasoning = None
-                signals = []
-                raw_json = None
-                finish_reason = None
-
-                try:
-                    raw_json = json.loads(raw_text)
-                    choice = raw_json.get("choices", [{}])[0]
-                    content = choice.get("message", {}).get("content")
-                    finish_reason = choice.get("finish_reason")
-                    reasoning = _extract_reasoning_block(content)
-
-                    if content:
-                        from html import unescape
-                        content_decoded = unescape(content)
-                        signals = _extract_all_json(content_decoded) or []
-
-                except Exception as parse_err:
-                    logging.warning(f"⚠️ AIBTC.VIP JSON 解析失败: {parse_err}")
-
-                return {
-                    "batch_idx": batch_idx,
-                    "formatted_request": user_prompt,  # ⭐ 已安全序列化
-                    "content": content,
-                    "reasoning": reasoning,
-                    "signals": signals,
-                    "raw_text": raw_text,
-                    "raw_json": raw_json,
-                    "finish_reason": finish_reason,
-                    "http_status": status,
-                    "ts": time.time(),
-                    "attempt": attempt + 1,
-                    "response_time_ms": attempt_time
-                }
+                first_decision_ms = None
+                first_token_ms = 0.0
+                if LLM_STREAM_ENABLED:
+                    streamed, stream_finish, first_decision_ms, first_token_ms = await _read_stream(
+                        resp, batch_idx, attempt_start, emit, progress
+                    )
+                    out_tokens = estimate_tokens(streamed)
+                    # 与非流式响应同形，后面统一解析
+                    raw_text = json.dumps({
+                        "stream": True,
+                        "choices": [{"message": {"content": streamed}, "finish_reason": stream_finish}],
+                    }, ensure_ascii=False)
+                else:
+                    raw_text = await resp.text()
+                    out_tokens = estimate_tokens(raw_text)
+
+                latency_ms = round((time.perf_counter() - attempt_start) * 1000, 2)
+                LLM_ROUTER.success(ep, latency_ms, first_token_ms or 0.0, out_tokens)
+                print(f"✅ AIBTC.VIP 批次 {batch_idx} {tag}返回 | {latency_ms}ms | HTTP {status}")
+                return status, raw_text, first_decision_ms
+
+        except asyncio.CancelledError:
+            # 对冲输掉 / 截止时间到：删失样本，让路由知道这个端点至少这么慢
+            LLM_ROUTER.cancelled(ep, round((time.perf_counter() - attempt_start) * 1000, 2), progress["first_token_ms"])
+            raise
 
         except asyncio.TimeoutError:
-            attempt_time = round((time.perf_counter() - attempt_start) * 1000, 2)
-            print(f"⏱️ AIBTC.VIP 批次 {batch_idx} 第{attempt+1}次超时 ({attempt_time}ms)")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2 * (attempt + 1))
-                continue
-            else:
-                return {
-                    "batch_idx": batch_idx,
-                    "formatted_request": user_prompt,
-                    "signals": [],
-                    "raw_text": None,
-                    "raw_json": None,
-                    "finish_reason": None,
-                    "http_status": None,
-                    "error": f"批次 {batch_idx} 在{max_retries}次尝试后超时",
-                    "ts": time.time(),
-                    "attempt": max_retries,
-                    "response_time_ms": attempt_time
-                }
+            print(f"⏱️ AIBTC.VIP 批次 {batch_idx} {tag}超时 ({round((time.perf_counter() - attempt_start) * 1000, 2)}ms)")
+            LLM_ROUTER.failure(ep, "超时")
+            raise AttemptError(f"批次 {batch_idx} 超时", timeout=True)
 
         except aiohttp.ClientError as e:
-            attempt_time = round((time.perf_counter() - attempt_start) * 1000, 2)
-            print(f"🌐 Claude 批次 {batch_idx} 第{attempt+1}次网络错误: {e}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(3 * (attempt + 1))
-                continue
-            else:
-                return {
-                    "batch_idx": batch_idx,
-                    "formatted_request": user_prompt,
-                    "signals": [],
-                    "raw_text": None,
-                    "raw_json": None,
-                    "finish_reason": None,
-                    "http_status": None,
-                    "error": f"批次 {batch_idx} 网络错误: {e}",
-                    "ts": time.time(),
-                    "attempt": max_retries,
-                    "response_time_ms": attempt_time
-                }
+            print(f"🌐 Claude 批次 {batch_idx} {tag}网络错误: {e}")
+            LLM_ROUTER.failure(ep, str(e))
+            raise AttemptError(f"批次 {batch_idx} 网络错误: {e}")
 
         except Exception as e:
-            attempt_time = round((time.perf_counter() - attempt_start) * 1000, 2)
-            error_msg = f"批次 {batch_idx} 未知错误: {e}"
-            print(f"❌ {error_msg}")
+            print(f"❌ 批次 {batch_idx} {tag}未知错误: {e}")
+            LLM_ROUTER.failure(ep, str(e))
+            raise AttemptError(f"批次 {batch_idx} 未知错误: {e}")
+
+        finally:
+            LLM_ROUTER.release(ep)
+
+    batch_start = time.perf_counter()
+    won, err, attempts = await LLM_EXECUTOR.run(attempt, budget, batch_idx, on_decision)
+    total_ms = round((time.perf_counter() - batch_start) * 1000, 2)
+    winner = next((a for a in attempts if a["outcome"] == "ok"), None)
+
+    if won is None:
+        error_msg = str(err) if err else f"批次 {batch_idx} 无可用尝试"
+        if getattr(err, "timeout", False):
+            error_msg = f"{error_msg}（{len(attempts)} 次尝试后超时）"
+        return {
+            "batch_idx": batch_idx,
+            "formatted_request": user_prompt,
+            "signals": [],
+            "raw_text": None,
+            "raw_json": None,
+            "finish_reason": None,
+            "http_status": None,
+            "error": error_msg,
+            "ts": time.time(),
+            "attempt": len(attempts),
+            "attempts": attempts,
+            "response_time_ms": total_ms
+        }
 
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2 * (attempt + 1))
-                continue
-            else:
-                return {
-                    "batch_idx": batch_idx,
-                    "formatted_request": user_prompt,
-                    "signals": [],
-                    "raw_text": None,
-                    "raw_json": None,
-                    "finish_reason": None,
-                    "http_status": None,
-                    "error": error_msg,
-                    "ts": time.time(),
-                    "attempt": max_retries,
-                    "response_time_ms": attempt_time
-                }
+    status, raw_text, first_decision_ms = won
+
+    content = None
+    reasoning = None
+    signals = []
+    raw_json = None
+    finish_reason = None
+
+    try:
+        raw_json = json.loads(raw_text)
+        choice = raw_json.get("choices", [{}])[0]
+        content = choice.get("message", {}).get("content")
+        finish_reason = choice.get("finish_reason")
+        reasoning = _extract_reasoning_block(content)
+
+        if content:
+            from html import unescape
+            content_decoded = unescape(content)
+            signals = _extract_all_json(content_decoded) or []
+
+    except Exception as parse_err:
+        logging.warning(f"⚠️ AIBTC.VIP JSON 解析失败: {parse_err}")
+
+    return {
+        "batch_idx": batch_idx,
+        "formatted_request": user_prompt,  # ⭐ 已安全序列化
+        "content": content,
+        "reasoning": reasoning,
+        "signals": signals,
+        "raw_text": raw_text,
+        "raw_json": raw_json,
+        "finish_reason": finish_reason,
+        "http_status": status,
+        "ts": time.time(),
+        "attempt": winner["attempt"],
+        "attempts": attempts,
+        "hedged": winner["hedge"],
+        "response_time_ms": winner["ms"],
+        "total_time_ms": total_ms,
+        "first_decision_ms": first_decision_ms
+    }
 
 # ================== 通用批量投喂 ==================
-async def push_batch_to_ai():
+async def push_batch_to_ai(mode: str = "scan", on_decision=None):
     if not _is_ready_for_push():
         return None
 
@@ -631,18 +713,44 @@ async def push_batch_to_ai():
 
     account = account_snapshot
 
+    # 自适应分批：按 token 预算装箱；关闭时固定每批 5 个
+    planner = BATCH_PLANNER if LLM_BATCH_ADAPTIVE else None
+    max_symbols = LLM_BATCH_MAX_SYMBOLS if planner else 5
+
     # --- 1. 拆分持仓批次 ---
-    positions_batches = split_positions_batch(account, dataset_all, max_symbols=5)
+    positions_batches = split_positions_batch(account, dataset_all, max_symbols=max_symbols, planner=planner)
     positions_symbols = [
         p["symbol"] for batch in positions_batches for p in batch.get("positions", [])
     ]
 
-    # --- 2. 拆分非持仓币种 ---
+    # --- 2. 拆分非持仓币种（scan 轮先过裁判：NO_TRADE 丢弃或压缩，持仓币种不过滤） ---
     symbol_dataset = {k: v for k, v in dataset_all.items() if k not in positions_symbols}
-    symbol_batches = split_dataset_by_symbol_limit(symbol_dataset, max_symbols=5)
+    compressed = {}
+    if mode == "scan":
+        held = [p["symbol"] for p in account.get("positions", [])]
+        symbol_dataset, compressed, gate_stats = gate_dataset(symbol_dataset, held)
+        record_gate(gate_stats)
+    symbol_batches = split_dataset_by_symbol_limit(symbol_dataset, max_symbols=max_symbols, planner=planner)
+    if compressed:
+        folded = fold_compressed(symbol_batches or positions_batches, compressed)
+        if folded < len(compressed):
+            print(f"ℹ 裁判压缩币种 {len(compressed) - folded} 个没有可附带的批次，本轮不投喂")
+        if on_decision is not None:
+            dispatch = on_decision
+
+            def on_decision(sig: dict):
+                if not is_vetoed(sig, compressed):
+                    dispatch(sig)
 
     # --- 3. 合并所有批次 ---
     batches = positions_batches + symbol_batches
+    if not batches:
+        print("ℹ 裁判过滤后没有需要投喂的币种，跳过本轮投喂")
+        return None
+    batch_tokens = [
+        sum(estimate_tokens(v) for k, v in batch.items() if k not in ("positions", "balance_info"))
+        for batch in batches
+    ]
 
     # --- 4. 预加载 ---
     preloaded_batches = []
@@ -652,12 +760,15 @@ async def push_batch_to_ai():
         preloaded_batches.append(preloaded)
 
     # --- 5. 创建投喂任务 ---
+    # 截止时间从真正发请求时算起（裁判过滤 / 拆分 / 预加载不占 LLM 的时间）；本轮所有批次共享截止时间与重试额度
+    start_feed = time.perf_counter()
+    budget = RoundBudget(LLM_ROUND_DEADLINE_SEC)
     tasks = []
     for idx, batch in enumerate(batches):
         preloaded = preloaded_batches[idx]
         if AI_PROVIDER == "claude":
             tasks.append(
-                _push_single_batch_claude(batch, preloaded, idx + 1, len(batches))
+                _push_single_batch_claude(batch, preloaded, idx + 1, len(batches), on_decision, budget)
             )
         else:
             raise ValueError(f"未知 AI_PROVIDER: {AI_PROVIDER}")
@@ -671,30 +782,52 @@ async def push_batch_to_ai():
     total_elapsed_time = 0
     success_response_time = 0
 
-    for r in results:
+    for idx, r in enumerate(results):
         if not isinstance(r, dict):
             timeout_count += 1
+            if planner:
+                planner.observe(batch_tokens[idx], None, False, True)
             continue
 
         rt = r.get("response_time_ms", 0)
         total_elapsed_time += rt
 
-        if r.get("http_status") == 200:
+        ok = r.get("http_status") == 200
+        timed_out = "超时" in (r.get("error") or "")
+        if ok:
             success_count += 1
             success_response_time += rt
-        elif "超时" in (r.get("error") or ""):
+        elif timed_out:
             timeout_count += 1
+        if planner:
+            # 成功批次取胜出尝试的耗时；只有真的超时的尝试才算超时（对冲胜出 / 失败后重试成功不算）
+            attempt_timed_out = any(a["outcome"] == "timeout" for a in r.get("attempts", []))
+            planner.observe(batch_tokens[idx], rt if ok else None, ok, timed_out or attempt_timed_out)
 
     valid_results = [r for r in results if isinstance(r, dict)]
     valid_count = len(valid_results)
     overall_avg = total_elapsed_time / valid_count if valid_count else 0
 
+    hedges = sum(1 for r in valid_results for a in r.get("attempts", []) if a["hedge"])
     print(
         f"📊 请求统计: 成功 {success_count}/{valid_count} | "
+        f"对冲 {hedges} | 重试额度 {budget.used}/{budget.retries} | "
         f"超时 {timeout_count} | "
         f"整体平均耗时 {overall_avg:.0f}ms | "
         f"成功平均耗时 {success_response_time / success_count if success_count else 0:.0f}ms"
     )
+    print("🛰 LLM 端点: " + " | ".join(
+        f"{e['name']} {e['state']} {e['latency_ms']}ms 失败率 {e['error']} {e['tps']} tok/s"
+        for e in LLM_ROUTER.summary()
+    ))
+    if planner:
+        plan = planner.end_round(round((time.perf_counter() - start_feed) * 1000, 2))
+        print(
+            f"📦 自适应分批: {len(batches)} 批 | 每批 token {min(batch_tokens)}~{max(batch_tokens)} | "
+            f"p90 {plan['p90_ms']}ms | 超时率 {plan['timeout_rate']} | "
+            f"预算 {plan['target_before']} → {plan['target']}"
+            + (" | ⚠️ 超过截止时间" if plan["over_deadline"] else "")
+        )
 
     # ================== ✅ Redis：单次投喂风格合并 ==================
 
@@ -726,6 +859,12 @@ async def push_batch_to_ai():
     for r in results:
         if isinstance(r, dict):
             all_signals.extend(r.get("signals", []))
+    vetoed = [s for s in all_signals if is_vetoed(s, compressed)]
+    if vetoed:
+        print(f"🧑‍⚖️ 裁判 NO_TRADE 币种的交易动作不执行: {len(vetoed)} 条 | "
+              + ", ".join(f"{s.get('symbol')} {s.get('action')}" for s in vetoed[:5])
+              + (" …" if len(vetoed) > 5 else ""))
+        all_signals = [s for s in all_signals if not is_vetoed(s, compressed)]
 
     end_total = time.perf_counter()
     print(
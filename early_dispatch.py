@@ -0,0 +1,39 @@
+# early_dispatch.py
+"""
+流式投喂的提前下单：每条需执行的决策一解析出来就下单，同一币种一轮只提前下一次
+
+- 拿到批次的尝试中途失败后，重试 / 对冲的尝试可能对同一币种给出不同动作；
+  已提前下单的币种在整轮返回后一律不再下单，动作不同的打印为冲突
+- wants(sig) 与整轮返回后 exec_list 的过滤规则相同；execute(sig) 返回下单协程
+"""
+import time
+import asyncio
+
+
+class EarlyDispatcher:
+    def __init__(self, wants, execute):
+        self.wants = wants
+        self.execute = execute
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.signals: list[dict] = []
+        self.t0 = time.perf_counter()
+
+    def __call__(self, sig: dict):
+        symbol = sig.get("symbol")
+        if symbol in self.tasks or not self.wants(sig):
+            return
+        self.tasks[symbol] = asyncio.create_task(self.execute(sig))
+        self.signals.append(sig)
+        print(f"⚡ 提前下单 {symbol} {sig.get('action')} | 投喂开始后 {round(time.perf_counter() - self.t0, 3)} 秒")
+
+    def remaining(self, exec_list: list[dict]) -> list[dict]:
+        """整轮返回后还需下单的信号：已提前下单的币种跳过"""
+        early = {s.get("symbol"): s.get("action") for s in self.signals}
+        pending = []
+        for sig in exec_list:
+            symbol = sig.get("symbol")
+            if symbol not in early:
+                pending.append(sig)
+            elif sig.get("action") != early[symbol]:
+                print(f"⚠️ {symbol} 最终决策 {sig.get('action')} 与已提前下单的 {early[symbol]} 冲突，不再下单")
+        return pending
@@ -0,0 +1,63 @@
+# fetch_planner.py
+"""
+K线收盘感知的拉取/计算规划器
+
+每轮根据各周期的收盘时刻判断哪些 (symbol, interval) 真的有新收盘K线：
+  - fetch_pairs：K线存储里缺最新已收盘K线的组合 → 需要同步
+  - compute_pairs：存储最后一根比上次算指标时更新的组合 → 需要重算
+    （4h/1h 变化时 15m 也要重算：15m signal 依赖 4h 快照，unified payload 带 1h）
+其余组合直接复用上一轮的指标快照。
+"""
+import time
+from kline_store import KLINE_STORE
+from kline_fetcher import INTERVAL_MS
+
+# 周期 → 依赖它的周期
+TF_DEPENDENTS = {
+    "4h": ["15m"],
+    "1h": ["15m"],
+}
+
+
+def latest_closed_open_ts(interval: str, now_ms: int) -> int:
+    """now 时刻最近一根已收盘K线的开盘时间"""
+    step = INTERVAL_MS[interval]
+    return now_ms // step * step - step
+
+
+class FetchPlanner:
+    def __init__(self):
+        # (symbol, interval) -> 上次算指标时用到的最后一根K线时间戳
+        self._computed: dict[tuple[str, str], int] = {}
+
+    def fetch_pairs(self, symbols, intervals, now_ms: int | None = None) -> list[tuple[str, str]]:
+        now_ms = now_ms or int(time.time() * 1000)
+        out = []
+        for s in symbols:
+            for tf in intervals:
+                last = KLINE_STORE.last_ts(s, tf)
+                if last is None or last < latest_closed_open_ts(tf, now_ms):
+                    out.append((s, tf))
+        return out
+
+    def compute_pairs(self, symbols, intervals) -> set[tuple[str, str]]:
+        out = set()
+        for s in symbols:
+            for tf in intervals:
+                last = KLINE_STORE.last_ts(s, tf)
+                if last is None or self._computed.get((s, tf)) != last:
+                    out.add((s, tf))
+                    for dep in TF_DEPENDENTS.get(tf, ()):
+                        if dep in intervals:
+                            out.add((s, dep))
+        return out
+
+    def mark_computed(self, symbol: str, interval: str, last_ts: int):
+        self._computed[(symbol, interval)] = last_ts
+
+    def forget_symbol(self, symbol: str):
+        for key in [k for k in self._computed if k[0] == symbol]:
+            self._computed.pop(key, None)
+
+
+PLANNER = FetchPlanner()
@@ -0,0 +1,223 @@
+# indicator_registry.py
+"""
+可插拔的向量化指标注册表：同一周期、同样根数的币种堆成 (N, S) 矩阵，所有注册指标一次算完
+
+- 每个指标声明：输入列（Bars 字段名）、最少根数 lookback、输出字段，计算函数只做矩阵运算，
+  返回 {字段: (S,) 数组}；根数不足 lookback 的组该指标输出 None
+- 共享中间量（成交量差、典型价、收盘差分…）用 @shared 注册，同一组内只算一次
+- 新增指标 = 写一个 @register 函数，不改 calculate_signal，也不新增逐币种循环
+- 每个指标的累计耗时记在 TIMINGS，take_timings() 按轮取出并清零
+
+首批：CVD（主动买卖量差累计）、主动买入占比、RSI（同 talib，Wilder 平滑）、VWAP
+"""
+import math
+import time
+import numpy as np
+from bars import Bars, FIELDS
+from kline_store import KLINE_STORE
+
+MIN_BARS = 5  # 与 calculate_signal 一致
+
+
+class Indicator:
+    __slots__ = ("name", "inputs", "lookback", "outputs", "fn")
+
+    def __init__(self, name: str, inputs: tuple, lookback: int, outputs: tuple, fn):
+        self.name = name
+        self.inputs = inputs
+        self.lookback = lookback
+        self.outputs = outputs
+        self.fn = fn
+
+
+REGISTRY: dict[str, Indicator] = {}
+_SHARED: dict[str, tuple[tuple, callable]] = {}
+
+# 指标名 -> [调用次数, 累计秒数]
+TIMINGS: dict[str, list] = {}
+
+
+def register(name: str, inputs: tuple, lookback: int, outputs: tuple):
+    def deco(fn):
+        REGISTRY[name] = Indicator(name, inputs, lookback, outputs, fn)
+        return fn
+    return deco
+
+
+def shared(name: str, inputs: tuple):
+    def deco(fn):
+        _SHARED[name] = (inputs, fn)
+        return fn
+    return deco
+
+
+class _Context:
+    """一组币种的输入矩阵 + 按需计算、组内共享的中间量"""
+
+    def __init__(self, cols: dict[str, np.ndarray]):
+        self._cache = dict(cols)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        v = self._cache.get(name)
+        if v is None:
+            v = self._cache[name] = _SHARED[name][1](self)
+        return v
+
+
+def _inputs_of(names) -> set[str]:
+    """指标 / 共享中间量递归展开成原始列"""
+    out = set()
+    for name in names:
+        if name in _SHARED:
+            out |= _inputs_of(_SHARED[name][0])
+        else:
+            out.add(name)
+    return out
+
+
+# ==========================================================
+# 共享中间量
+# ==========================================================
+@shared("delta", ("volume", "taker_buy_volume"))
+def _delta(ctx):
+    """主动买 - 主动卖 = 2 * taker_buy - volume"""
+    return 2.0 * ctx["taker_buy_volume"] - ctx["volume"]
+
+
+@shared("typical", ("high", "low", "close"))
+def _typical(ctx):
+    return (ctx["high"] + ctx["low"] + ctx["close"]) / 3.0
+
+
+@shared("close_diff", ("close",))
+def _close_diff(ctx):
+    return np.diff(ctx["close"], axis=0)
+
+
+def _window_sum(x: np.ndarray, n: int) -> np.ndarray:
+    """最后 n 行按列求和（转成每币种一行再求和，求和顺序与逐币种相同）"""
+    return np.ascontiguousarray(x[-n:].T).sum(axis=1)
+
+
+# ==========================================================
+# 指标
+# ==========================================================
+CVD_WINDOW = 20
+TAKER_WINDOW = 20
+RSI_PERIOD = 14
+VWAP_WINDOW = 20
+
+
+@register("cvd", ("delta",), CVD_WINDOW, ("cvd_20",))
+def _cvd(ctx):
+    return {"cvd_20": _window_sum(ctx["delta"], CVD_WINDOW)}
+
+
+@register("taker_buy_ratio", ("volume", "taker_buy_volume"), TAKER_WINDOW, ("taker_buy_ratio_20",))
+def _taker_buy_ratio(ctx):
+    vol = _window_sum(ctx["volume"], TAKER_WINDOW)
+    buy = _window_sum(ctx["taker_buy_volume"], TAKER_WINDOW)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"taker_buy_ratio_20": np.where(vol > 0, buy / vol, np.nan)}
+
+
+@register("rsi", ("close_diff",), RSI_PERIOD + 1, ("rsi_14",))
+def _rsi(ctx):
+    """同 talib.RSI：前 p 个涨跌幅的均值作种子，之后 Wilder 平滑 avg = (avg * (p - 1) + x) / p"""
+    d = ctx["close_diff"]
+    p = RSI_PERIOD
+    gain = np.maximum(d, 0.0)
+    loss = np.maximum(-d, 0.0)
+    avg_gain = gain[:p].sum(axis=0) / p
+    avg_loss = loss[:p].sum(axis=0) / p
+    for i in range(p, len(d)):
+        avg_gain = (avg_gain * (p - 1) + gain[i]) / p
+        avg_loss = (avg_loss * (p - 1) + loss[i]) / p
+    total = avg_gain + avg_loss
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"rsi_14": np.where(total != 0, 100.0 * avg_gain / total, 0.0)}
+
+
+@register("vwap", ("typical", "volume", "close"), VWAP_WINDOW, ("vwap_20", "close_vs_vwap_20"))
+def _vwap(ctx):
+    vol = _window_sum(ctx["volume"], VWAP_WINDOW)
+    pv = _window_sum(ctx["typical"] * ctx["volume"], VWAP_WINDOW)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vwap = np.where(vol > 0, pv / vol, np.nan)
+        dev = ctx["close"][-1] / vwap - 1.0
+    return {"vwap_20": vwap, "close_vs_vwap_20": dev}
+
+
+# ==========================================================
+# 引擎
+# ==========================================================
+def compute_group(cols: dict[str, np.ndarray]) -> list[dict]:
+    """cols：{Bars 字段名: (N, S) 矩阵} → 每个币种一份 {输出字段: float | None}"""
+    n, s = next(iter(cols.values())).shape
+    ctx = _Context(cols)
+    fields: dict[str, list] = {}
+    for ind in REGISTRY.values():
+        if n < ind.lookback:
+            for f in ind.outputs:
+                fields[f] = [None] * s
+            continue
+        t0 = time.perf_counter()
+        out = ind.fn(ctx)
+        for f in ind.outputs:
+            fields[f] = [x if math.isfinite(x) else None for x in out[f].tolist()]
+        stat = TIMINGS.setdefault(ind.name, [0, 0.0])
+        stat[0] += 1
+        stat[1] += time.perf_counter() - t0
+    return [{f: v[i] for f, v in fields.items()} for i in range(s)]
+
+
+def _needed_columns() -> list[str]:
+    return sorted(_inputs_of(name for ind in REGISTRY.values() for name in ind.inputs))
+
+
+def compute_features(symbols, interval: str) -> dict[str, dict]:
+    """单周期：从K线存储取全部币种，按根数分组后一次算完全部注册指标"""
+    groups: dict[int, tuple[list[str], list[np.ndarray]]] = {}
+    for sym in symbols:
+        v = KLINE_STORE.view(sym, interval)
+        if len(v) < MIN_BARS:
+            continue
+        syms, views = groups.setdefault(len(v), ([], []))
+        syms.append(sym)
+        views.append(v)
+
+    columns = _needed_columns()
+    out = {}
+    for syms, views in groups.values():
+        cols = {c: np.stack([v[FIELDS[c]] for v in views], axis=1) for c in columns}
+        out.update(zip(syms, compute_group(cols)))
+    return out
+
+
+def compute_feature_pairs(pairs) -> dict[tuple[str, str], dict]:
+    """(symbol, interval) 集合 → {(symbol, interval): 特征}"""
+    by_tf: dict[str, list[str]] = {}
+    for sym, tf in pairs:
+        by_tf.setdefault(tf, []).append(sym)
+
+    out = {}
+    for tf, syms in by_tf.items():
+        for sym, res in compute_features(syms, tf).items():
+            out[(sym, tf)] = res
+    return out
+
+
+def compute_bars_features(rows: Bars) -> dict:
+    """单个窗口（串行 / 独立调用时的回退）"""
+    cols = {c: getattr(rows, c)[:, None] for c in _needed_columns()}
+    return compute_group(cols)[0]
+
+
+def take_timings() -> dict[str, dict]:
+    """返回本轮各指标耗时并清零"""
+    out = {
+        name: {"calls": calls, "total_ms": round(sec * 1000, 3), "avg_ms": round(sec * 1000 / calls, 3)}
+        for name, (calls, sec) in TIMINGS.items() if calls
+    }
+    TIMINGS.clear()
+    return out
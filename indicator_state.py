@@ -0,0 +1,225 @@
+# indicator_state.py
+"""
+EMA / ATR 增量状态：每根新收盘K线 O(1) 更新，冷启动 / 缺口时才按历史重建
+
+talib 在固定长度窗口上计算，种子是“窗口内前 p 个值的 SMA”，窗口每滑动一根种子就变。
+把窗口内任一位置 u 的平滑值拆成两部分：
+    E_u = a^(u - seed_pos) * S + V_u
+    S   ：窗口前 p 个值的均值（每次直接用窗口前 p 个值算，O(p)）
+    V_u ：Σ k * a^(u - i) * y_i，i 从 seed_pos + 1 到 u
+新K线到来：V = a * V + k * y；窗口左端滑出一根：从保留的 V 中减去 y[seed_pos + 1] 那一项。
+两步都只碰常数个值，结果与 talib 在同一窗口上的输出一致到浮点舍入误差。
+
+- EMA：y = close，k = 2 / (p + 1)，只保留最后 1 个 V
+- ATR：y = TR（窗口第 0 根不计），k = 1 / p，保留最后 20 个 V（atr_ma20 用）
+- 状态按 (symbol, interval) 保存，并以 JSON 写入 Redis hash 作为重启检查点
+"""
+import json
+import logging
+import numpy as np
+from config import EMA_CONFIG
+from database import redis_client
+from kline_codec import INTERVAL_MS
+from kline_store import KLINE_STORE
+
+STATE_KEY = "indicator_state"
+
+ATR_PERIOD = 14
+ATR_MA_WINDOW = 20
+# ATR 需要窗口里至少有 20 个有效值才走增量（更短的窗口交给批量/talib）
+MIN_BARS = 1 + ATR_PERIOD + ATR_MA_WINDOW - 1
+
+
+class _Smooth:
+    """窗口内指数平滑（EMA / Wilder 共用）：只保存最后 keep 个位置的 V 值"""
+    __slots__ = ("p", "k", "a", "keep", "v")
+
+    def __init__(self, p: int, k: float, keep: int, v: list[float] | None = None):
+        self.p = p
+        self.k = k
+        self.a = 1.0 - k
+        self.keep = keep
+        self.v = v
+
+    def rebuild(self, y, y0: int, n: int):
+        """y(lo, hi) → 位置 [lo, hi) 的值列表；y0：窗口内第一个有效值的位置；n：窗口根数"""
+        a, k = self.a, self.k
+        v = 0.0
+        vals = [v]
+        for x in y(y0 + self.p, n):
+            v = a * v + k * x
+            vals.append(v)
+        self.v = vals[-self.keep:]
+
+    def advance(self, y, y0: int, n: int, n_app: int, n_slide: int):
+        """窗口追加 n_app 根、左端滑出 n_slide 根（位置均按新窗口计）"""
+        a, k, p, keep = self.a, self.k, self.p, self.keep
+        v = self.v
+        for x in y(n - n_app, n):
+            v.append(a * v[-1] + k * x)
+        v = v[-keep:]
+
+        # 旧窗口 seed_pos + 1 起依次滑出的项：从包含它的 V 中减掉
+        base = n - keep
+        lo = y0 - n_slide + p
+        for r, x in zip(range(lo, y0 + p), y(lo, y0 + p)):
+            w = k * x
+            for i in range(max(r - base, 0), keep):
+                v[i] -= w * a ** (base + i - r)
+        self.v = v
+
+    def values(self, y, y0: int, n: int) -> list[float]:
+        """最后 keep 个位置的平滑值"""
+        seed = sum(y(y0, y0 + self.p)) / self.p
+        e0 = n - self.keep - (y0 + self.p - 1)
+        return [self.a ** (e0 + i) * seed + vi for i, vi in enumerate(self.v)]
+
+
+class IndicatorState:
+    def __init__(self):
+        # (symbol, interval) -> {"first": ts, "last": ts, "ema": {p: _Smooth}, "atr": _Smooth}
+        self._states: dict[tuple[str, str], dict] = {}
+        self._dirty: set[tuple[str, str]] = set()
+
+    # ==========================================================
+    # 检查点
+    # ==========================================================
+    def _load(self, symbol: str, interval: str) -> dict | None:
+        try:
+            raw = redis_client.hget(STATE_KEY, f"{symbol}:{interval}")
+        except Exception:
+            return None
+        if not raw:
+            return None
+        d = json.loads(raw)
+        return {
+            "first": d["first"],
+            "last": d["last"],
+            "ema": {int(p): _Smooth(int(p), 2.0 / (int(p) + 1), 1, v) for p, v in d["ema"].items()},
+            "atr": _Smooth(ATR_PERIOD, 1.0 / ATR_PERIOD, ATR_MA_WINDOW, d["atr"]),
+        }
+
+    def checkpoint(self):
+        """把本轮更新过的状态写入 Redis hash（一次 pipeline）"""
+        if not self._dirty:
+            return
+        pipe = redis_client.pipeline()
+        for symbol, interval in self._dirty:
+            st = self._states.get((symbol, interval))
+            if st is None:
+                continue
+            pipe.hset(STATE_KEY, f"{symbol}:{interval}", json.dumps({
+                "first": st["first"],
+                "last": st["last"],
+                "ema": {str(p): s.v for p, s in st["ema"].items()},
+                "atr": st["atr"].v,
+            }))
+        try:
+            pipe.execute()
+        except Exception as e:
+            logging.warning(f"指标状态检查点写入失败: {e}")
+            return
+        self._dirty.clear()
+
+    def forget_symbol(self, symbol: str):
+        for key in [k for k in self._states if k[0] == symbol]:
+            self._states.pop(key, None)
+            self._dirty.discard(key)
+        try:
+            redis_client.hdel(STATE_KEY, *[f"{symbol}:{tf}" for tf in INTERVAL_MS])
+        except Exception:
+            pass
+
+    # ==========================================================
+    # 计算
+    # ==========================================================
+    def compute(self, symbol: str, interval: str) -> dict | None:
+        """
+        返回与 batch_indicators 相同字段（close / ema / atr / atr_ma20 / atr_ratio）；
+        窗口不足 MIN_BARS 根返回 None，由调用方回退。
+        """
+        rows = KLINE_STORE.view(symbol, interval)
+        n = len(rows)
+        step = INTERVAL_MS.get(interval)
+        if n < MIN_BARS or step is None:
+            return None
+
+        closes = rows["Close"]
+        highs = rows["High"]
+        lows = rows["Low"]
+
+        def y_close(lo, hi):
+            return closes[lo:hi].tolist()
+
+        def y_tr(lo, hi):
+            h, l, pc = highs[lo:hi], lows[lo:hi], closes[lo - 1:hi - 1]
+            return np.maximum(np.maximum(h - l, np.abs(h - pc)), np.abs(l - pc)).tolist()
+
+        ts = rows["Timestamp"]
+        first, last = int(ts[0]), int(ts[-1])
+        contiguous = last - first == (n - 1) * step
+        periods = [p for p in EMA_CONFIG.get(interval, []) if p <= n]
+
+        key = (symbol, interval)
+        st = self._states.get(key) or self._load(symbol, interval)
+
+        n_app = n_slide = -1
+        if st is not None:
+            n_app, r1 = divmod(last - st["last"], step)
+            n_slide, r2 = divmod(first - st["first"], step)
+            if r1 or r2 or sorted(st["ema"]) != periods:
+                n_app = -1
+
+        # 滑出根数不超过最小周期：要减掉的项仍在新窗口内
+        max_slide = min(periods + [ATR_PERIOD])
+        if st is not None and contiguous and 0 <= n_app < n and 0 <= n_slide <= max_slide:
+            for p, s in st["ema"].items():
+                s.advance(y_close, 0, n, n_app, n_slide)
+            st["atr"].advance(y_tr, 1, n, n_app, n_slide)
+        else:
+            st = {
+                "ema": {p: _Smooth(p, 2.0 / (p + 1), 1) for p in periods},
+                "atr": _Smooth(ATR_PERIOD, 1.0 / ATR_PERIOD, ATR_MA_WINDOW),
+            }
+            for p, s in st["ema"].items():
+                s.rebuild(y_close, 0, n)
+            st["atr"].rebuild(y_tr, 1, n)
+
+        st["first"], st["last"] = first, last
+        if contiguous:
+            self._states[key] = st
+            self._dirty.add(key)
+        else:
+            # 位置与时间戳对不上，增量无从谈起：本轮按窗口重建，不保留状态
+            self._states.pop(key, None)
+
+        atr_vals = st["atr"].values(y_tr, 1, n)
+        atr_current = atr_vals[-1]
+        close = float(closes[-1])
+        ema = {f"EMA_{p}": None for p in EMA_CONFIG.get(interval, [])}
+        for p, s in st["ema"].items():
+            ema[f"EMA_{p}"] = s.values(y_close, 0, n)[-1]
+
+        return {
+            "close": close,
+            "ema": ema,
+            "atr": atr_current,
+            "atr_ma20": float(np.sum(atr_vals) / ATR_MA_WINDOW),
+            "atr_ratio": float(atr_current / close) if close != 0.0 else None,
+        }
+
+    def compute_pairs(self, pairs) -> dict[tuple[str, str], dict]:
+        out = {}
+        for symbol, interval in pairs:
+            try:
+                res = self.compute(symbol, interval)
+            except Exception as e:
+                logging.warning(f"{symbol} {interval} 指标增量状态失败，丢弃重建: {e}")
+                self._states.pop((symbol, interval), None)
+                continue
+            if res is not None:
+                out[(symbol, interval)] = res
+        return out
+
+
+INDICATOR_STATE = IndicatorState()
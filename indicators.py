@@ -1,12 +1,15 @@
 # indicators.py
-import json
 import numpy as np
 import talib
-from database import redis_client
-from deepseek_batch_pusher import add_to_batch
-from config import timeframes, EMA_CONFIG, STRUCTURE_PARAMS
-from market_structure import MarketStructure
-from payload_builder import save_unified_payload
+from config import timeframes, EMA_CONFIG, STRUCTURE_PARAMS, STRUCTURE_INCREMENTAL
+from kline_store import KLINE_STORE
+from bars import Bars, as_bars
+from fetch_planner import PLANNER
+from indicator_state import INDICATOR_STATE
+from indicator_registry import compute_bars_features
+from signal_memo import MEMO
+from signal_round import SignalRound, tf_order
+from market_structure import MarketStructure, IncrementalMarketStructure
 
 
 # ==========================================================
@@ -46,24 +49,48 @@ STRUCTURE_CONFIG = {
     for tf, params in STRUCTURE_PARAMS.items()
 }
 
+# (symbol, interval) -> 增量结构状态
+_structure_state: dict[tuple[str, str], IncrementalMarketStructure] = {}
 
-# ==========================================================
-# 将单周期结果快照写入 Redis（供聚合器统一裁判/投喂GPT）
-# ==========================================================
-def save_signal_snapshot(symbol: str, interval: str, indicators: dict, ttl_sec: int = 600):
-    key = f"signal_snapshot:{symbol}:{interval}"
-    redis_client.set(key, json.dumps(indicators, ensure_ascii=False), ex=ttl_sec)
+
+def analyze_structure(symbol: str, interval: str, rows) -> dict:
+    params = STRUCTURE_PARAMS.get(interval)
+    if params is None:
+        return {"valid": False, "reason": "no_analyzer"}
+    if not STRUCTURE_INCREMENTAL:
+        return STRUCTURE_CONFIG[interval].analyze(rows)
+
+    ms = _structure_state.get((symbol, interval))
+    if ms is None:
+        ms = _structure_state[(symbol, interval)] = IncrementalMarketStructure(**params)
+    return ms.update(rows)
 
 
 # ==========================================================
-# 读取 TF 快照（用于 15m signal 受“制度/位置”约束）
+# 上一轮指标快照（无新收盘K线时直接复用，见 signal_memo / signal_round）
 # ==========================================================
-def get_tf_snapshot(symbol: str, tf: str):
-    try:
-        v = redis_client.get(f"signal_snapshot:{symbol}:{tf}")
-        return json.loads(v) if v else None
-    except Exception:
-        return None
+def needs_compute(symbol: str, interval: str, recompute: set | None) -> bool:
+    """与 calculate_signal_single 的判定一致：需重算，或没有可复用的上一轮快照"""
+    return recompute is None or (symbol, interval) in recompute or (symbol, interval) not in MEMO
+
+
+def memo_hit(symbol: str, interval: str, last_ts: int, rnd: SignalRound) -> bool:
+    """K线 / 参数 / 依赖快照都没变：复用缓存快照，不重算、不重写"""
+    if MEMO.get(symbol, interval, last_ts) is None:
+        return False
+    return rnd.reuse(symbol, interval)
+
+
+def forget_structure(symbol: str):
+    for key in [k for k in _structure_state if k[0] == symbol]:
+        _structure_state.pop(key, None)
+
+
+def forget_signal(symbol: str):
+    MEMO.forget_symbol(symbol)
+    forget_structure(symbol)
+    PLANNER.forget_symbol(symbol)
+    INDICATOR_STATE.forget_symbol(symbol)
 
 
 # ==========================================================
@@ -88,8 +115,7 @@ def classify_range_break_15m(rows_15m, range_low: float, range_high: float, atr_
     if rows_15m is None or len(rows_15m) < 3:
         return "none"
 
-    closes = [float(r["Close"]) for r in rows_15m]
-    c1, c2, c3 = closes[-3], closes[-2], closes[-1]
+    c1, c2, c3 = as_bars(rows_15m[-3:]).close.tolist()
 
     def side(c: float) -> str:
         if c > range_high:
@@ -181,91 +207,100 @@ def calc_15m_signal(rows_15m, structure_15m: dict, out_of_range_15m: bool, atr_1
 
 def pack_klines(rows, limit=20, include_v=True):
     """
-    rows: [{"Timestamp":..., "Open":..., "High":..., "Low":..., "Close":..., "Volume":...}, ...]
+    rows: 列式 Bars；记录数组 / 逐根 dict 行经 as_bars 转换
     输出紧凑格式，便于投喂：[{t,o,h,l,c,v}, ...]
     """
-    if not rows:
+    if rows is None or len(rows) == 0:
         return []
 
-    cut = rows[-limit:] if len(rows) > limit else rows
-    out = []
-    for r in cut:
-        k = {
-            "t": int(r["Timestamp"]),
-            "o": float(r["Open"]),
-            "h": float(r["High"]),
-            "l": float(r["Low"]),
-            "c": float(r["Close"]),
-        }
-        if include_v:
-            # 你的 redis 行里字段名不确定：可能是 "Volume" 或 "Vol" 或 "QuoteVolume"
-            v = r.get("Volume", r.get("Vol", r.get("volume", None)))
-            if v is not None:
-                k["v"] = float(v)
-        out.append(k)
+    if not isinstance(rows, Bars):
+        # 只转换要打包的最后 limit 根
+        rows = as_bars(rows[-limit:])
+    cut = rows[-limit:]
+
+    cols = [cut.timestamp.tolist(), cut.open.tolist(), cut.high.tolist(),
+            cut.low.tolist(), cut.close.tolist()]
+    out = [{"t": t, "o": o, "h": h, "l": l, "c": c} for t, o, h, l, c in zip(*cols)]
+    if include_v:
+        # dict 行可能没有成交量字段（as_bars 记 NaN）：这类行不输出 v
+        for k, v in zip(out, cut.volume.tolist()):
+            if v == v:
+                k["v"] = v
     return out
 
 
 # ==========================================================
-# 🔥 计算单周期指标
+# 🔥 计算单周期指标（纯计算：不读写 Redis，可在 worker 进程里执行）
 # ==========================================================
-def calculate_signal(symbol: str, interval: str):
-    rkey = f"historical_data:{symbol}:{interval}"
-    data = redis_client.hgetall(rkey)
-    if not data:
-        return
-
-    rows = sorted(data.items(), key=lambda x: int(x[0]))
-    rows = [{"Timestamp": int(ts), **json.loads(v)} for ts, v in rows]
+def compute_indicators(symbol: str, interval: str, rows: Bars, base: dict | None = None,
+                       tf4h_snapshot: dict | None = None) -> dict | None:
+    """
+    rows：该周期的列式窗口（按时间升序）
+    base：batch_indicators / indicator_state 算好的 ema / atr / atr_ma20 / atr_ratio（可带 features）；
+          None 时用 talib 计算
+    tf4h_snapshot：本轮 4h 指标快照（只有 15m 用到）
+    结构识别走 analyze_structure：增量状态保存在执行本函数的进程里
+    """
     if len(rows) < 5:
-        return
+        return None
 
     # ------------------------------
-    # OHLC arrays
+    # OHLC arrays（Bars 各列已是连续数组）
     # ------------------------------
-    closes = np.array([float(k["Close"]) for k in rows], dtype=np.float64)
-    highs = np.array([float(k["High"]) for k in rows], dtype=np.float64)
-    lows = np.array([float(k["Low"]) for k in rows], dtype=np.float64)
+    closes = rows.close
+    highs = rows.high
+    lows = rows.low
 
-    last = rows[-1]
-    last_ts = last["Timestamp"]
-    last_open = float(last["Open"])
-    last_high = float(last["High"])
-    last_low = float(last["Low"])
-    last_close = float(last["Close"])
+    last_ts = int(rows.timestamp[-1])
+    last_open = float(rows.open[-1])
+    last_high = float(highs[-1])
+    last_low = float(lows[-1])
+    last_close = float(closes[-1])
 
     # ------------------------------
     # EMA
     # ------------------------------
-    ema_periods = EMA_CONFIG.get(interval, [])
-    ema_values = {}
-    for p in ema_periods:
-        ema_series = talib.EMA(closes, timeperiod=p)
-        ema_values[f"EMA_{p}"] = float(ema_series[-1]) if np.isfinite(ema_series[-1]) else None
+    if base is not None:
+        ema_values = dict(base["ema"])
+        atr_current = base["atr"]
+        atr_ma20 = base["atr_ma20"]
+        atr_ratio = base["atr_ratio"]
+    else:
+        ema_periods = EMA_CONFIG.get(interval, [])
+        ema_values = {}
+        for p in ema_periods:
+            ema_series = talib.EMA(closes, timeperiod=p)
+            ema_values[f"EMA_{p}"] = float(ema_series[-1]) if np.isfinite(ema_series[-1]) else None
+
+        # ------------------------------
+        # ATR
+        # ------------------------------
+        atr_series = talib.ATR(highs, lows, closes, timeperiod=14)
+        atr_current = float(atr_series[-1]) if np.isfinite(atr_series[-1]) else None
+
+        atr_valid = atr_series[np.isfinite(atr_series)]
+        if atr_valid.size >= 20:
+            atr_ma20 = float(np.nanmean(atr_valid[-20:]))
+        elif atr_valid.size > 0:
+            atr_ma20 = float(np.nanmean(atr_valid))
+        else:
+            atr_ma20 = None
+
+        atr_ratio = None
+        if atr_current is not None and last_close != 0.0:
+            atr_ratio = float(atr_current / last_close)
 
     # ------------------------------
-    # ATR
+    # ✅ 注册表特征（CVD / 主动买入占比 / RSI / VWAP…），批量算好的直接用
     # ------------------------------
-    atr_series = talib.ATR(highs, lows, closes, timeperiod=14)
-    atr_current = float(atr_series[-1]) if np.isfinite(atr_series[-1]) else None
-
-    atr_valid = atr_series[np.isfinite(atr_series)]
-    if atr_valid.size >= 20:
-        atr_ma20 = float(np.nanmean(atr_valid[-20:]))
-    elif atr_valid.size > 0:
-        atr_ma20 = float(np.nanmean(atr_valid))
-    else:
-        atr_ma20 = None
-
-    atr_ratio = None
-    if atr_current is not None and last_close != 0.0:
-        atr_ratio = float(atr_current / last_close)
+    features = base.get("features") if base is not None else None
+    if features is None:
+        features = compute_bars_features(rows)
 
     # ------------------------------
     # ✅ 市场结构
     # ------------------------------
-    ms = STRUCTURE_CONFIG.get(interval)
-    structure = ms.analyze(rows) if ms else {"valid": False, "reason": "no_analyzer"}
+    structure = analyze_structure(symbol, interval, rows)
 
     # ------------------------------
     # ✅ 区间位置（用本周期结构的 range_low/range_high）
@@ -301,15 +336,12 @@ def calculate_signal(symbol: str, interval: str):
     candle_events = {}
 
     # ------------------------------
-    # ✅ 15m signal：假/真突破 + 制度约束（只读一次 4H snapshot）
+    # ✅ 15m signal：假/真突破 + 制度约束（4H snapshot 由调用方传入）
     # ------------------------------
     signal = "none"
-    tf4h_snapshot = None
     klines = None
 
     if interval == "15m":
-        tf4h_snapshot = get_tf_snapshot(symbol, "4h")
-
         signal = calc_15m_signal(
             rows_15m=rows,
             structure_15m=structure,
@@ -350,6 +382,7 @@ def calculate_signal(symbol: str, interval: str):
         "atr_ma20": atr_ma20,
 
         "ema": ema_values,
+        "features": features,
 
         "candle_stats": candle_stats,
         # 仅 15m 带 events（控 payload）；其他周期 events 为空字典也可
@@ -366,26 +399,46 @@ def calculate_signal(symbol: str, interval: str):
     if interval == "15m":
         indicators["klines"] = klines
 
-    # ------------------------------
-    # ✅ 1) 写快照
-    # ------------------------------
-    save_signal_snapshot(symbol, interval, indicators)
-
-    # ------------------------------
-    # ✅ 2) 进入 batch
-    # ------------------------------
-    add_to_batch(symbol, interval, indicators)
-
-    # ------------------------------
-    # ✅ 3) 只在 15m 更新时聚合 unified payload + 裁判日志
-    # ------------------------------
-    if interval == "15m":
-        payload = save_unified_payload(symbol)
-        if payload:
-            ref = payload["referee"]
-            _ = ref.get("strategy_type")
+    return indicators
 
 
-def calculate_signal_single(symbol: str):
-    for tf in timeframes:
-        calculate_signal(symbol, tf)
+def calculate_signal(symbol: str, interval: str, base: dict | None = None, rnd: SignalRound | None = None):
+    """
+    串行路径：从进程内K线存储取列式窗口，计算后交给本轮计算图落地
+    base：batch_indicators 批量算好的 ema / atr / atr_ma20 / atr_ratio；None 时逐币种用 talib 计算
+    rnd：本轮计算图；None 时单独成一轮并立即写入 Redis
+    """
+    own = rnd is None
+    rnd = rnd or SignalRound()
+    try:
+        rows = KLINE_STORE.bars(symbol, interval)
+        if len(rows) < 5:
+            return
+        if memo_hit(symbol, interval, int(rows.timestamp[-1]), rnd):
+            return rnd.snapshot(symbol, interval)
+
+        tf4h_snapshot = rnd.snapshot(symbol, "4h") if interval == "15m" else None
+        indicators = compute_indicators(symbol, interval, rows, base, tf4h_snapshot)
+        rnd.publish(symbol, interval, indicators)
+        return indicators
+    finally:
+        if own:
+            rnd.flush()
+
+
+def calculate_signal_single(symbol: str, recompute: set | None = None, batch: dict | None = None,
+                            rnd: SignalRound | None = None):
+    """
+    recompute：需要重算的 (symbol, interval) 集合（来自 PLANNER.compute_pairs）；
+    None 表示全部重算。其余周期复用上一轮快照。
+    batch：compute_batch_pairs 的结果，{(symbol, interval): ema/atr}；缺的组合逐个用 talib 算
+    周期按依赖顺序计算（4h/1h 先于 15m）
+    """
+    own = rnd is None
+    rnd = rnd or SignalRound()
+    batch = batch or {}
+    for tf in tf_order(timeframes):
+        if needs_compute(symbol, tf, recompute) or not rnd.reuse(symbol, tf):
+            calculate_signal(symbol, tf, batch.get((symbol, tf)), rnd)
+    if own:
+        rnd.flush()
@@ -0,0 +1,185 @@
+# kline_archive.py
+"""
+本地只追加K线归档：每个 (symbol, interval) 一个内存映射列式文件
+
+目录结构：
+    {root}/{interval}/{symbol}.bin        KLINE_DTYPE 定长记录，按时间升序
+    {root}/{interval}/{symbol}.idx.json   {"count": n, "first": ts, "last": ts, "ranges": [[start, end], ...]}
+                                          ranges 为无缺口的连续时间段（开盘时间，闭区间）
+
+- 新K线只追加到文件尾；更早的缺失K线（回补/导入）才触发一次排序合并重写
+- read() 用 np.memmap + searchsorted 返回区间视图，不拷贝
+- 重启时 KLINE_STORE 可直接从归档预热，不必重新下载全市场
+"""
+import os
+import json
+import threading
+import numpy as np
+from config import KLINE_ARCHIVE_DIR
+from kline_codec import KLINE_DTYPE, RECORD_SIZE, INTERVAL_MS, empty_bars
+
+
+def _ranges(ts: np.ndarray, step: int) -> list[list[int]]:
+    if len(ts) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ts) != step)
+    starts = np.r_[0, breaks + 1]
+    ends = np.r_[breaks, len(ts) - 1]
+    return [[int(ts[s]), int(ts[e])] for s, e in zip(starts, ends)]
+
+
+class KlineArchive:
+    def __init__(self, root: str = KLINE_ARCHIVE_DIR):
+        self.root = root
+        self._maps: dict[tuple[str, str], tuple[int, np.ndarray]] = {}
+        self._index: dict[tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+
+    # ==========================================================
+    # 路径 / 索引
+    # ==========================================================
+    def _paths(self, symbol: str, interval: str) -> tuple[str, str]:
+        d = os.path.join(self.root, interval)
+        return os.path.join(d, f"{symbol}.bin"), os.path.join(d, f"{symbol}.idx.json")
+
+    def index(self, symbol: str, interval: str) -> dict:
+        key = (symbol, interval)
+        if key not in self._index:
+            _, ipath = self._paths(symbol, interval)
+            try:
+                with open(ipath, "r", encoding="utf-8") as f:
+                    self._index[key] = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._index[key] = {"count": 0, "first": None, "last": None, "ranges": []}
+        return self._index[key]
+
+    def _save_index(self, symbol: str, interval: str, idx: dict):
+        _, ipath = self._paths(symbol, interval)
+        tmp = ipath + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(idx, f)
+        os.replace(tmp, ipath)
+        self._index[(symbol, interval)] = idx
+
+    def ranges(self, symbol: str, interval: str) -> list[list[int]]:
+        return self.index(symbol, interval)["ranges"]
+
+    def last_ts(self, symbol: str, interval: str) -> int | None:
+        return self.index(symbol, interval)["last"]
+
+    # ==========================================================
+    # 读
+    # ==========================================================
+    def _mmap(self, symbol: str, interval: str) -> np.ndarray:
+        key = (symbol, interval)
+        bpath, _ = self._paths(symbol, interval)
+        try:
+            size = os.path.getsize(bpath)
+        except FileNotFoundError:
+            return empty_bars()
+        n = size // RECORD_SIZE
+        cached = self._maps.get(key)
+        if cached and cached[0] == n:
+            return cached[1]
+        if n == 0:
+            return empty_bars()
+        m = np.memmap(bpath, dtype=KLINE_DTYPE, mode="r", shape=(n,))
+        self._maps[key] = (n, m)
+        return m
+
+    def read(self, symbol: str, interval: str, start: int | None = None, end: int | None = None) -> np.ndarray:
+        """[start, end] 区间内的K线（开盘时间，闭区间）；返回内存映射视图，不拷贝"""
+        m = self._mmap(symbol, interval)
+        if len(m) == 0:
+            return m
+        ts = m["Timestamp"]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        hi = len(m) if end is None else int(np.searchsorted(ts, end, side="right"))
+        return m[lo:hi]
+
+    def tail(self, symbol: str, interval: str, n: int) -> np.ndarray:
+        m = self._mmap(symbol, interval)
+        return m[-n:] if len(m) > n else m
+
+    # ==========================================================
+    # 写
+    # ==========================================================
+    def write(self, symbol: str, interval: str, bars: np.ndarray) -> int:
+        """
+        写入一批K线（任意顺序，可与已有重叠）：
+          - 晚于最后一根的部分直接追加
+          - 更早且归档里缺失的部分触发一次合并重写
+        返回新增根数。
+        """
+        if len(bars) == 0:
+            return 0
+        step = INTERVAL_MS[interval]
+        bars = np.ascontiguousarray(bars, dtype=KLINE_DTYPE)
+        _, uniq = np.unique(bars["Timestamp"], return_index=True)
+        bars = bars[uniq]
+
+        with self._lock:
+            bpath, _ = self._paths(symbol, interval)
+            os.makedirs(os.path.dirname(bpath), exist_ok=True)
+            idx = self.index(symbol, interval)
+            last = idx["last"]
+
+            if last is None:
+                newer, older = bars, bars[:0]
+            else:
+                newer = bars[bars["Timestamp"] > last]
+                older = bars[bars["Timestamp"] <= last]
+
+            if len(older):
+                existing = self._mmap(symbol, interval)
+                pos = np.searchsorted(existing["Timestamp"], older["Timestamp"])
+                pos = np.minimum(pos, len(existing) - 1)
+                older = older[existing["Timestamp"][pos] != older["Timestamp"]]
+
+            if len(older):
+                return self._rewrite(symbol, interval, older, newer, step)
+
+            if not len(newer):
+                return 0
+
+            with open(bpath, "ab") as f:
+                f.write(newer.tobytes())
+
+            rs = [list(r) for r in idx["ranges"]]
+            new_rs = _ranges(newer["Timestamp"], step)
+            if rs and rs[-1][1] + step == new_rs[0][0]:
+                rs[-1][1] = new_rs[0][1]
+                new_rs = new_rs[1:]
+            rs.extend(new_rs)
+
+            self._save_index(symbol, interval, {
+                "count": idx["count"] + len(newer),
+                "first": idx["first"] if idx["first"] is not None else int(newer["Timestamp"][0]),
+                "last": int(newer["Timestamp"][-1]),
+                "ranges": rs,
+            })
+            return len(newer)
+
+    def _rewrite(self, symbol: str, interval: str, older: np.ndarray, newer: np.ndarray, step: int) -> int:
+        bpath, _ = self._paths(symbol, interval)
+        existing = np.array(self._mmap(symbol, interval))
+        merged = np.concatenate([existing, older, newer])
+        merged = merged[np.argsort(merged["Timestamp"], kind="stable")]
+
+        tmp = bpath + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(merged.tobytes())
+        self._maps.pop((symbol, interval), None)
+        os.replace(tmp, bpath)
+
+        ts = merged["Timestamp"]
+        self._save_index(symbol, interval, {
+            "count": len(merged),
+            "first": int(ts[0]),
+            "last": int(ts[-1]),
+            "ranges": _ranges(ts, step),
+        })
+        return len(older) + len(newer)
+
+
+ARCHIVE = KlineArchive()
@@ -0,0 +1,202 @@
+# kline_backfill.py
+"""
+K线缺口检测 + 分页深度回补
+
+- find_gaps：扫描时间戳，找出缺失K线的区间（内部缺口 + 窗口头尾）
+- fetch_range：startTime/endTime 分页（每页最多 1500 根），只拉缺失区间
+- backfill / backfill_all：多币种并发回补，输出覆盖率统计
+- 交易所本身就没有数据的区间（停机维护 / 新上线币）记为空区间，之后不再重复请求；
+  滑出存储窗口的空区间、已不在存储里的组合随回补一起清掉，不会无限增长
+- 回补结果用 KLINE_STORE.merge 在存储锁内并入当前窗口（而不是拿请求前的快照整段覆盖），
+  回补期间 WebSocket 追加的新K线不会丢
+- 本地归档已有的K线直接读盘，只对归档也缺的区间发请求；拉到的深度历史写回归档
+"""
+import time
+import asyncio
+import numpy as np
+from config import KLINE_ARCHIVE_ENABLED
+from kline_archive import ARCHIVE
+from kline_codec import KLINE_DTYPE, bars_from_binance, empty_bars
+from kline_fetcher import INTERVAL_MS, get_klines
+from kline_store import KLINE_STORE, capacity_for
+
+MAX_PAGE = 1500
+
+# (symbol, interval) -> [(start_ts, end_ts), ...] 交易所确认无数据的区间
+_empty_ranges: dict[tuple[str, str], list[tuple[int, int]]] = {}
+
+
+def _latest_closed_open_ts(step: int, now_ms: int) -> int:
+    return now_ms // step * step - step
+
+
+def find_gaps(ts: np.ndarray, step: int, start: int, end: int) -> list[tuple[int, int]]:
+    """
+    返回 [start, end] 内缺失K线的区间列表 [(gap_start, gap_end), ...]（均为开盘时间，闭区间）
+    ts：按时间升序的开盘时间戳
+    """
+    ts = ts[(ts >= start) & (ts <= end)]
+    if len(ts) == 0:
+        return [(start, end)] if start <= end else []
+
+    gaps = []
+    if ts[0] > start:
+        gaps.append((start, int(ts[0]) - step))
+
+    d = np.diff(ts)
+    for i in np.flatnonzero(d > step):
+        gaps.append((int(ts[i]) + step, int(ts[i + 1]) - step))
+
+    if ts[-1] < end:
+        gaps.append((int(ts[-1]) + step, end))
+    return gaps
+
+
+def _prune_empty(symbol: str | None = None, interval: str | None = None):
+    """丢掉已滑出存储窗口的空区间；不指定组合时顺带清掉已不在存储里的组合"""
+    now_ms = int(time.time() * 1000)
+    keys = [(symbol, interval)] if symbol else list(_empty_ranges)
+    live = None if symbol else set(KLINE_STORE.keys())
+    for key in keys:
+        ranges = _empty_ranges.get(key)
+        if ranges is None:
+            continue
+        step = INTERVAL_MS[key[1]]
+        window_start = _latest_closed_open_ts(step, now_ms) - (capacity_for(key[1]) - 1) * step
+        ranges = [r for r in ranges if r[1] >= window_start]
+        if ranges and (live is None or key in live):
+            _empty_ranges[key] = ranges
+        else:
+            _empty_ranges.pop(key, None)
+
+
+def _subtract_known_empty(symbol: str, interval: str, gaps):
+    known = _empty_ranges.get((symbol, interval), [])
+    return [g for g in gaps if not any(ks <= g[0] and g[1] <= ke for ks, ke in known)]
+
+
+async def fetch_range(symbol: str, interval: str, start_ts: int, end_ts: int) -> np.ndarray:
+    """分页拉取 [start_ts, end_ts] 内的已收盘K线"""
+    step = INTERVAL_MS[interval]
+    pages = []
+    cur = start_ts
+    while cur <= end_ts:
+        limit = min(MAX_PAGE, (end_ts - cur) // step + 1)
+        data = await get_klines({
+            "symbol": symbol, "interval": interval,
+            "startTime": cur, "endTime": end_ts, "limit": limit,
+        })
+        page = bars_from_binance(data, int(time.time() * 1000))
+        if not len(page):
+            break
+        pages.append(page)
+        cur = int(page["Timestamp"][-1]) + step
+    return np.concatenate(pages) if pages else empty_bars()
+
+
+def merge_bars(*parts: np.ndarray) -> np.ndarray:
+    """合并多段记录数组：按时间排序，同一时间戳保留先出现的那段"""
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return empty_bars()
+    allb = np.concatenate(parts).astype(KLINE_DTYPE, copy=False)
+    _, idx = np.unique(allb["Timestamp"], return_index=True)
+    return allb[idx]
+
+
+async def backfill(symbol: str, interval: str, depth: int | None = None) -> dict:
+    """
+    回补最近 depth 根（默认K线存储容量）内的全部缺口。
+    depth 超过存储容量时，返回的 bars 含完整深度历史（存储只保留最近 capacity 根）。
+    """
+    step = INTERVAL_MS[interval]
+    depth = depth or capacity_for(interval)
+    end = _latest_closed_open_ts(step, int(time.time() * 1000))
+    start = end - (depth - 1) * step
+
+    have = KLINE_STORE.view(symbol, interval).copy()
+    if KLINE_ARCHIVE_ENABLED:
+        have = merge_bars(have, ARCHIVE.read(symbol, interval, start, end))
+    gaps = _subtract_known_empty(symbol, interval, find_gaps(have["Timestamp"], step, start, end))
+    missing_before = sum((e - s) // step + 1 for s, e in gaps)
+
+    fetched = []
+    for gs, ge in gaps:
+        try:
+            part = await fetch_range(symbol, interval, gs, ge)
+        except Exception as e:
+            print(f"⚠️ {symbol} {interval} 回补失败 [{gs}, {ge}]: {e}")
+            continue
+        fetched.append(part)
+        # 拉完后仍缺的部分 = 交易所无数据，记下来避免重复请求
+        for es, ee in find_gaps(part["Timestamp"], step, gs, ge):
+            _empty_ranges.setdefault((symbol, interval), []).append((es, ee))
+
+    bars = merge_bars(have, *fetched)
+    if fetched or len(bars) > len(KLINE_STORE.view(symbol, interval)):
+        # 上面有 await：have 可能已过时，在存储锁内和当前窗口合并
+        KLINE_STORE.merge(symbol, interval, bars)
+    if KLINE_ARCHIVE_ENABLED and fetched:
+        ARCHIVE.write(symbol, interval, merge_bars(*fetched))
+    _prune_empty(symbol, interval)
+
+    window = bars[(bars["Timestamp"] >= start) & (bars["Timestamp"] <= end)]
+    expected = depth
+    return {
+        "symbol": symbol,
+        "interval": interval,
+        "expected": expected,
+        "missing_before": missing_before,
+        "filled": int(sum(len(p) for p in fetched)),
+        "have": int(len(window)),
+        "coverage": round(len(window) / expected, 4) if expected else 1.0,
+        "gaps": len(gaps),
+        "bars": bars,
+    }
+
+
+def pairs_with_gaps(pairs) -> list[tuple[str, str]]:
+    """只在内存里扫描（不发请求）：哪些组合的存储窗口有内部缺口"""
+    out = []
+    for symbol, interval in pairs:
+        v = KLINE_STORE.view(symbol, interval)
+        if len(v) < 2:
+            continue
+        ts = v["Timestamp"]
+        step = INTERVAL_MS[interval]
+        gaps = _subtract_known_empty(symbol, interval, find_gaps(ts, step, int(ts[0]), int(ts[-1])))
+        if gaps:
+            out.append((symbol, interval))
+    return out
+
+
+async def backfill_all(pairs, depth: int | None = None, concurrency: int = 8) -> dict:
+    """多组合并发回补，返回覆盖率汇总"""
+    sem = asyncio.Semaphore(concurrency)
+    _prune_empty()
+
+    async def _one(sym, tf):
+        async with sem:
+            return await backfill(sym, tf, depth)
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[_one(s, tf) for s, tf in pairs], return_exceptions=True)
+    stats = [r for r in results if isinstance(r, dict)]
+
+    report = {
+        "pairs": len(pairs),
+        "ok": len(stats),
+        "errors": len(results) - len(stats),
+        "missing_before": sum(r["missing_before"] for r in stats),
+        "filled": sum(r["filled"] for r in stats),
+        "min_coverage": min((r["coverage"] for r in stats), default=1.0),
+        "elapsed_sec": round(time.perf_counter() - t0, 3),
+        "detail": {f"{r['symbol']}:{r['interval']}": {k: r[k] for k in ("coverage", "missing_before", "filled")}
+                   for r in stats},
+    }
+    print(
+        f"🧩 K线回补: {report['ok']}/{report['pairs']} | 缺失 {report['missing_before']} 根 → "
+        f"补齐 {report['filled']} 根 | 最低覆盖率 {report['min_coverage']:.2%} | "
+        f"{report['elapsed_sec']} 秒"
+    )
+    return report
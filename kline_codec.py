@@ -0,0 +1,123 @@
+# kline_codec.py
+"""
+K线紧凑二进制存储：每个 (symbol, interval) 一个 Redis 字符串，
+内容为定长 packed record 数组（int64 时间戳 + 6 个 float64），按时间升序。
+
+读取端直接 numpy.frombuffer，不产生逐根 Python 对象；
+字段名与旧 JSON 行的键一致，arr["Close"] 即收盘价列。
+"""
+import numpy as np
+from database import redis_bin_client
+
+KLINE_DTYPE = np.dtype([
+    ("Timestamp", "<i8"),
+    ("Open", "<f8"),
+    ("High", "<f8"),
+    ("Low", "<f8"),
+    ("Close", "<f8"),
+    ("Volume", "<f8"),
+    ("TakerBuyVolume", "<f8"),
+])
+RECORD_SIZE = KLINE_DTYPE.itemsize  # 56 字节/根
+
+# 周期 → 毫秒
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 60 * 60_000,
+    "2h": 2 * 60 * 60_000,
+    "4h": 4 * 60 * 60_000,
+    "6h": 6 * 60 * 60_000,
+    "8h": 8 * 60 * 60_000,
+    "12h": 12 * 60 * 60_000,
+    "1d": 24 * 60 * 60_000,
+}
+
+# 追加超出窗口多少根后才做一次裁剪（避免每次追加都整块重写）
+TRIM_SLACK = 64
+
+
+def blob_key(symbol: str, interval: str) -> str:
+    return f"kline_bin:{symbol}:{interval}"
+
+
+def empty_bars() -> np.ndarray:
+    return np.empty(0, dtype=KLINE_DTYPE)
+
+
+def encode(bars: np.ndarray) -> bytes:
+    return np.ascontiguousarray(bars, dtype=KLINE_DTYPE).tobytes()
+
+
+def decode(blob: bytes | None) -> np.ndarray:
+    """零拷贝解码（只读视图）；尾部不足一条记录的残片直接忽略"""
+    if not blob:
+        return empty_bars()
+    n = len(blob) // RECORD_SIZE
+    return np.frombuffer(blob, dtype=KLINE_DTYPE, count=n)
+
+
+def bars_from_binance(data, now: int) -> np.ndarray:
+    """币安 REST K线数组 → 已收盘记录数组（过滤 close_time > now 的未收盘K线）"""
+    closed = [k for k in data if k[6] <= now]
+    out = np.empty(len(closed), dtype=KLINE_DTYPE)
+    for i, k in enumerate(closed):
+        out[i] = (int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), float(k[9]))
+    return out
+
+
+# ==========================================================
+# Redis 读写
+# ==========================================================
+def store_bars(symbol: str, interval: str, bars: np.ndarray):
+    """整块覆盖写入"""
+    redis_bin_client.set(blob_key(symbol, interval), encode(bars))
+
+
+def append_bars(symbol: str, interval: str, bars: np.ndarray, limit: int):
+    """
+    追加写入（调用方保证 bars 时间戳严格晚于已存最后一根）。
+    超过 limit + TRIM_SLACK 根时裁剪到最近 limit 根。
+    """
+    if len(bars) == 0:
+        return
+    key = blob_key(symbol, interval)
+    size = redis_bin_client.append(key, encode(bars))
+    if size > (limit + TRIM_SLACK) * RECORD_SIZE:
+        trim_bars(symbol, interval, limit)
+
+
+def trim_bars(symbol: str, interval: str, keep: int):
+    """只保留最近 keep 根"""
+    key = blob_key(symbol, interval)
+    tail = redis_bin_client.getrange(key, -keep * RECORD_SIZE, -1)
+    # getrange 在 key 长度不足时返回整段；按记录边界对齐
+    tail = tail[len(tail) % RECORD_SIZE:]
+    redis_bin_client.set(key, tail)
+
+
+def load_bars(symbol: str, interval: str, limit: int | None = None) -> np.ndarray:
+    bars = decode(redis_bin_client.get(blob_key(symbol, interval)))
+    if limit is not None and len(bars) > limit:
+        bars = bars[-limit:]
+    return bars
+
+
+def rows_from_bars(bars: np.ndarray) -> list[dict]:
+    """兼容适配：记录数组 → 旧版逐根 dict 行"""
+    return [
+        {
+            "Timestamp": int(b["Timestamp"]),
+            "Open": float(b["Open"]),
+            "High": float(b["High"]),
+            "Low": float(b["Low"]),
+            "Close": float(b["Close"]),
+            "Volume": float(b["Volume"]),
+            "TakerBuyVolume": float(b["TakerBuyVolume"]),
+            "TakerSellVolume": float(b["Volume"]) - float(b["TakerBuyVolume"]),
+        }
+        for b in bars
+    ]
@@ -1,56 +1,284 @@
 import time
-import json
+import random
+import asyncio
 import logging
+import aiohttp
 import requests
-from concurrent.futures import ThreadPoolExecutor
-from config import monitor_symbols, timeframes, KLINE_LIMITS
-from database import redis_client
+import numpy as np
+from config import (
+    monitor_symbols, timeframes, KLINE_LIMITS, KLINE_INCREMENTAL_SYNC,
+    RESAMPLE_ENABLED, RESAMPLE_TIMEFRAMES, KLINE_FETCH_CONCURRENCY, KLINE_WEIGHT_LIMIT_1M,
+)
+from deepseek_batch_pusher import get_http_session
+from kline_codec import KLINE_DTYPE, INTERVAL_MS, bars_from_binance
+from kline_store import KLINE_STORE
+from resampler import resample, derive_new_bars, compare_bars
 
-def fetch_historical(symbol, interval, limit):
-    url = f"https://fapi.binance.com/fapi/v1/klines?symbol={symbol}&interval={interval}&limit={limit}"
-    rkey = f"historical_data:{symbol}:{interval}"
+KLINES_URL = "https://fapi.binance.com/fapi/v1/klines"
+
+
+# ==========================================================
+# 权重节流：读取 X-MBX-USED-WEIGHT-1M，接近上限时等到下一分钟窗口
+# ==========================================================
+def request_weight(limit: int) -> int:
+    """/fapi/v1/klines 的请求权重（随 limit 变化）"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
 
-    try:
-        data = requests.get(url, timeout=5).json()
-        now = int(time.time() * 1000)
 
-        with redis_client.pipeline() as pipe:
-            for k in data:
-                ts, close_ts = k[0], k[6]
-                if close_ts > now:
+class WeightPacer:
+    def __init__(self, limit_1m: int, soft_ratio: float = 0.8):
+        self.soft_limit = int(limit_1m * soft_ratio)
+        self.used = 0
+        self._window = int(time.time() // 60)
+        self._pause_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _roll(self):
+        w = int(time.time() // 60)
+        if w != self._window:
+            self._window = w
+            self.used = 0
+
+    async def acquire(self, weight: int):
+        async with self._lock:
+            while True:
+                now = time.time()
+                if now < self._pause_until:
+                    await asyncio.sleep(self._pause_until - now)
                     continue
+                self._roll()
+                if self.used + weight <= self.soft_limit:
+                    self.used += weight
+                    return
+                wait = 60 - now % 60 + random.uniform(0.05, 0.5)
+                print(f"⏸ K线下载权重 {self.used}/{self.soft_limit}，等待 {wait:.1f} 秒进入下一窗口")
+                await asyncio.sleep(wait)
+
+    def observe(self, headers):
+        v = headers.get("X-MBX-USED-WEIGHT-1M")
+        if v is not None:
+            self._roll()
+            # 服务端计数不含尚在途的请求：取二者较大值
+            self.used = max(self.used, int(v))
+
+    def pause(self, seconds: float):
+        self._pause_until = max(self._pause_until, time.time() + seconds)
+
+
+PACER = WeightPacer(KLINE_WEIGHT_LIMIT_1M)
+_fetch_sem: asyncio.Semaphore | None = None
+
+
+def _semaphore() -> asyncio.Semaphore:
+    global _fetch_sem
+    if _fetch_sem is None:
+        _fetch_sem = asyncio.Semaphore(KLINE_FETCH_CONCURRENCY)
+    return _fetch_sem
+
 
-                entry = json.dumps({
-                    "Open": float(k[1]),
-                    "High": float(k[2]),
-                    "Low": float(k[3]),
-                    "Close": float(k[4]),
-                    "Volume": float(k[5]),
-                    "TakerBuyVolume": float(k[9]),
-                    "TakerSellVolume": float(k[5]) - float(k[9])
-                })
+async def get_klines(params: dict, retries: int = 3):
+    """
+    共享 aiohttp Session 上的K线请求：有界并发 + 权重节流 + 抖动重试。
+    429/418 按 Retry-After 暂停全部请求。
+    """
+    session = await get_http_session()
+    weight = request_weight(int(params.get("limit", 500)))
+    last_err = None
 
-                pipe.hset(rkey, ts, entry)
-            pipe.execute()
+    for attempt in range(retries):
+        await PACER.acquire(weight)
+        try:
+            async with _semaphore():
+                async with session.get(
+                    KLINES_URL, params=params, timeout=aiohttp.ClientTimeout(total=5)
+                ) as resp:
+                    PACER.observe(resp.headers)
+                    if resp.status in (418, 429):
+                        retry_after = float(resp.headers.get("Retry-After", 60))
+                        PACER.pause(retry_after)
+                        raise aiohttp.ClientError(f"HTTP {resp.status}，Retry-After {retry_after}s")
+                    if resp.status != 200:
+                        raise aiohttp.ClientError(f"HTTP {resp.status}")
+                    return await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_err = e
+            if attempt < retries - 1:
+                await asyncio.sleep(0.5 * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    raise last_err
+
+
+async def fetch_historical(symbol, interval, limit):
+    """全量加载：拉取最近 limit 根K线并整段覆盖K线存储"""
+    try:
+        data = await get_klines({"symbol": symbol, "interval": interval, "limit": limit})
+        bars = bars_from_binance(data, int(time.time() * 1000))
+        KLINE_STORE.load(symbol, interval, bars)
 
     except Exception as e:
         logging.warning(f"{symbol} {interval} 历史获取失败: {e}")
 
-def fetch_all():
-    total_requests = len(monitor_symbols) * len(timeframes)
-    print(f"⏳ 初始化下载中... 预计请求数: {total_requests}")
+
+async def sync_incremental(symbol, interval, limit):
+    """
+    增量同步：只拉取上次最后一根已收盘K线之后的新K线。
+    以下情况回退全量加载：
+      - 冷启动（K线存储为空，且无法从 Redis 预热）
+      - 缺失根数超过窗口
+    startTime 查询返回的K线若不连续，说明交易所该区间本身无数据（停机等），照常追加；
+    存储里的缺口由 kline_backfill 扫描、回补并记为空区间。
+    请求期间 WebSocket 可能已追加同一根K线：KLINE_STORE.append 在锁内按时间戳去重。
+    返回本次是否发起了 REST 请求。
+    """
+    step = INTERVAL_MS.get(interval)
+    last_ts = KLINE_STORE.last_ts(symbol, interval)
+    if last_ts is None and KLINE_STORE.warm(symbol, interval):
+        last_ts = KLINE_STORE.last_ts(symbol, interval)
+
+    if step is None or last_ts is None:
+        await fetch_historical(symbol, interval, limit)
+        return True
+
+    now = int(time.time() * 1000)
+    next_ts = last_ts + step
+
+    # 下一根K线尚未收盘 → 没有新数据，无需请求
+    if next_ts + step - 1 > now:
+        return False
+
+    missing = (now - next_ts) // step
+    if missing >= limit:
+        await fetch_historical(symbol, interval, limit)
+        return True
+
+    try:
+        data = await get_klines({"symbol": symbol, "interval": interval, "startTime": next_ts, "limit": missing + 1})
+        bars = bars_from_binance(data, int(time.time() * 1000))
+        if not len(bars):
+            return True
+
+        ts = bars["Timestamp"]
+        if ts[0] != next_ts or (len(ts) > 1 and (np.diff(ts) != step).any()):
+            logging.warning(f"{symbol} {interval} 交易所K线不连续({next_ts} → {int(ts[0])})，交由回补扫描确认")
+
+        KLINE_STORE.append(symbol, interval, bars)
+
+    except Exception as e:
+        logging.warning(f"{symbol} {interval} 增量获取失败: {e}")
+
+    return True
+
+
+def append_closed_bar(symbol, interval, ts, o, h, l, c, v, taker_buy) -> bool:
+    """
+    追加一根由 WebSocket 推送的已收盘K线（kline_stream 调用）。
+    只接受与当前最后一根连续的K线；冷启动或出现缺口时不写入，
+    交给下一轮 REST 增量同步补齐。返回是否写入。
+    """
+    step = INTERVAL_MS.get(interval)
+    last_ts = KLINE_STORE.last_ts(symbol, interval)
+    if step is None or last_ts is None or ts != last_ts + step:
+        return False
+
+    bar = np.array([(ts, float(o), float(h), float(l), float(c), float(v), float(taker_buy))], dtype=KLINE_DTYPE)
+    return KLINE_STORE.append(symbol, interval, bar) > 0
+
+
+# ==========================================================
+# 高周期本地重采样（1h/4h 由 15m 合成）
+# ==========================================================
+# 启动对齐校验失败的周期：回退为 REST 下载
+_resample_disabled: set[str] = set()
+
+
+def resample_enabled(interval: str) -> bool:
+    return RESAMPLE_ENABLED and interval in RESAMPLE_TIMEFRAMES and interval not in _resample_disabled
+
+
+def verify_resample_alignment(symbol: str, bars_to_check: int = 3):
+    """
+    启动时校验：用 REST 拉最近几根已收盘的高周期K线与对应的基础K线，
+    本地重采样后逐字段比对；不一致的周期禁用重采样。
+    """
+    if not RESAMPLE_ENABLED:
+        return
+
+    for interval, base_interval in RESAMPLE_TIMEFRAMES.items():
+        step, base_ms = INTERVAL_MS[interval], INTERVAL_MS[base_interval]
+        ratio = step // base_ms
+        try:
+            now = int(time.time() * 1000)
+            hi = requests.get(
+                f"{KLINES_URL}?symbol={symbol}&interval={interval}&limit={bars_to_check + 1}", timeout=5
+            ).json()
+            exchange = bars_from_binance(hi, now)
+            if not len(exchange):
+                raise ValueError("无已收盘K线")
+
+            start = int(exchange["Timestamp"][0])
+            base_raw = requests.get(
+                f"{KLINES_URL}?symbol={symbol}&interval={base_interval}"
+                f"&startTime={start}&limit={len(exchange) * ratio}", timeout=5
+            ).json()
+            derived, _ = resample(bars_from_binance(base_raw, now), base_ms, step)
+
+            bad = compare_bars(derived, exchange)
+            if bad:
+                _resample_disabled.add(interval)
+                print(f"⚠️ {interval} 重采样与交易所不一致({symbol}: {bad})，改用 REST 下载")
+            else:
+                print(f"✅ {interval} 重采样对齐校验通过（{base_interval} → {interval}）")
+
+        except Exception as e:
+            _resample_disabled.add(interval)
+            logging.warning(f"{interval} 重采样对齐校验失败，改用 REST 下载: {e}")
+
+
+async def sync_resampled(symbol, interval, limit):
+    """
+    已预热的高周期：从基础周期派生新收盘K线，不发请求。
+    冷启动或派生失败（缺口 / 基础K线覆盖不到）回退 REST 增量同步。
+    """
+    base_interval = RESAMPLE_TIMEFRAMES[interval]
+    if derive_new_bars(symbol, interval, base_interval, INTERVAL_MS[interval], INTERVAL_MS[base_interval]):
+        return False
+    return await sync_incremental(symbol, interval, limit)
+
+
+async def fetch_all_async(pairs=None):
+    """pairs：需要同步的 [(symbol, interval), ...]；None 表示 monitor_symbols × timeframes 全部"""
+    if pairs is None:
+        pairs = [(s, tf) for s in monitor_symbols for tf in timeframes]
+    total_requests = len(pairs)
+    mode = "增量" if KLINE_INCREMENTAL_SYNC else "全量"
+    print(f"⏳ K线同步中({mode})... 最多请求数: {total_requests}")
 
     start_time = time.time()
 
-    time.sleep(2)
-    with ThreadPoolExecutor(max_workers=8) as exe:
-        for s in monitor_symbols:
-            for tf in timeframes:
-                limit = KLINE_LIMITS.get(tf, 301)  # 兜底默认
-                exe.submit(fetch_historical, s, tf, limit)
+    # 重采样周期依赖基础周期：先同步基础周期，再本地派生
+    rest_pairs = [(s, tf) for s, tf in pairs if not resample_enabled(tf)]
+    derived_pairs = [(s, tf) for s, tf in pairs if resample_enabled(tf)]
+
+    sync = sync_incremental if KLINE_INCREMENTAL_SYNC else fetch_historical
+    results = await asyncio.gather(*[
+        sync(s, tf, KLINE_LIMITS.get(tf, 301))  # 兜底默认
+        for s, tf in rest_pairs
+    ])
+    results += await asyncio.gather(*[
+        sync_resampled(s, tf, KLINE_LIMITS.get(tf, 301))
+        for s, tf in derived_pairs
+    ])
+
+    sent = sum(1 for r in results if r is not False)
 
     elapsed = time.time() - start_time
-    avg = elapsed / total_requests
+    avg = elapsed / sent if sent else 0
 
-    print(f"📌 历史数据初始化完成 ✓")
+    print(f"📌 K线同步完成 ✓ 实际请求数: {sent}/{total_requests} | 已用权重 {PACER.used}")
     print(f"⏱ 总耗时: {elapsed:.2f} 秒 (平均单请求: {avg:.3f} 秒)")
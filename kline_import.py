@@ -0,0 +1,251 @@
+# kline_import.py
+"""
+币安 public-data K线 ZIP/CSV 批量导入本地归档（kline_archive）
+
+官方目录结构（monthly / daily 均可，可混放）：
+    .../klines/BTCUSDT/15m/BTCUSDT-15m-2024-01.zip
+    .../klines/BTCUSDT/15m/BTCUSDT-15m-2024-02-01.zip
+
+- 多进程解析：每个文件在 worker 里流式读 CSV（zipfile），按 PARSE_CHUNK_ROWS 行一块用 np.loadtxt
+  直接解析成列，校验后写进 KLINE_DTYPE 数组，不逐行构造 Python 元组
+- 有界提交：最多 window（默认 2 × worker 数）个文件在途，按提交顺序消费；
+  主进程写归档慢时不会把整个目录的解析结果堆在内存里
+- 同一 (symbol, interval) 的文件在主进程内存里合并（monthly/daily 重叠自动去重），整组一次写入归档：
+  往已有近期K线的归档里导入更早的历史，只触发一次合并重写，而不是每个文件重写整个 .bin；
+  单组累计超过 group_bars 根时先写一次（限制内存，重写次数 = 组大小 / group_bars）
+- 校验：close_time 与周期一致、时间戳单调；导入后按归档索引报告缺口
+- 可选 --verify：与同目录 .CHECKSUM 文件比对 sha256
+
+用法：
+    python kline_import.py ./data/futures/um --intervals 15m,1h,4h --workers 8
+"""
+import os
+import re
+import io
+import sys
+import json
+import time
+import hashlib
+import zipfile
+import argparse
+import itertools
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+from kline_codec import KLINE_DTYPE, INTERVAL_MS, empty_bars
+from kline_archive import KlineArchive
+from config import KLINE_ARCHIVE_DIR
+
+FILE_RE = re.compile(
+    r"^(?P<symbol>[A-Z0-9]+)-(?P<interval>\d+[mhd])-(?P<date>\d{4}-\d{2}(?:-\d{2})?)\.(?:zip|csv)$"
+)
+PARSE_CHUNK_ROWS = 100_000
+GROUP_MAX_BARS = 2_000_000  # 单组在内存里最多攒这么多根再写（56 字节/根 ≈ 112MB）
+
+# CSV 里用到的列：open_time, open, high, low, close, volume, close_time, taker_buy_volume
+_CSV_COLS = (0, 1, 2, 3, 4, 5, 6, 9)
+_CSV_DTYPE = np.dtype([
+    ("ts", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"),
+    ("close", "<f8"), ("volume", "<f8"), ("close_ts", "<i8"), ("taker", "<f8"),
+])
+
+
+# ==========================================================
+# 文件发现
+# ==========================================================
+def discover(root: str, symbols=None, intervals=None) -> dict[tuple[str, str], list[str]]:
+    """扫描目录，返回 (symbol, interval) -> 按日期排序的文件列表"""
+    groups: dict[tuple[str, str], list[tuple[str, str]]] = {}
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            m = FILE_RE.match(name)
+            if not m:
+                continue
+            sym, tf = m["symbol"], m["interval"]
+            if tf not in INTERVAL_MS:
+                continue
+            if symbols and sym not in symbols:
+                continue
+            if intervals and tf not in intervals:
+                continue
+            groups.setdefault((sym, tf), []).append((m["date"], os.path.join(dirpath, name)))
+    # monthly "2024-01" 排在同月 daily "2024-01-05" 之前
+    return {k: [p for _, p in sorted(v)] for k, v in groups.items()}
+
+
+# ==========================================================
+# 解析（worker 进程）
+# ==========================================================
+def _open_csv(path: str):
+    if path.endswith(".zip"):
+        zf = zipfile.ZipFile(path)
+        inner = next(n for n in zf.namelist() if n.endswith(".csv"))
+        return zf, io.TextIOWrapper(zf.open(inner), encoding="utf-8", newline="")
+    f = open(path, "r", encoding="utf-8", newline="")
+    return f, f
+
+
+def _checksum_ok(path: str) -> bool | None:
+    cpath = path + ".CHECKSUM"
+    if not os.path.exists(cpath):
+        return None
+    with open(cpath, "r", encoding="utf-8") as f:
+        expected = f.read().split()[0].lower()
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest() == expected
+
+
+def _read_chunks(text, chunk_rows: int = PARSE_CHUNK_ROWS):
+    """CSV 文本流 → 每块至多 chunk_rows 行的列式数组（首行表头跳过）"""
+    first = next(text, "")
+    lines = itertools.chain([first] if first[:1].isdigit() else [], text)
+    while True:
+        block = list(itertools.islice(lines, chunk_rows))
+        if not block:
+            return
+        yield np.loadtxt(block, delimiter=",", usecols=_CSV_COLS, dtype=_CSV_DTYPE, ndmin=1)
+
+
+def parse_file(args) -> dict:
+    """
+    解析单个文件 → {"path", "bars", "rows", "invalid", "checksum"}
+    列：open_time, open, high, low, close, volume, close_time, quote_volume,
+        count, taker_buy_volume, taker_buy_quote_volume, ignore（新文件带表头）
+    """
+    path, interval, verify = args
+    step = INTERVAL_MS[interval]
+    out = {"path": path, "bars": empty_bars(), "rows": 0, "invalid": 0, "checksum": None, "error": None}
+
+    try:
+        if verify:
+            out["checksum"] = _checksum_ok(path)
+            if out["checksum"] is False:
+                out["error"] = "checksum mismatch"
+                return out
+
+        handle, text = _open_csv(path)
+        parts = []
+        with handle:
+            for chunk in _read_chunks(text):
+                ts, close_ts = chunk["ts"], chunk["close_ts"]
+                micro = ts > 10 ** 14  # 微秒时间戳
+                ts = np.where(micro, ts // 1000, ts)
+                close_ts = np.where(micro, close_ts // 1000, close_ts)
+                ok = (ts % step == 0) & (close_ts == ts + step - 1)
+                out["rows"] += len(chunk)
+                out["invalid"] += int(len(chunk) - ok.sum())
+
+                bars = np.empty(int(ok.sum()), dtype=KLINE_DTYPE)
+                bars["Timestamp"] = ts[ok]
+                for field, col in (("Open", "open"), ("High", "high"), ("Low", "low"), ("Close", "close"),
+                                   ("Volume", "volume"), ("TakerBuyVolume", "taker")):
+                    bars[field] = chunk[col][ok]
+                parts.append(bars)
+    except Exception as e:
+        out["error"] = str(e)
+        return out
+
+    if parts:
+        bars = np.concatenate(parts)
+        out["bars"] = bars[np.argsort(bars["Timestamp"], kind="stable")]
+    return out
+
+
+# ==========================================================
+# 导入（主进程：按组有序写入）
+# ==========================================================
+def import_dir(root: str, archive: KlineArchive, symbols=None, intervals=None,
+               workers: int = 4, verify: bool = False, window: int | None = None,
+               group_bars: int = GROUP_MAX_BARS) -> dict:
+    groups = discover(root, symbols, intervals)
+    total_files = sum(len(v) for v in groups.values())
+    print(f"📦 发现 {len(groups)} 个 (symbol, interval) 组合，{total_files} 个文件")
+
+    report = {"files": 0, "rows": 0, "written": 0, "invalid": 0, "errors": [], "gaps": {}}
+    remaining = {k: len(v) for k, v in groups.items()}
+    pending: dict[tuple[str, str], list[np.ndarray]] = {}
+    t0 = time.perf_counter()
+
+    def _finish(sym, tf, n_files):
+        ranges = archive.ranges(sym, tf)
+        if len(ranges) > 1:
+            step = INTERVAL_MS[tf]
+            report["gaps"][f"{sym}:{tf}"] = [[e + step, s - step] for (_, e), (s, _) in zip(ranges, ranges[1:])]
+        print(f"  ✅ {sym} {tf}: {n_files} 个文件 | 归档 {archive.index(sym, tf)['count']} 根 | "
+              f"{len(ranges)} 段连续区间")
+
+    tasks = [(p, tf, verify) for (_, tf), paths in groups.items() for p in paths]
+    owners = [key for key, paths in groups.items() for _ in paths]
+
+    def _flush(key):
+        parts = pending.pop(key, [])
+        if parts:
+            report["written"] += archive.write(*key, np.concatenate(parts))
+
+    def _consume(key, res):
+        report["files"] += 1
+        if res["error"]:
+            report["errors"].append(f"{res['path']}: {res['error']}")
+        else:
+            report["rows"] += res["rows"]
+            report["invalid"] += res["invalid"]
+            pending.setdefault(key, []).append(res["bars"])
+            if sum(len(b) for b in pending[key]) >= group_bars:
+                _flush(key)
+        remaining[key] -= 1
+        if not remaining[key]:
+            _flush(key)
+            _finish(*key, len(groups[key]))
+
+    window = window or 2 * workers
+    with Pool(workers) as pool:
+        # 有界滑动窗口：在途文件满了先消费最早提交的那个；按提交顺序消费 → 同一组合按日期依次写入
+        inflight: deque = deque()
+        for key, task in zip(owners, tasks):
+            if len(inflight) >= window:
+                k, fut = inflight.popleft()
+                _consume(k, fut.get())
+            inflight.append((key, pool.apply_async(parse_file, (task,))))
+        while inflight:
+            k, fut = inflight.popleft()
+            _consume(k, fut.get())
+
+    report["elapsed_sec"] = round(time.perf_counter() - t0, 3)
+    print(
+        f"📦 导入完成: {report['files']}/{total_files} 个文件 | {report['rows']} 行 → 新增 {report['written']} 根 | "
+        f"无效 {report['invalid']} | 失败 {len(report['errors'])} | 有缺口 {len(report['gaps'])} 组 | "
+        f"{report['elapsed_sec']} 秒"
+    )
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="导入币安 public-data K线 ZIP/CSV 到本地归档")
+    ap.add_argument("root", help="public-data 下载目录（递归扫描）")
+    ap.add_argument("--archive-dir", default=KLINE_ARCHIVE_DIR)
+    ap.add_argument("--symbols", help="逗号分隔，默认全部")
+    ap.add_argument("--intervals", help="逗号分隔，默认全部")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    ap.add_argument("--window", type=int, help="最多在途（已提交未写入）的文件数，默认 2 × workers")
+    ap.add_argument("--group-bars", type=int, default=GROUP_MAX_BARS, help="单个组合在内存里最多攒多少根再写入")
+    ap.add_argument("--verify", action="store_true", help="校验 .CHECKSUM")
+    ap.add_argument("--report", help="把导入报告写成 JSON")
+    args = ap.parse_args(argv)
+
+    split = lambda s: set(s.split(",")) if s else None
+    report = import_dir(
+        args.root, KlineArchive(args.archive_dir),
+        symbols=split(args.symbols), intervals=split(args.intervals),
+        workers=args.workers, verify=args.verify, window=args.window, group_bars=args.group_bars,
+    )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
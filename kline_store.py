@@ -0,0 +1,230 @@
+# kline_store.py
+"""
+进程内K线存储（唯一数据源）：每个 (symbol, interval) 一个固定容量环形缓冲
+
+- 记录格式同 kline_codec.KLINE_DTYPE，容量 = KLINE_LIMITS[interval] - 1（已收盘根数）
+- 镜像写入：每根同时写 slot 和 slot+capacity，窗口永远是一段连续内存，
+  view() 返回零拷贝记录数组视图，arr["Close"] 等列也是零拷贝视图；bars() 返回列式 Bars
+- Redis 只做异步 write-behind（后台线程定期把脏数据写成 kline_bin blob），
+  供前端与重启预热使用；指标计算全程不走网络
+- 同一 write-behind 线程把新收盘K线追加进本地归档（kline_archive），Redis 为空时从磁盘预热
+"""
+import time
+import logging
+import threading
+import numpy as np
+from config import KLINE_LIMITS, KLINE_ARCHIVE_ENABLED
+from kline_codec import KLINE_DTYPE, empty_bars, store_bars, append_bars, load_bars
+from kline_archive import ARCHIVE
+from bars import Bars
+
+WRITE_BEHIND_SEC = 1.0
+
+
+def capacity_for(interval: str) -> int:
+    return KLINE_LIMITS.get(interval, 301) - 1
+
+
+class _Ring:
+    __slots__ = ("capacity", "buf", "count", "head")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buf = np.zeros(2 * capacity, dtype=KLINE_DTYPE)
+        self.count = 0
+        self.head = 0  # 满载后：最旧一根所在槽位
+
+    def load(self, bars: np.ndarray):
+        bars = bars[-self.capacity:]
+        n = len(bars)
+        self.buf[:n] = bars
+        self.buf[self.capacity:self.capacity + n] = bars
+        self.count = n
+        self.head = 0
+
+    def append(self, bars: np.ndarray):
+        if len(bars) >= self.capacity:
+            self.load(bars)
+            return
+        cap = self.capacity
+        for b in bars:
+            if self.count < cap:
+                slot = self.count
+                self.count += 1
+            else:
+                slot = self.head
+                self.head = (self.head + 1) % cap
+            self.buf[slot] = b
+            self.buf[slot + cap] = b
+
+    def view(self) -> np.ndarray:
+        if self.count < self.capacity:
+            return self.buf[:self.count]
+        return self.buf[self.head:self.head + self.capacity]
+
+
+class KlineStore:
+    def __init__(self):
+        self._rings: dict[tuple[str, str], _Ring] = {}
+        self._lock = threading.Lock()
+
+        # write-behind：key -> 待写新增根数；None 表示需要整块重写
+        self._dirty: dict[tuple[str, str], int | None] = {}
+        self._flusher: threading.Thread | None = None
+
+    # ==========================================================
+    # 读
+    # ==========================================================
+    def view(self, symbol: str, interval: str) -> np.ndarray:
+        """零拷贝只读视图（按时间升序）；下一次写入前有效"""
+        ring = self._rings.get((symbol, interval))
+        if ring is None:
+            return empty_bars()
+        v = ring.view()
+        v.flags.writeable = False
+        return v
+
+    def bars(self, symbol: str, interval: str) -> Bars:
+        """列式拷贝（各字段一个连续数组），不受后续写入影响"""
+        return Bars.from_records(self.view(symbol, interval))
+
+    def last_ts(self, symbol: str, interval: str) -> int | None:
+        ring = self._rings.get((symbol, interval))
+        if ring is None or ring.count == 0:
+            return None
+        return int(ring.view()["Timestamp"][-1])
+
+    def keys(self) -> list[tuple[str, str]]:
+        return list(self._rings)
+
+    # ==========================================================
+    # 写
+    # ==========================================================
+    def _ring(self, symbol: str, interval: str) -> _Ring:
+        key = (symbol, interval)
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = _Ring(capacity_for(interval))
+        return ring
+
+    def load(self, symbol: str, interval: str, bars: np.ndarray):
+        """整段覆盖（全量加载）"""
+        with self._lock:
+            self._ring(symbol, interval).load(bars)
+            self._dirty[(symbol, interval)] = None
+
+    def merge(self, symbol: str, interval: str, bars: np.ndarray) -> int:
+        """
+        把一段K线（可更早、可与窗口重叠）并入当前窗口：在锁内读当前窗口再合并，
+        同一时间戳以存储里已有的为准，不会覆盖调用方读取之后 WebSocket 追加的新K线。返回合并后的根数
+        """
+        with self._lock:
+            ring = self._ring(symbol, interval)
+            allb = np.concatenate([ring.view(), bars]).astype(KLINE_DTYPE, copy=False)
+            _, idx = np.unique(allb["Timestamp"], return_index=True)
+            ring.load(allb[idx])
+            self._dirty[(symbol, interval)] = None
+            return ring.count
+
+    def append(self, symbol: str, interval: str, bars: np.ndarray) -> int:
+        """
+        追加新收盘K线（按时间升序）。在锁内丢弃时间戳 ≤ 最后一根的K线：
+        REST 增量同步和 WebSocket 可能同时写同一根，先写入的为准。返回实际追加根数
+        """
+        if len(bars) == 0:
+            return 0
+        with self._lock:
+            ring = self._ring(symbol, interval)
+            if ring.count:
+                bars = bars[bars["Timestamp"] > ring.view()["Timestamp"][-1]]
+                if len(bars) == 0:
+                    return 0
+            ring.append(bars)
+            key = (symbol, interval)
+            if not (key in self._dirty and self._dirty[key] is None):
+                self._dirty[key] = (self._dirty.get(key) or 0) + len(bars)
+            return len(bars)
+
+    def drop_symbol(self, symbol: str):
+        with self._lock:
+            for key in [k for k in self._rings if k[0] == symbol]:
+                self._rings.pop(key, None)
+                self._dirty.pop(key, None)
+
+    def warm_from_redis(self, symbol: str, interval: str) -> bool:
+        """重启预热：从 write-behind 留下的 blob 恢复（不标脏）"""
+        try:
+            bars = load_bars(symbol, interval, limit=capacity_for(interval))
+        except Exception as e:
+            logging.warning(f"{symbol} {interval} Redis 预热失败: {e}")
+            return False
+        if not len(bars):
+            return False
+        with self._lock:
+            self._ring(symbol, interval).load(bars)
+        return True
+
+    def warm_from_archive(self, symbol: str, interval: str) -> bool:
+        """重启预热：从本地归档尾部恢复（不标脏）"""
+        if not KLINE_ARCHIVE_ENABLED:
+            return False
+        try:
+            bars = np.array(ARCHIVE.tail(symbol, interval, capacity_for(interval)))
+        except Exception as e:
+            logging.warning(f"{symbol} {interval} 归档预热失败: {e}")
+            return False
+        if not len(bars):
+            return False
+        with self._lock:
+            self._ring(symbol, interval).load(bars)
+        return True
+
+    def warm(self, symbol: str, interval: str) -> bool:
+        return self.warm_from_redis(symbol, interval) or self.warm_from_archive(symbol, interval)
+
+    # ==========================================================
+    # write-behind
+    # ==========================================================
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            jobs = []
+            for key, n in dirty.items():
+                ring = self._rings.get(key)
+                if ring is None:
+                    continue
+                v = ring.view()
+                if n is not None and n >= len(v):
+                    n = None
+                jobs.append((key, n, (v if n is None else v[-n:]).copy()))
+
+        for (symbol, interval), n, bars in jobs:
+            try:
+                if n is None:
+                    store_bars(symbol, interval, bars)
+                else:
+                    append_bars(symbol, interval, bars, capacity_for(interval))
+            except Exception as e:
+                logging.warning(f"{symbol} {interval} K线 write-behind 失败: {e}")
+                with self._lock:
+                    # 失败后下次整块重写，保证 Redis 不出现缺口
+                    self._dirty[(symbol, interval)] = None
+
+            if KLINE_ARCHIVE_ENABLED:
+                try:
+                    ARCHIVE.write(symbol, interval, bars)
+                except Exception as e:
+                    logging.warning(f"{symbol} {interval} K线归档写入失败: {e}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(WRITE_BEHIND_SEC)
+            self.flush()
+
+    def start_write_behind(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+
+KLINE_STORE = KlineStore()
@@ -0,0 +1,214 @@
+# kline_stream.py
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+from config import monitor_symbols, timeframes, KLINE_STREAM_URL, RESAMPLE_ENABLED, RESAMPLE_TIMEFRAMES
+from database import redis_client
+from kline_fetcher import append_closed_bar
+
+# 单连接最多 1024 个 stream；单条 SUBSCRIBE 消息分块发送
+SUBSCRIBE_CHUNK = 200
+# 监控池收缩后，stream 保留多久再退订（避免 manage/scan 切换时反复退订/订阅）
+UNSUBSCRIBE_GRACE_SEC = 1800
+# 多久检查一次监控池变化
+RESUBSCRIBE_CHECK_SEC = 5
+# 断线重连退避上限
+RECONNECT_MAX_SEC = 30
+
+
+def stream_name(symbol: str, interval: str) -> str:
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+class KlineStreamIngester:
+    """
+    WebSocket K线流接收器（单连接多路复用 <symbol>@kline_<tf>）
+
+    - 只处理已收盘K线（k.x == true），直接写入K线存储
+    - 每收到一根收盘K线记一次“收盘事件”，调度器可 await wait_candle_closed()
+    - 定期比对 monitor_symbols + AI500_SYMBOLS，增量 SUBSCRIBE / UNSUBSCRIBE
+    - record_path：把原始帧追加写入 JSONL，供 FakeKlineStreamServer 回放
+    """
+
+    def __init__(self, url: str = KLINE_STREAM_URL, intervals=None, record_path: str | None = None):
+        self.url = url
+        if intervals is None:
+            # 本地重采样的高周期不必订阅，由基础周期合成
+            intervals = [tf for tf in timeframes if not (RESAMPLE_ENABLED and tf in RESAMPLE_TIMEFRAMES)]
+        self.intervals = list(intervals)
+        self.record_path = record_path
+
+        self._ws: aiohttp.ClientWebSocketResponse | None = None
+        self._subscribed: set[str] = set()
+        self._last_wanted: dict[str, float] = {}
+        self._msg_id = 0
+
+        # interval -> {open_ts: set(symbol)}：每个收盘时刻已收到的币种
+        self._closed: dict[str, dict[int, set]] = {tf: {} for tf in self.intervals}
+        self._cond = asyncio.Condition()
+
+        self.connected = False
+        self.stats = {"frames": 0, "closed_bars": 0, "written": 0, "reconnects": 0}
+
+    # ==========================================================
+    # 订阅管理
+    # ==========================================================
+    def desired_streams(self) -> set[str]:
+        symbols = list(monitor_symbols)
+        try:
+            symbols += redis_client.lrange("AI500_SYMBOLS", 0, -1)
+        except Exception:
+            pass
+        return {stream_name(s, tf) for s in dict.fromkeys(symbols) for tf in self.intervals}
+
+    async def _send(self, method: str, params: list[str]):
+        for i in range(0, len(params), SUBSCRIBE_CHUNK):
+            self._msg_id += 1
+            await self._ws.send_json({"method": method, "params": params[i:i + SUBSCRIBE_CHUNK], "id": self._msg_id})
+
+    async def sync_subscriptions(self):
+        if self._ws is None or self._ws.closed:
+            return
+
+        now = time.time()
+        desired = self.desired_streams()
+        for s in desired:
+            self._last_wanted[s] = now
+
+        to_sub = sorted(desired - self._subscribed)
+        to_unsub = sorted(
+            s for s in self._subscribed - desired
+            if now - self._last_wanted.get(s, 0) > UNSUBSCRIBE_GRACE_SEC
+        )
+
+        if to_sub:
+            await self._send("SUBSCRIBE", to_sub)
+            self._subscribed.update(to_sub)
+            print(f"📡 K线流订阅 +{len(to_sub)} | 当前 {len(self._subscribed)} 个 stream")
+        if to_unsub:
+            await self._send("UNSUBSCRIBE", to_unsub)
+            self._subscribed.difference_update(to_unsub)
+            for s in to_unsub:
+                self._last_wanted.pop(s, None)
+            print(f"📡 K线流退订 -{len(to_unsub)} | 当前 {len(self._subscribed)} 个 stream")
+
+    # ==========================================================
+    # 收盘事件
+    # ==========================================================
+    async def _notify_closed(self, symbol: str, interval: str, open_ts: int):
+        async with self._cond:
+            by_ts = self._closed.setdefault(interval, {})
+            by_ts.setdefault(open_ts, set()).add(symbol)
+            # 只保留最近几个收盘时刻
+            for old in sorted(by_ts)[:-4]:
+                del by_ts[old]
+            self._cond.notify_all()
+
+    def closed_symbols(self, interval: str, open_ts: int) -> set:
+        return set(self._closed.get(interval, {}).get(open_ts, ()))
+
+    async def wait_candle_closed(self, interval: str, open_ts: int, symbols=None, timeout: float = 5.0) -> set:
+        """
+        等待 open_ts 这根 interval K线收盘推送到达。
+        symbols 为空：收到任意一个币种即返回；否则等全部到齐或超时。
+        返回已到达的币种集合（超时返回当前已到达部分）。
+        """
+        want = set(symbols or ())
+
+        def _ready():
+            got = self._closed.get(interval, {}).get(open_ts, set())
+            return got >= want if want else bool(got)
+
+        try:
+            async with self._cond:
+                await asyncio.wait_for(self._cond.wait_for(_ready), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.closed_symbols(interval, open_ts)
+
+    # ==========================================================
+    # 帧处理
+    # ==========================================================
+    async def handle_frame(self, raw: str):
+        self.stats["frames"] += 1
+        if self.record_path:
+            try:
+                with open(self.record_path, "a", encoding="utf-8") as f:
+                    f.write(raw.rstrip("\n") + "\n")
+            except Exception as e:
+                logging.warning(f"K线流录制失败: {e}")
+
+        try:
+            msg = json.loads(raw)
+        except Exception:
+            return
+
+        data = msg.get("data") if isinstance(msg, dict) else None
+        if not data or data.get("e") != "kline":
+            return
+
+        k = data.get("k") or {}
+        if not k.get("x"):
+            return
+
+        symbol = k.get("s") or data.get("s")
+        interval = k.get("i")
+        open_ts = int(k["t"])
+        self.stats["closed_bars"] += 1
+
+        if append_closed_bar(symbol, interval, open_ts, k["o"], k["h"], k["l"], k["c"], k["v"], k["V"]):
+            self.stats["written"] += 1
+
+        await self._notify_closed(symbol, interval, open_ts)
+
+    # ==========================================================
+    # 主循环
+    # ==========================================================
+    async def _resubscribe_loop(self):
+        while True:
+            await asyncio.sleep(RESUBSCRIBE_CHECK_SEC)
+            try:
+                await self.sync_subscriptions()
+            except Exception as e:
+                logging.warning(f"K线流订阅同步失败: {e}")
+
+    async def run(self, session: aiohttp.ClientSession):
+        backoff = 1
+        while True:
+            watcher = None
+            try:
+                async with session.ws_connect(self.url, heartbeat=60) as ws:
+                    self._ws = ws
+                    self._subscribed.clear()
+                    self.connected = True
+                    backoff = 1
+                    print(f"📡 K线流已连接: {self.url}")
+
+                    await self.sync_subscriptions()
+                    watcher = asyncio.create_task(self._resubscribe_loop())
+
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            await self.handle_frame(msg.data)
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"K线流连接异常: {e}")
+            finally:
+                self.connected = False
+                self._ws = None
+                if watcher:
+                    watcher.cancel()
+
+            self.stats["reconnects"] += 1
+            print(f"⚠️ K线流断开，{backoff} 秒后重连")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_MAX_SEC)
+
+
+INGESTER = KlineStreamIngester()
@@ -0,0 +1,110 @@
+# kline_stream_fake.py
+"""
+本地假 K线流服务器：回放录制的原始帧（JSONL，每行一帧，格式同币安 combined stream）
+
+用法：
+    server = FakeKlineStreamServer(frames)      # frames: list[str|dict] 或 JSONL 路径
+    url = await server.start()                  # ws://127.0.0.1:<port>/stream
+    ingester = KlineStreamIngester(url=url)
+    ...
+    await server.stop()
+
+行为：
+  - 支持 SUBSCRIBE / UNSUBSCRIBE / LIST_SUBSCRIPTIONS，应答 {"result": ..., "id": ...}
+  - 客户端订阅后，按顺序回放其已订阅 stream 的帧（interval 秒间隔，0=尽快）
+  - replay() 可在运行中向所有连接再推一批帧
+"""
+import json
+import asyncio
+from aiohttp import web, WSMsgType
+
+
+def load_frames(source) -> list[dict]:
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    return [json.loads(x) if isinstance(x, str) else x for x in (source or [])]
+
+
+class FakeKlineStreamServer:
+    def __init__(self, frames=None, host: str = "127.0.0.1", port: int = 0, interval: float = 0.0):
+        self.frames = load_frames(frames)
+        self.host = host
+        self.port = port
+        self.interval = interval
+
+        self._runner: web.AppRunner | None = None
+        self._clients: dict[web.WebSocketResponse, set] = {}
+        self.requests: list[dict] = []   # 收到的全部订阅请求（便于断言）
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/stream"
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/stream", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def stop(self):
+        for ws in list(self._clients):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def drop_connections(self):
+        """模拟服务端断线"""
+        for ws in list(self._clients):
+            await ws.close()
+
+    async def replay(self, frames=None):
+        frames = load_frames(frames) if frames is not None else self.frames
+        for ws, subs in list(self._clients.items()):
+            await self._send_frames(ws, subs, frames)
+
+    async def _send_frames(self, ws, subs: set, frames: list[dict]):
+        for fr in frames:
+            if ws.closed:
+                return
+            if fr.get("stream") not in subs:
+                continue
+            await ws.send_str(json.dumps(fr))
+            if self.interval:
+                await asyncio.sleep(self.interval)
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subs: set = set()
+        self._clients[ws] = subs
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                req = json.loads(msg.data)
+                self.requests.append(req)
+                method = req.get("method")
+                params = req.get("params") or []
+
+                if method == "SUBSCRIBE":
+                    new = [p for p in params if p not in subs]
+                    subs.update(params)
+                    await ws.send_json({"result": None, "id": req.get("id")})
+                    await self._send_frames(ws, set(new), self.frames)
+                elif method == "UNSUBSCRIBE":
+                    subs.difference_update(params)
+                    await ws.send_json({"result": None, "id": req.get("id")})
+                elif method == "LIST_SUBSCRIPTIONS":
+                    await ws.send_json({"result": sorted(subs), "id": req.get("id")})
+        finally:
+            self._clients.pop(ws, None)
+
+        return ws
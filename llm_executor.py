@@ -0,0 +1,167 @@
+# llm_executor.py
+"""
+对冲 + 截止时间感知的 LLM 请求执行器
+
+- 整轮一个 RoundBudget：截止时间（LLM_ROUND_DEADLINE_SEC，从各批请求发出前开始算，不含过滤 / 预加载）+ 全轮共享的重试额度
+  （LLM_RETRY_BUDGET，对冲请求和失败重试都从这里扣），每次尝试的超时 = 距截止时间的剩余秒数，
+  不再是固定 15/30/45 秒 + 递增 sleep
+- 对冲：最近一次尝试超过近期成功请求的 p90 耗时（至少 LLM_HEDGE_MIN_DELAY_SEC）仍未返回，
+  再发一份相同请求，先成功的胜出，其余取消（aiohttp 连接随之关闭）
+- 失败：还有其它尝试在跑就继续等；都失败了且额度、剩余时间（≥ LLM_MIN_ATTEMPT_SEC）够才重试
+- 流式决策：同一批次里先产出决策的尝试“拿到”这一批（其余尝试取消）；
+  同一币种只分发一次，避免重试 / 对冲产出不一样的动作时重复下单
+- 每次尝试记录 {attempt, hedge, start_ms, ms, outcome}（相对本批开始，请求函数可补充 endpoint 等），随结果返回
+"""
+import time
+import asyncio
+from collections import deque
+from config import (
+    LLM_HEDGE_ENABLED, LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_MIN_DELAY_SEC,
+    LLM_RETRY_BUDGET, LLM_MIN_ATTEMPT_SEC, LLM_LATENCY_WINDOW,
+)
+
+
+class RoundBudget:
+    """一轮投喂的截止时间 + 共享重试额度"""
+
+    def __init__(self, deadline_sec: float, retries: int = LLM_RETRY_BUDGET):
+        self.deadline = time.perf_counter() + deadline_sec
+        self.retries = retries
+        self.used = 0
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def take_retry(self) -> bool:
+        if self.used >= self.retries or self.remaining() < LLM_MIN_ATTEMPT_SEC:
+            return False
+        self.used += 1
+        return True
+
+
+class AttemptError(Exception):
+    """单次尝试失败；timeout 标记是否为超时"""
+
+    def __init__(self, msg: str, timeout: bool = False):
+        super().__init__(msg)
+        self.timeout = timeout
+
+
+class HedgedExecutor:
+    def __init__(self):
+        # 近期成功请求耗时（秒），用于对冲阈值
+        self.latencies: deque[float] = deque(maxlen=LLM_LATENCY_WINDOW)
+
+    def hedge_delay(self) -> float | None:
+        if not LLM_HEDGE_ENABLED or len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        values = sorted(self.latencies)
+        p90 = values[min(len(values) - 1, int(0.9 * len(values)))]
+        return max(p90, LLM_HEDGE_MIN_DELAY_SEC)
+
+    async def run(self, attempt_fn, budget: RoundBudget, batch_idx: int, on_decision=None) -> tuple:
+        """
+        attempt_fn(rec, timeout_sec, on_decision) -> 结果（异常 = 本次失败）
+            rec：本次尝试记录（attempt / hedge），attempt_fn 可补充字段（如所用端点）
+        返回 (结果 | None, 最后一个错误 | None, 各次尝试记录)
+        """
+        t0 = time.perf_counter()
+        attempts: list[dict] = []
+        running: dict[asyncio.Task, dict] = {}
+        owner = None
+        dispatched: set = set()
+        last_error = None
+        hedge_at = self.hedge_delay()
+        last_launch = t0
+
+        def ms(t: float) -> float:
+            return round((t - t0) * 1000, 2)
+
+        def guard(rec: dict):
+            """同一批次只认一个尝试的决策，同一币种只分发一次"""
+            def cb(decision: dict):
+                nonlocal owner
+                if owner is None:
+                    owner = rec
+                    for task, other in running.items():
+                        if other is not rec:
+                            other["outcome"] = "cancelled"
+                            task.cancel()
+                if owner is not rec or on_decision is None:
+                    return
+                sym = decision.get("symbol")
+                if sym in dispatched:
+                    return
+                dispatched.add(sym)
+                on_decision(decision)
+            return cb
+
+        def launch(hedge: bool):
+            nonlocal last_launch
+            last_launch = time.perf_counter()
+            rec = {"attempt": len(attempts) + 1, "hedge": hedge, "start_ms": ms(time.perf_counter()),
+                   "ms": None, "outcome": "running"}
+            attempts.append(rec)
+            task = asyncio.create_task(attempt_fn(rec, budget.remaining(), guard(rec)))
+            running[task] = rec
+            if hedge:
+                print(f"🪁 批次 {batch_idx} 超过 p90（{round(hedge_at, 2)}s）未返回，发送对冲请求")
+
+        launch(False)
+        hedged = False
+        try:
+            while running:
+                now = time.perf_counter()
+                wait_for = budget.remaining()
+                hedge_due = hedge_at is not None and not hedged and owner is None
+                if hedge_due:
+                    wait_for = min(wait_for, max(0.0, last_launch + hedge_at - now))
+
+                done, _ = await asyncio.wait(running, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if budget.remaining() <= 0:
+                        last_error = AttemptError(f"批次 {batch_idx} 超过本轮截止时间", timeout=True)
+                        break
+                    hedged = True  # 到对冲时间：额度够才真正发
+                    if budget.take_retry():
+                        launch(True)
+                    continue
+
+                for task in done:
+                    rec = running.pop(task)
+                    rec["ms"] = round(ms(time.perf_counter()) - rec["start_ms"], 2)
+                    if task.cancelled():
+                        rec["outcome"] = "cancelled"
+                        continue
+                    err = task.exception()
+                    if err is None and owner is not None and rec is not owner:
+                        rec["outcome"] = "cancelled"  # 决策已由另一个尝试分发，以它为准
+                        continue
+                    if err is None:
+                        rec["outcome"] = "ok"
+                        self.latencies.append(rec["ms"] / 1000)
+                        return task.result(), None, attempts
+                    rec["outcome"] = "timeout" if getattr(err, "timeout", False) or isinstance(err, asyncio.TimeoutError) else "error"
+                    rec["error"] = str(err) or type(err).__name__
+                    last_error = err
+                    if rec is owner:
+                        owner = None  # 拿到批次的尝试失败：后续尝试可继续分发（已分发币种不重复）
+
+                if not running:
+                    if not budget.take_retry():
+                        break
+                    await asyncio.sleep(min(0.5 * len(attempts), max(0.0, budget.remaining() - LLM_MIN_ATTEMPT_SEC)))
+                    launch(False)
+        finally:
+            for task, rec in running.items():
+                rec["outcome"] = "cancelled"
+                rec["ms"] = round(ms(time.perf_counter()) - rec["start_ms"], 2)
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return None, last_error, attempts
+
+
+LLM_EXECUTOR = HedgedExecutor()
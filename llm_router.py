@@ -0,0 +1,156 @@
+# llm_router.py
+"""
+多端点 LLM 路由：在若干 OpenAI 兼容的 (url, model, key) 之间按实时表现选路，连续失败的端点熔断
+
+- 每个端点维护 EWMA（系数 LLM_EWMA_ALPHA）：
+    ttfb_ms      首个 token 到达耗时（流式；非流式记 0，耗时全部算进吞吐）
+    tps          输出 token / 秒（按 referee_gate.estimate_tokens 估算输出长度）
+    latency_ms   整次请求耗时
+    error        失败率（成功记 0、失败记 1）
+- 选路：预计耗时 = ttfb + 预计输出 token / tps（没有吞吐样本时用 latency），
+  再乘 (1 + 4 × 失败率) × (1 + 0.5 × 该端点在途请求数)；从没被选过的端点优先试一次
+- 被取消的请求（对冲输掉）按删失样本记：已耗时是延迟的下界，慢端点不会一直被当成“未探索”
+- 熔断：连续失败 LLM_BREAKER_FAILURES 次 → 打开 LLM_BREAKER_COOLDOWN_SEC 秒，期间不参与选路；
+  冷却后半开，只放一个探测请求：成功关闭，失败重新打开。全部端点都熔断时选最早打开的那个（不丢整轮）
+- 对冲 / 重试时排除本批次已在用或已失败的端点（没有别的可选时才复用）
+"""
+import time
+from config import LLM_ENDPOINTS, LLM_EWMA_ALPHA, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SEC
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _ewma(old: float | None, x: float) -> float:
+    return x if old is None else old + LLM_EWMA_ALPHA * (x - old)
+
+
+class Endpoint:
+    def __init__(self, name: str, url: str, model: str, api_key: str):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+
+        self.ttfb_ms: float | None = None
+        self.tps: float | None = None
+        self.latency_ms: float | None = None
+        self.error = 0.0
+        self.requests = 0        # 有结果的请求（成功 / 失败 / 被取消）
+        self.picks = 0           # 被选中次数（含还没有结果的）
+        self.inflight = 0
+
+        self.state = CLOSED
+        self.failures = 0        # 连续失败次数
+        self.opened_at = 0.0
+
+    def available(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return now - self.opened_at >= LLM_BREAKER_COOLDOWN_SEC
+        return False  # 半开：探测请求还没回来
+
+    def expected_ms(self, out_tokens: float | None) -> float:
+        if self.latency_ms is None:
+            # 从没被选过：优先探索（只探索一次）；探索还没结果 / 只失败过：排到最后
+            return 0.0 if self.picks == 0 else float("inf")
+        if self.tps and out_tokens:
+            base = (self.ttfb_ms or 0.0) + out_tokens / self.tps * 1000
+        else:
+            base = self.latency_ms
+        return base * (1 + 4 * self.error) * (1 + 0.5 * self.inflight)
+
+    def summary(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "requests": self.requests,
+            "picks": self.picks,
+            "inflight": self.inflight,
+            "ttfb_ms": round(self.ttfb_ms, 1) if self.ttfb_ms is not None else None,
+            "tps": round(self.tps, 1) if self.tps is not None else None,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "error": round(self.error, 3),
+        }
+
+
+class LLMRouter:
+    def __init__(self, endpoints: list[dict] = LLM_ENDPOINTS):
+        if not endpoints:
+            raise ValueError("LLM_ENDPOINTS 不能为空")
+        self.endpoints = [
+            Endpoint(e.get("name") or e["url"], e["url"], e["model"], e.get("api_key", ""))
+            for e in endpoints
+        ]
+        self.out_tokens: float | None = None  # 全端点的输出 token EWMA，用来估算本次预计耗时
+
+    def get(self, name: str) -> Endpoint | None:
+        return next((e for e in self.endpoints if e.name == name), None)
+
+    # ------------------------------
+    # 选路
+    # ------------------------------
+    def pick(self, exclude=()) -> Endpoint:
+        """选一个端点并占用（inflight +1），用完必须 release"""
+        now = time.time()
+        healthy = [e for e in self.endpoints if e.available(now)]
+        candidates = [e for e in healthy if e.name not in exclude] or healthy
+        if candidates:
+            ep = min(candidates, key=lambda e: e.expected_ms(self.out_tokens))
+        else:
+            ep = min(self.endpoints, key=lambda e: e.opened_at)
+        if ep.state == OPEN:
+            ep.state = HALF_OPEN
+            print(f"🔌 LLM 端点 {ep.name} 半开，发送探测请求")
+        ep.picks += 1
+        ep.inflight += 1
+        return ep
+
+    def release(self, ep: Endpoint):
+        ep.inflight = max(0, ep.inflight - 1)
+        if ep.state == HALF_OPEN:
+            ep.state = OPEN  # 探测请求被取消、没有结果：冷却已过，下次选路再探测
+
+    # ------------------------------
+    # 反馈
+    # ------------------------------
+    def success(self, ep: Endpoint, latency_ms: float, ttfb_ms: float, out_tokens: int):
+        ep.requests += 1
+        ep.latency_ms = _ewma(ep.latency_ms, latency_ms)
+        ep.ttfb_ms = _ewma(ep.ttfb_ms, ttfb_ms)
+        gen_sec = (latency_ms - ttfb_ms) / 1000
+        if out_tokens and gen_sec > 0:
+            ep.tps = _ewma(ep.tps, out_tokens / gen_sec)
+            self.out_tokens = _ewma(self.out_tokens, out_tokens)
+        ep.error = _ewma(ep.error, 0.0)
+        ep.failures = 0
+        if ep.state != CLOSED:
+            print(f"✅ LLM 端点 {ep.name} 恢复，熔断关闭")
+            ep.state = CLOSED
+
+    def cancelled(self, ep: Endpoint, elapsed_ms: float, ttfb_ms: float | None = None):
+        """
+        被取消（对冲输掉 / 截止时间到）：删失样本，只知道真实耗时 ≥ elapsed_ms。
+        用 max(elapsed, 当前估计) 更新延迟；首 token 还没到时首 token 耗时同样按下界更新。不计失败
+        """
+        ep.requests += 1
+        ep.latency_ms = _ewma(ep.latency_ms, max(elapsed_ms, ep.latency_ms or 0.0))
+        if ttfb_ms is None:
+            ep.ttfb_ms = _ewma(ep.ttfb_ms, max(elapsed_ms, ep.ttfb_ms or 0.0))
+
+    def failure(self, ep: Endpoint, reason: str = ""):
+        ep.requests += 1
+        ep.error = _ewma(ep.error, 1.0)
+        ep.failures += 1
+        if ep.state == HALF_OPEN or (ep.state == CLOSED and ep.failures >= LLM_BREAKER_FAILURES):
+            ep.state = OPEN
+            ep.opened_at = time.time()
+            print(f"🧯 LLM 端点 {ep.name} 熔断 {LLM_BREAKER_COOLDOWN_SEC}s（连续失败 {ep.failures} 次）{reason}")
+
+    def summary(self) -> list[dict]:
+        return [e.summary() for e in self.endpoints]
+
+
+LLM_ROUTER = LLMRouter()
@@ -0,0 +1,127 @@
+# llm_stub_server.py
+"""
+本地假 LLM 服务（OpenAI 兼容 /v1/chat/completions），用于在没有真实中转的情况下测试路由 / 对冲 / 流式解析
+
+用法：
+    server = StubLLMServer(latency=0.5, tps=200, fail_rate=0.1)
+    url = await server.start()                  # http://127.0.0.1:<port>/v1/chat/completions
+    config.LLM_ENDPOINTS = [{"name": "stub", "url": url, "model": "stub", "api_key": "x"}, ...]
+    ...
+    await server.stop()
+
+行为：
+  - latency：首个 token 前的等待秒数（数字，或 callable(请求序号) -> 秒，便于注入抖动 / 长尾）
+  - tps：流式输出速度（字符数 / 4 算 token）；0 = 一次性输出
+  - fail_rate / fail_status：按概率返回错误状态码；hang=True 时只等待不返回（模拟卡死）
+  - drop_after：流式推送 N 个分片后直接断开连接（模拟输出到一半中转挂掉）
+  - 回复：默认对用户消息 <JSON> 里的每个币种给一条 wait 决策；可传 reply=callable(请求 JSON) -> 文本
+  - stream=true 按 SSE 分片推送（data: {...} / data: [DONE]），否则返回完整 chat.completion
+  - 收到的请求体记录在 requests 里（便于断言）
+"""
+import re
+import json
+import random
+import asyncio
+from aiohttp import web
+
+
+def default_reply(body: dict) -> str:
+    """对 <JSON> 里的每个币种给一条 wait 决策"""
+    text = (body.get("messages") or [{}])[-1].get("content") or ""
+    symbols = []
+    m = re.search(r"<JSON>([\s\S]*?)</JSON>", text)
+    if m:
+        try:
+            symbols = list(json.loads(m.group(1)).get("markets", {}))
+        except Exception:
+            pass
+    decisions = [{"symbol": s, "action": "wait", "confidence": 0.5} for s in symbols]
+    return (
+        f"<reasoning>stub: {len(symbols)} 个币种，无明确结构信号。</reasoning>\n"
+        f"<decision>{json.dumps(decisions, ensure_ascii=False)}</decision>"
+    )
+
+
+class StubLLMServer:
+    def __init__(self, latency=0.0, tps: float = 0.0, fail_rate: float = 0.0, fail_status: int = 503,
+                 hang: bool = False, reply=None, host: str = "127.0.0.1", port: int = 0, seed: int | None = None,
+                 drop_after: int | None = None):
+        self.latency = latency
+        self.tps = tps
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.hang = hang
+        self.drop_after = drop_after
+        self.reply = reply or default_reply
+        self.host = host
+        self.port = port
+        self._rng = random.Random(seed)
+
+        self._runner: web.AppRunner | None = None
+        self.requests: list[dict] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1/chat/completions"
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _delay(self, n: int) -> float:
+        return self.latency(n) if callable(self.latency) else float(self.latency)
+
+    async def _handle(self, request: web.Request):
+        body = await request.json()
+        n = len(self.requests)
+        self.requests.append(body)
+
+        if self.hang:
+            await asyncio.sleep(3600)
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            return web.Response(status=self.fail_status, text="stub failure")
+
+        await asyncio.sleep(self._delay(n))
+        text = self.reply(body)
+        model = body.get("model")
+
+        if not body.get("stream"):
+            if self.tps:
+                await asyncio.sleep(len(text) / 4 / self.tps)
+            return web.json_response({
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            })
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        step = 64
+        try:
+            await resp.prepare(request)
+            for i in range(0, len(text), step):
+                if self.drop_after is not None and i // step >= self.drop_after:
+                    request.transport.close()
+                    return resp
+                chunk = {"object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}]}
+                await resp.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                if self.tps:
+                    await asyncio.sleep(step / 4 / self.tps)
+            done = {"object": "chat.completion.chunk", "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            await resp.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+        except ConnectionResetError:
+            pass  # 客户端已断开（被取消的对冲 / 超时请求）
+        return resp
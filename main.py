@@ -2,24 +2,34 @@ import threading
 import asyncio
 from notifier import message_worker
 from database import clear_redis
-from kline_fetcher import fetch_all
+from kline_fetcher import verify_resample_alignment
 from indicators import calculate_signal
 from config import monitor_symbols, timeframes
 from scheduler import schedule_loop_async
 from api_history import run_api_server
 from ai500 import update_oi_symbols
-from deepseek_batch_pusher import init_http_session, close_http_session
+from deepseek_batch_pusher import init_http_session, close_http_session, get_http_session
+from config import KLINE_STREAM_ENABLED
+from kline_stream import INGESTER
+from kline_store import KLINE_STORE
 
 async def main_async():
     # ⭐⭐⭐ 1. 启动时初始化全局 HTTP Session（只一次）
     await init_http_session()
 
+    # 📡 K线 WebSocket 流（复用全局 Session）
+    stream_task = None
+    if KLINE_STREAM_ENABLED:
+        stream_task = asyncio.create_task(INGESTER.run(await get_http_session()))
+
     try:
         # 并行启动异步调度循环（你现在只有一个，也保持不变）
         await asyncio.gather(
             schedule_loop_async()
         )
     finally:
+        if stream_task:
+            stream_task.cancel()
         # ⭐⭐⭐ 2. 程序退出时优雅关闭 Session
         await close_http_session()
 
@@ -32,15 +42,22 @@ def main():
 
     print("🌐 API History 服务已启动: http://localhost:8600")
 
-    # 清空 Redis
+    # 清空 Redis（K线 blob 保留，用于重启预热）
     clear_redis()
 
+    # K线存储 Redis write-behind
+    KLINE_STORE.start_write_behind()
+
     # 启动消息推送线程
     threading.Thread(target=message_worker, daemon=True).start()
 
     # 启动 ai500 定时任务
     update_oi_symbols()
 
+    # 高周期重采样：启动时校验与交易所K线对齐
+    if monitor_symbols:
+        verify_resample_alignment(monitor_symbols[0])
+
     print("⏳ 启动异步调度循环")
 
     try:
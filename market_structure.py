@@ -1,5 +1,25 @@
 # market_structure.py
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
+from collections import deque
+from itertools import islice
+import numpy as np
+from bars import Bars, as_bars
+
+
+def _window_max(a: np.ndarray, s: int) -> np.ndarray:
+    """
+    沿 axis=0 的滑动窗口最大值：out[j] = a[j : j + s].max(axis=0)
+    倍增：先两两取大得到宽 2、4、8… 的窗口（错位切片都是视图），最后用两个重叠窗口拼出宽 s，
+    只需 log2(s) + 1 次向量比较
+    """
+    m, p = a, 1
+    while p * 2 <= s:
+        m = np.maximum(m[:-p], m[p:])
+        p *= 2
+    if p < s:
+        m = np.maximum(m[: len(m) - (s - p)], m[s - p :])
+    return m
+
 
 class MarketStructure:
     """
@@ -28,95 +48,67 @@ class MarketStructure:
     # ==========================================================
     # 内部工具：pivot 检测（允许同价，但只认窗口内最靠右的极值）
     # ==========================================================
-    def _pivot_high(self, highs: List[float], idx: int) -> bool:
-        s = self.swing_size
-        if idx < s or idx + s >= len(highs):
-            return False
-        window = highs[idx - s : idx + s + 1]
-        h = highs[idx]
-        m = max(window)
-        if h != m:
-            return False
-        # 只认“最靠右”的最大值：若窗口内最大值最后一次出现的位置不是中心，则不认
-        last_pos = max(i for i, v in enumerate(window) if v == m)
-        return last_pos == s
-
-    def _pivot_low(self, lows: List[float], idx: int) -> bool:
+    def _find_pivots(self, highs: np.ndarray, lows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        向量化 pivot 检测，返回原始 pivots 数组 (is_high, index, price)，按 index 排序、同 index 先 H 后 L。
+        “最靠右的极值”：中心 >= 左侧 s 根的最大值，且 > 右侧 s 根的最大值（pivot low 对称）。
+        """
         s = self.swing_size
-        if idx < s or idx + s >= len(lows):
-            return False
-        window = lows[idx - s : idx + s + 1]
-        l = lows[idx]
-        m = min(window)
-        if l != m:
-            return False
-        # 只认“最靠右”的最小值
-        last_pos = max(i for i, v in enumerate(window) if v == m)
-        return last_pos == s
+        n = len(highs)
+        # 高低点交错放进一个 (n, 2) 数组，低点取负号统一成“取最大”：两列一起做窗口比较，
+        # 展平后的位置 k = 2 * (i - s) + 列号，天然按 index 排序且同 index 先 H 后 L
+        hl = np.empty((n, 2))
+        hl[:, 0] = highs
+        np.negative(lows, out=hl[:, 1])
+
+        # win[j] = max(hl[j : j + s])；中心 i 的左窗口为 win[i - s]，右窗口为 win[i + 1]
+        win = _window_max(hl, s)
+        center = hl[s : n - s]
+        k = np.flatnonzero((center >= win[: n - 2 * s]) & (center > win[s + 1 :]))
+
+        is_high = (k & 1) == 0
+        value = hl.ravel()[k + 2 * s]
+        return is_high, (k >> 1) + s, np.where(is_high, value, -value)
 
     # ==========================================================
     # pivot 清洗：同index冲突 & 连续同类型去重
     # ==========================================================
     def _resolve_same_index_conflict(
-        self,
-        pivots: List[Tuple[str, int, float]],
-        highs: List[float],
-        lows: List[float],
-    ) -> List[Tuple[str, int, float]]:
+        self, is_high: np.ndarray, idx: np.ndarray, price: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        若同一 index 同时被标为 H 与 L（极端波动K可能发生），只保留更“极端”的那个：
-        简化规则：保留振幅更极端的一端（优先保留 H；你也可以按策略改成保留 L 或按趋势偏好选择）
+        若同一 index 同时被标为 H 与 L（极端波动K可能发生），只保留一个：
+        默认优先保留 H（你可按需求调整）。输入已按 index 排序且同 index 先 H 后 L，保留每个 index 的第一个即可。
         """
-        by_idx: Dict[int, List[Tuple[str, int, float]]] = {}
-        for p in pivots:
-            by_idx.setdefault(p[1], []).append(p)
-
-        out: List[Tuple[str, int, float]] = []
-        for idx in sorted(by_idx.keys()):
-            ps = by_idx[idx]
-            if len(ps) == 1:
-                out.append(ps[0])
-                continue
-
-            # 理论上同价+最右规则后很少发生，但保底处理：
-            # 默认优先保留 H（你可按需求调整）
-            pick = None
-            for p in ps:
-                if p[0] == "H":
-                    pick = p
-                    break
-            if pick is None:
-                # 没有 H 就保留第一个
-                pick = ps[0]
-            out.append(pick)
-
-        return out
+        if len(idx) < 2:
+            return is_high, idx, price
+        keep = np.empty(len(idx), dtype=bool)
+        keep[0] = True
+        np.not_equal(idx[1:], idx[:-1], out=keep[1:])
+        return is_high[keep], idx[keep], price[keep]
 
     def _dedupe_consecutive_same_type(
-        self, pivots: List[Tuple[str, int, float]]
-    ) -> List[Tuple[str, int, float]]:
+        self, is_high: np.ndarray, idx: np.ndarray, price: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
         连续同类型 pivot 去重：保留更“极端”的那个
         - 连续 H：保留价格更高的 H
         - 连续 L：保留价格更低的 L
+        同价时保留先出现的那个。
         """
-        if not pivots:
-            return pivots
-        out = [pivots[0]]
-        for p in pivots[1:]:
-            last = out[-1]
-            if p[0] != last[0]:
-                out.append(p)
-                continue
-
-            # same type
-            if p[0] == "H":
-                if p[2] > last[2]:
-                    out[-1] = p
-            else:
-                if p[2] < last[2]:
-                    out[-1] = p
-        return out
+        if len(idx) < 2:
+            return is_high, idx, price
+        new_run = np.empty(len(idx), dtype=bool)
+        new_run[0] = True
+        np.not_equal(is_high[1:], is_high[:-1], out=new_run[1:])
+        if new_run.all():
+            return is_high, idx, price  # H / L 已交替（最常见）
+
+        # 按 (连续段, 极端程度) 稳定排序，每段排第一的就是该段最极端、同价时最先出现的那个；
+        # H 取负号、L 保持原值，统一成“越小越极端”
+        run_id = new_run.cumsum()
+        keep = np.lexsort((np.where(is_high, -price, price), run_id))[np.flatnonzero(new_run)]
+        return is_high[keep], idx[keep], price[keep]
 
     # ==========================================================
     # 结构点 tag（HH/HL/LH/LL）
@@ -214,38 +206,45 @@ class MarketStructure:
     # ==========================================================
     # 主分析函数
     # ==========================================================
-    def analyze(self, rows: List[Dict]) -> Dict:
+    def analyze(self, rows: Union[Bars, List[Dict]]) -> Dict:
+        """rows：列式 Bars；kline_codec 记录数组 / 逐根 dict 行经 as_bars 转换"""
         min_len = self.swing_size * 2 + 1
         if len(rows) < min_len:
             return {"valid": False, "reason": "not_enough_rows", "need": min_len, "have": len(rows)}
 
-        highs = [float(k["High"]) for k in rows]
-        lows = [float(k["Low"]) for k in rows]
-        closes = [float(k["Close"]) for k in rows]
-
-        raw_pivots: List[Tuple[str, int, float]] = []
+        bars = as_bars(rows)
+        highs = np.ascontiguousarray(bars.high, dtype=float)
+        lows = np.ascontiguousarray(bars.low, dtype=float)
+        last_close = float(bars.close[-1])
 
         # 1) 找 pivot highs / lows（允许同index都进raw，后面清洗）
-        for i in range(len(rows)):
-            if self._pivot_high(highs, i):
-                raw_pivots.append(("H", i, highs[i]))
-            if self._pivot_low(lows, i):
-                raw_pivots.append(("L", i, lows[i]))
+        raw = self._find_pivots(highs, lows)
+        pivots_found = len(raw[1])
 
-        if len(raw_pivots) < 4:
-            return {"valid": False, "reason": "not_enough_pivots_raw", "pivots_found": len(raw_pivots)}
+        if pivots_found < 4:
+            return {"valid": False, "reason": "not_enough_pivots_raw", "pivots_found": pivots_found}
 
         # 2) pivot 清洗
-        pivots = self._resolve_same_index_conflict(raw_pivots, highs, lows)
-        pivots = sorted(pivots, key=lambda x: x[1])
-        pivots = self._dedupe_consecutive_same_type(pivots)
+        clean = self._resolve_same_index_conflict(*raw)
+        is_high, idx, price = self._dedupe_consecutive_same_type(*clean)
 
-        if len(pivots) < 4:
-            return {"valid": False, "reason": "not_enough_pivots_clean", "pivots_used": len(pivots)}
+        if len(idx) < 4:
+            return {"valid": False, "reason": "not_enough_pivots_clean", "pivots_used": len(idx)}
 
         # 3) 只保留最近 pivots（防结构过期）
-        pivots = pivots[-self.keep_pivots :]
+        k = self.keep_pivots
+        pivots: List[Tuple[str, int, float]] = [
+            ("H" if h else "L", i, p)
+            for h, i, p in zip(is_high[-k:].tolist(), idx[-k:].tolist(), price[-k:].tolist())
+        ]
 
+        return self._summarize(pivots, last_close, pivots_found, len(rows))
+
+    # ==========================================================
+    # 4~8) 由清洗后的最近 pivots 得到结构摘要（analyze 与增量版共用）
+    # ==========================================================
+    def _summarize(self, pivots: List[Tuple[str, int, float]], last_close: float,
+                   pivots_found: int, rows_used: int) -> Dict:
         # 4) 标注 HH/HL/LH/LL
         structure_points = self._tag_structure(pivots)
 
@@ -256,7 +255,6 @@ class MarketStructure:
         range_high, range_low = self._range_bounds(structure_points)
 
         # 7) BOS / CHoCH 检测（基于最后 close）
-        last_close = closes[-1]
         last_break = "none"
 
         # 最近 swing（用于回显/调试）
@@ -327,8 +325,145 @@ class MarketStructure:
                 "keep_pivots": self.keep_pivots,
                 "trend_vote_lookback": self.trend_vote_lookback,
                 "range_pivot_k": self.range_pivot_k,
-                "pivots_found": len(raw_pivots),
+                "pivots_found": pivots_found,
                 "pivots_used": len(pivots),
-                "rows_used": len(rows),
+                "rows_used": rows_used,
             },
         }
+
+
+class IncrementalMarketStructure(MarketStructure):
+    """
+    增量结构识别：按 (symbol, interval) 常驻，输出与 analyze(同一窗口) 完全一致
+
+    pivot 要等右侧 swing_size 根收盘才确认，且是否为 pivot 只取决于它左右各 s 根K线，
+    与窗口位置无关。因此：
+      - 新K线收盘：只对刚满足右侧条件的位置做 pivot 判定（同 _find_pivots 规则）
+      - 窗口左端滑出：丢弃位置 < 窗口起点 + s 的 pivot（analyze 在该窗口上也不会检出它们）
+      - 连续同类型去重按“段”维护（每段记最极值且最先出现的那个），只有最左段被截短时才重算该段
+    HH/HL/LH/LL、趋势投票、区间边界只依赖最近 keep_pivots 个 pivot，每次重算，与历史长度无关。
+
+    位置用时间戳换算（窗口必须连续）；窗口不连续、周期变化、一次新增过多时整窗重建。
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reset()
+
+    def reset(self):
+        self._step: Optional[int] = None
+        self._ref: Optional[int] = None       # 位置 0 对应的时间戳
+        self._last_ts: Optional[int] = None
+        # 原始 pivots（含同 index 的 H/L）：(pos, is_high)
+        self._raw: deque = deque()
+        # 去重段：[is_high, deque[(pos, price)], best(pos, price)]
+        self._runs: deque = deque()
+
+    # ------------------------------
+    # 维护原始 pivots / 去重段
+    # ------------------------------
+    def _push(self, is_high: bool, pos: int, price: float):
+        conflict = bool(self._raw) and self._raw[-1] == (pos, True)
+        self._raw.append((pos, is_high))
+        if conflict:
+            # 同一根K线已有 H：L 只计入原始数量，不进入清洗结果
+            return
+        runs = self._runs
+        if runs and runs[-1][0] == is_high:
+            run = runs[-1]
+            run[1].append((pos, price))
+            best = run[2][1]
+            if (price > best) if is_high else (price < best):
+                run[2] = (pos, price)
+        else:
+            runs.append([is_high, deque([(pos, price)]), (pos, price)])
+
+    def _drop_before(self, pos_min: int):
+        raw, runs = self._raw, self._runs
+        while raw and raw[0][0] < pos_min:
+            pos, is_high = raw.popleft()
+            if not runs or runs[0][0] != is_high or runs[0][1][0][0] != pos:
+                continue
+            run = runs[0]
+            run[1].popleft()
+            if not run[1]:
+                runs.popleft()
+            elif run[2][0] == pos:
+                best = run[1][0]
+                for e in run[1]:
+                    if (e[1] > best[1]) if is_high else (e[1] < best[1]):
+                        best = e
+                run[2] = best
+
+    def _feed(self, highs: np.ndarray, lows: np.ndarray, pos0: int):
+        """对切片做 pivot 判定（切片内可判定的位置 = 左右各满 s 根），位置 = pos0 + 切片下标"""
+        s = self.swing_size
+        if len(highs) > 4 * s + 1:
+            is_high, idx, price = self._find_pivots(highs, lows)
+            for h, i, p in zip(is_high.tolist(), idx.tolist(), price.tolist()):
+                self._push(h, pos0 + i, p)
+            return
+
+        # 每轮通常只新增 1 根：少量位置直接逐个判定，省掉数组运算的固定开销（规则同 _find_pivots）
+        hs, ls = highs.tolist(), lows.tolist()
+        for i in range(s, len(hs) - s):
+            h, l = hs[i], ls[i]
+            if h >= max(hs[i - s:i]) and h > max(hs[i + 1:i + s + 1]):
+                self._push(True, pos0 + i, h)
+            if l <= min(ls[i - s:i]) and l < min(ls[i + 1:i + s + 1]):
+                self._push(False, pos0 + i, l)
+
+    # ------------------------------
+    # 主入口
+    # ------------------------------
+    def update(self, rows: Union[Bars, List[Dict]]) -> Dict:
+        """rows：当前窗口（Bars / 记录数组 / 逐根 dict 行，按时间升序）"""
+        s = self.swing_size
+        n = len(rows)
+        if n < s * 2 + 1:
+            return self.analyze(rows)
+
+        bars = as_bars(rows)
+        ts = bars.timestamp
+        t_first, t_prev, t_last = int(ts[0]), int(ts[-2]), int(ts[-1])
+        step = t_last - t_prev
+        if step <= 0 or t_last - t_first != (n - 1) * step:
+            # 位置与时间戳对不上：退回整窗计算，下次重建
+            self.reset()
+            return self.analyze(bars)
+
+        def cols(lo: int):
+            return (np.ascontiguousarray(bars.high[lo:], dtype=float),
+                    np.ascontiguousarray(bars.low[lo:], dtype=float))
+
+        new = None
+        if self._last_ts is not None and step == self._step:
+            new, rem = divmod(t_last - self._last_ts, step)
+            if rem or new < 0 or n - new - 2 * s < 0 or (t_first - self._ref) % step:
+                new = None
+
+        if new is None:
+            # 冷启动 / 缺口 / 一次新增过多：整窗重建
+            self.reset()
+            self._step, self._ref = step, t_first
+            self._feed(*cols(0), 0)
+        elif new:
+            # 新确认的位置：旧的最后一根 - s + 1 起，切片向左多带 s 根作为左窗口
+            lo = n - new - 2 * s
+            self._feed(*cols(lo), (t_first - self._ref) // step + lo)
+
+        self._last_ts = t_last
+        start = (t_first - self._ref) // step
+        self._drop_before(start + s)
+
+        pivots_found = len(self._raw)
+        if pivots_found < 4:
+            return {"valid": False, "reason": "not_enough_pivots_raw", "pivots_found": pivots_found}
+        if len(self._runs) < 4:
+            return {"valid": False, "reason": "not_enough_pivots_clean", "pivots_used": len(self._runs)}
+
+        tail = list(islice(reversed(self._runs), self.keep_pivots or None))[::-1]
+        pivots = [("H" if run[0] else "L", run[2][0] - start, run[2][1]) for run in tail]
+
+        last_close = float(bars.close[-1])
+        return self._summarize(pivots, last_close, pivots_found, n)
@@ -0,0 +1,197 @@
+# parallel_compute.py
+"""
+指标并行计算：把逐币种的 compute_indicators 分到多个常驻 worker 进程
+
+- 每个 worker 是一个单进程 ProcessPoolExecutor，币种按 crc32 固定分片：
+  同一币种每轮落在同一个 worker，增量结构状态（indicators._structure_state）常驻在该 worker 里
+- 主进程按分片打包任务（一片一次提交），只发送列式 Bars + 已算好的 EMA/ATR，
+  worker 返回指标快照及其 JSON（序列化也在 worker 里做）
+- 按 signal_round.tf_stages 分阶段：先 4h/1h 计算并落地，再算 15m（随任务下发本轮内存里的 4h 快照）；
+  落地（batch / unified payload / 最后一次 pipeline 写 Redis）全部在主进程，顺序与串行路径相同
+- worker 用 forkserver 启动（不用 fork：主进程里有 WebSocket / 线程池等线程，fork 时别的线程持有的锁
+  会被原样复制进子进程，可能死锁）；forkserver 预加载本模块，新建 worker 不必重新 import 指标依赖
+- 币种数不足 INDICATOR_PARALLEL_MIN_SYMBOLS 或 worker 数为 1 时直接走串行；
+  某个 worker 异常、或本阶段 INDICATOR_WORKER_TIMEOUT_SEC 秒内没返回时，该分片回退主进程计算，
+  下轮重建该 worker
+- run 是协程：等 worker 结果用 asyncio.wrap_future + asyncio.wait，等待期间事件循环照常处理
+  manage_loop / 面板 / K线 WebSocket
+"""
+import os
+import json
+import asyncio
+import zlib
+import time
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from config import timeframes, INDICATOR_WORKERS, INDICATOR_PARALLEL_MIN_SYMBOLS, INDICATOR_WORKER_TIMEOUT_SEC
+from kline_store import KLINE_STORE
+from signal_memo import MEMO
+from signal_round import SignalRound, tf_stages
+from indicators import compute_indicators, needs_compute, calculate_signal_single, forget_structure
+
+
+# ==========================================================
+# worker 端
+# ==========================================================
+def _run_jobs(jobs: list[tuple]) -> list[tuple]:
+    """jobs: [(symbol, interval, bars, base, tf4h_snapshot)] → [(symbol, interval, indicators, json)]"""
+    out = []
+    for symbol, interval, rows, base, tf4h_snapshot in jobs:
+        indicators = compute_indicators(symbol, interval, rows, base, tf4h_snapshot)
+        encoded = json.dumps(indicators, ensure_ascii=False) if indicators is not None else None
+        out.append((symbol, interval, indicators, encoded))
+    return out
+
+
+def _forget_symbols(symbols: list[str]):
+    for symbol in symbols:
+        forget_structure(symbol)
+
+
+def _terminate_alive(procs: list):
+    for proc in procs:
+        if proc.is_alive():
+            proc.terminate()
+
+
+# ==========================================================
+# 主进程端
+# ==========================================================
+class ParallelCompute:
+    def __init__(self, workers: int = INDICATOR_WORKERS, min_symbols: int = INDICATOR_PARALLEL_MIN_SYMBOLS,
+                 timeout_sec: float = INDICATOR_WORKER_TIMEOUT_SEC):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_symbols = min_symbols
+        self.timeout_sec = timeout_sec
+        self._shards: list[ProcessPoolExecutor | None] = [None] * self.workers
+        self._ctx = mp.get_context("forkserver")
+        self._ctx.set_forkserver_preload([__name__])
+
+    def _shard_of(self, symbol: str) -> int:
+        return zlib.crc32(symbol.encode()) % self.workers
+
+    def _executor(self, i: int) -> ProcessPoolExecutor:
+        ex = self._shards[i]
+        if ex is None:
+            ex = self._shards[i] = ProcessPoolExecutor(max_workers=1, mp_context=self._ctx)
+        return ex
+
+    def _drop(self, i: int):
+        ex, self._shards[i] = self._shards[i], None
+        if ex is None:
+            return
+        procs = list((ex._processes or {}).values())
+        ex.shutdown(wait=False, cancel_futures=True)
+        # 手上的任务做完后 worker 自行退出；宽限期后还活着才当卡死 terminate。
+        # 不能立即 terminate：worker 可能正往管道写结果，写到一半被杀，executor 的管理线程会永远阻塞在读上（进程退不出）
+        timer = threading.Timer(self.timeout_sec, _terminate_alive, (procs,))
+        timer.daemon = True
+        timer.start()
+
+    async def _run_stage(self, jobs: list[tuple]) -> dict[tuple[str, str], tuple[dict | None, str | None]]:
+        by_shard: dict[int, list[tuple]] = {}
+        for job in jobs:
+            by_shard.setdefault(self._shard_of(job[0]), []).append(job)
+
+        futures = {}
+        for i, shard_jobs in by_shard.items():
+            try:
+                futures[i] = asyncio.wrap_future(self._executor(i).submit(_run_jobs, shard_jobs))
+            except Exception as e:
+                logging.warning(f"指标 worker {i} 提交失败，本分片回退主进程计算: {e}")
+                self._drop(i)
+
+        if futures:
+            await asyncio.wait(futures.values(), timeout=self.timeout_sec)
+
+        out = {}
+        for i, shard_jobs in by_shard.items():
+            try:
+                fut = futures.get(i)
+                if fut is None:
+                    results = _run_jobs(shard_jobs)
+                elif not fut.done():
+                    fut.cancel()
+                    logging.warning(f"指标 worker {i} 超过 {self.timeout_sec}s 未返回，本分片回退主进程计算")
+                    self._drop(i)
+                    results = _run_jobs(shard_jobs)
+                else:
+                    results = fut.result()
+            except Exception as e:
+                logging.warning(f"指标 worker {i} 失败，本分片回退主进程计算: {e}")
+                self._drop(i)
+                results = _run_jobs(shard_jobs)
+            for symbol, interval, indicators, encoded in results:
+                out[(symbol, interval)] = (indicators, encoded)
+        return out
+
+    @staticmethod
+    def _land(rnd: SignalRound, symbols: list[str], tfs: list[str], recompute: set | None,
+              done: dict, hits: set):
+        """按串行路径的顺序落地：需重算的写入结果，其余（含记忆化命中）复用上一轮快照"""
+        for symbol in symbols:
+            for tf in tfs:
+                if not needs_compute(symbol, tf, recompute) or (symbol, tf) in hits:
+                    rnd.reuse(symbol, tf)
+                    continue
+                indicators, encoded = done.get((symbol, tf), (None, None))
+                if indicators is not None:
+                    rnd.publish(symbol, tf, indicators, encoded)
+
+    async def run(self, symbols: list[str], recompute: set | None, batch: dict | None = None):
+        batch = batch or {}
+        rnd = SignalRound()
+        if self.workers <= 1 or len(symbols) < self.min_symbols:
+            for sym in symbols:
+                calculate_signal_single(sym, recompute, batch, rnd)
+            rnd.flush()
+            return
+
+        t0 = time.perf_counter()
+        hits: set[tuple[str, str]] = set()
+
+        def jobs_for(tfs: list[str]) -> list[tuple]:
+            jobs = []
+            for symbol in symbols:
+                for tf in tfs:
+                    if not needs_compute(symbol, tf, recompute):
+                        continue
+                    rows = KLINE_STORE.bars(symbol, tf)
+                    if len(rows) < 5:
+                        continue
+                    if MEMO.get(symbol, tf, int(rows.timestamp[-1])) is not None:
+                        hits.add((symbol, tf))
+                        continue
+                    tf4h_snapshot = rnd.snapshot(symbol, "4h") if tf == "15m" else None
+                    jobs.append((symbol, tf, rows, batch.get((symbol, tf)), tf4h_snapshot))
+            return jobs
+
+        # 按依赖分阶段（4h/1h → 15m）：上一阶段落地后，本轮快照已在内存里交给下游
+        n_jobs = 0
+        for tfs in tf_stages(timeframes):
+            jobs = jobs_for(tfs)
+            self._land(rnd, symbols, tfs, recompute, await self._run_stage(jobs), hits)
+            n_jobs += len(jobs)
+        rnd.flush()
+
+        print(f"🧮 并行指标: {n_jobs} 个 (symbol, 周期) | {self.workers} 个 worker | "
+              f"{round(time.perf_counter() - t0, 3)} 秒")
+
+    def forget_symbol(self, symbol: str):
+        """清掉该币种所在 worker 里的结构状态（主进程状态由 forget_signal 清理）"""
+        ex = self._shards[self._shard_of(symbol)]
+        if ex is None:
+            return
+        try:
+            ex.submit(_forget_symbols, [symbol])
+        except Exception:
+            pass
+
+    def shutdown(self):
+        for i in range(self.workers):
+            self._drop(i)
+
+
+PARALLEL_COMPUTE = ParallelCompute()
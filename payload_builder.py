@@ -159,10 +159,14 @@ def _get_snapshot(symbol: str, tf: str) -> Optional[dict]:
     v = redis_client.get(key)
     return json.loads(v) if v else None
 
-def build_unified_payload(symbol: str) -> Optional[dict]:
-    tf4h = _get_snapshot(symbol, "4h")
-    tf1h = _get_snapshot(symbol, "1h")
-    tf15m = _get_snapshot(symbol, "15m")
+def build_unified_payload(symbol: str, snapshots: Optional[tuple] = None) -> Optional[dict]:
+    """snapshots：本轮内存里的 (4h, 1h, 15m) 快照；None 时从 Redis 读"""
+    if snapshots is not None:
+        tf4h, tf1h, tf15m = snapshots
+    else:
+        tf4h = _get_snapshot(symbol, "4h")
+        tf1h = _get_snapshot(symbol, "1h")
+        tf15m = _get_snapshot(symbol, "15m")
 
     if not tf4h or not tf1h or not tf15m:
         return None
@@ -0,0 +1,119 @@
+# referee_gate.py
+"""
+裁判前置过滤：scan 轮在投喂模型之前，先用 payload_builder.referee_snapshot 过一遍 batch
+
+- ALLOW_TRADE 的币种原样投喂；持仓币种无论裁判结果都原样投喂（要管理仓位）
+- NO_TRADE 的币种按 REFEREE_GATE_MODE 处理：
+    off       不过滤，全部原样投喂
+    drop      直接不投喂
+    compress  只投喂裁判结论（verdict / reason_code / context），不带各周期指标；
+              压缩后的币种附在常规批次里（每批最多 REFEREE_GATE_COMPRESSED_PER_BATCH 个），
+              不单独占一次 LLM 往返；模型对它们给出的交易动作不执行（只认 wait / hold）
+- 每轮统计：过滤 / 压缩了多少币种、估算省下多少 token（按 JSON 字符数 / 4 估算），
+  打印并写入 Redis 列表 KEY_GATE（保留最近 GATE_HISTORY_LIMIT 轮）
+"""
+import json
+import time
+import logging
+from config import REFEREE_GATE_MODE
+from database import redis_client
+from payload_builder import referee_snapshot
+
+KEY_GATE = "referee_gate_history"
+GATE_HISTORY_LIMIT = 1000
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(obj) -> int:
+    """粗估 token 数：紧凑 JSON 字符数 / 4"""
+    text = obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _indicators(cycles: dict, interval: str) -> dict | None:
+    return (cycles.get(interval) or {}).get("indicators")
+
+
+def referee_of(cycles: dict) -> dict:
+    """batch_cache 里单个币种的 {interval: {"indicators": ...}} → 裁判结果"""
+    return referee_snapshot(_indicators(cycles, "4h"), _indicators(cycles, "1h"), _indicators(cycles, "15m"))
+
+
+def compress(ref: dict) -> dict:
+    """NO_TRADE 币种的压缩形态：只剩裁判结论（_build_dataset_json 识别 "referee" 键）"""
+    return {"referee": {"verdict": ref["verdict"], "reason_code": ref["reason_code"], "context": ref.get("context")}}
+
+
+def gate_dataset(dataset: dict, keep_symbols, mode: str = REFEREE_GATE_MODE) -> tuple[dict, dict, dict]:
+    """
+    dataset：batch_cache 副本（{symbol: cycles}）
+    返回 (原样投喂的币种, 压缩投喂的币种, 本轮统计)
+    """
+    keep_symbols = set(keep_symbols or ())
+    passed, compressed = {}, {}
+    reasons: dict[str, int] = {}
+    stats = {
+        "ts": time.time(),
+        "mode": mode,
+        "symbols_in": len(dataset),
+        "kept_positions": 0,
+        "allowed": 0,
+        "dropped": 0,
+        "compressed": 0,
+        "tokens_in": 0,
+        "tokens_out": 0,
+    }
+
+    for symbol, cycles in dataset.items():
+        tokens = estimate_tokens(cycles)
+        stats["tokens_in"] += tokens
+
+        if mode == "off" or symbol in keep_symbols:
+            passed[symbol] = cycles
+            stats["tokens_out"] += tokens
+            stats["kept_positions"] += symbol in keep_symbols
+            continue
+
+        try:
+            ref = referee_of(cycles)
+        except Exception as e:
+            # 裁判出错不能把币种静默丢掉：原样投喂
+            logging.warning(f"裁判过滤异常 {symbol}，原样投喂: {e}")
+            passed[symbol] = cycles
+            stats["tokens_out"] += tokens
+            continue
+
+        if ref["verdict"] == "ALLOW_TRADE":
+            passed[symbol] = cycles
+            stats["tokens_out"] += tokens
+            stats["allowed"] += 1
+            continue
+
+        reasons[ref["reason_code"]] = reasons.get(ref["reason_code"], 0) + 1
+        if mode == "compress":
+            compressed[symbol] = compress(ref)
+            stats["tokens_out"] += estimate_tokens(compressed[symbol])
+            stats["compressed"] += 1
+        else:
+            stats["dropped"] += 1
+
+    stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_out"]
+    stats["reasons"] = reasons
+    return passed, compressed, stats
+
+
+def record(stats: dict):
+    print(
+        f"🧑‍⚖️ 裁判过滤({stats['mode']}): {stats['symbols_in']} 个币种 | "
+        f"放行 {stats['allowed']} / 持仓 {stats['kept_positions']} / "
+        f"压缩 {stats['compressed']} / 丢弃 {stats['dropped']} | "
+        f"省 ~{stats['tokens_saved']} token（{stats['tokens_in']} → {stats['tokens_out']}）"
+    )
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.rpush(KEY_GATE, json.dumps(stats, ensure_ascii=False))
+        pipe.ltrim(KEY_GATE, -GATE_HISTORY_LIMIT, -1)
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"裁判过滤统计写入失败: {e}")
@@ -0,0 +1,91 @@
+# resampler.py
+"""
+高周期K线本地重采样：1h / 4h 由 15m 基础K线精确合成（含 Volume / TakerBuyVolume）
+
+- 分桶规则与交易所一致：bucket = ts // target_ms * target_ms（UTC 对齐）
+- 全向量化：reduceat 一次算完所有桶的 high/low/volume
+- 只有根数满额的桶才算“已收盘”；resample 另外返回最后一个未满的桶，派生时不使用
+  （指标与快照只用已收盘K线）
+"""
+import numpy as np
+from kline_codec import KLINE_DTYPE, empty_bars
+from kline_store import KLINE_STORE
+
+
+def resample(base: np.ndarray, base_ms: int, target_ms: int):
+    """
+    base：按时间升序的基础周期记录数组
+    返回 (closed, partial)
+      - closed：根数满额的高周期K线（记录数组，可能有缺口，由调用方检查连续性）
+      - partial：最后一个未满的桶（记录数组长度 1）或 None
+    中间未满的桶（基础K线缺失）直接丢弃。
+    """
+    if len(base) == 0:
+        return empty_bars(), None
+
+    ratio = target_ms // base_ms
+    ts = base["Timestamp"]
+    bucket = ts // target_ms * target_ms
+
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(ts)]
+    counts = ends - starts
+
+    out = np.empty(len(starts), dtype=KLINE_DTYPE)
+    out["Timestamp"] = bucket[starts]
+    out["Open"] = base["Open"][starts]
+    out["High"] = np.maximum.reduceat(base["High"], starts)
+    out["Low"] = np.minimum.reduceat(base["Low"], starts)
+    out["Close"] = base["Close"][ends - 1]
+    out["Volume"] = np.add.reduceat(base["Volume"], starts)
+    out["TakerBuyVolume"] = np.add.reduceat(base["TakerBuyVolume"], starts)
+
+    full = counts == ratio
+    partial = None
+    if not full[-1]:
+        partial = out[-1:].copy()
+
+    return out[full], partial
+
+
+def derive_new_bars(symbol: str, interval: str, base_interval: str, interval_ms: int, base_ms: int) -> bool:
+    """
+    从K线存储里的基础周期，派生 interval 在最后一根之后的新收盘K线并追加。
+    返回 False 表示无法派生（冷启动 / 基础K线覆盖不到 / 出现缺口），调用方应回退 REST。
+    """
+    last_ts = KLINE_STORE.last_ts(symbol, interval)
+    if last_ts is None:
+        return False
+
+    base = KLINE_STORE.view(symbol, base_interval)
+    if not len(base):
+        return False
+
+    start = last_ts + interval_ms
+    bts = base["Timestamp"]
+    i = int(np.searchsorted(bts, start))
+    if i == len(bts):
+        # 基础周期还没有新K线：若基础最后一根早于缺口起点，说明覆盖不到
+        return int(bts[-1]) >= start - base_ms
+    if int(bts[i]) != start:
+        return False
+
+    closed, _ = resample(base[i:], base_ms, interval_ms)
+
+    if len(closed):
+        cts = closed["Timestamp"]
+        if int(cts[0]) != start or (len(cts) > 1 and (np.diff(cts) != interval_ms).any()):
+            return False
+        KLINE_STORE.append(symbol, interval, closed)
+    return True
+
+
+def compare_bars(derived: np.ndarray, exchange: np.ndarray, rel_tol: float = 1e-9) -> list[str]:
+    """对齐校验：逐字段比较派生K线与交易所K线，返回不一致的字段名"""
+    bad = []
+    if len(derived) != len(exchange) or not (derived["Timestamp"] == exchange["Timestamp"]).all():
+        return ["Timestamp"]
+    for name in KLINE_DTYPE.names[1:]:
+        if not np.allclose(derived[name], exchange[name], rtol=rel_tol, atol=0.0):
+            bad.append(name)
+    return bad
@@ -2,13 +2,23 @@ import asyncio
 import time
 from datetime import datetime, timezone, timedelta
 from ai_trade_notifier import send_tg_trade_signal
-from config import monitor_symbols
-from indicators import calculate_signal_single
+from config import monitor_symbols, timeframes, KLINE_STREAM_ENABLED, KLINE_STREAM_CLOSE_WAIT, INDICATOR_STATE_ENABLED
+from indicators import forget_signal
+from batch_indicators import compute_batch_pairs
+from indicator_registry import compute_feature_pairs, take_timings
+from indicator_state import INDICATOR_STATE
+from parallel_compute import PARALLEL_COMPUTE
+from signal_memo import MEMO
+from fetch_planner import PLANNER
+from kline_backfill import pairs_with_gaps, backfill_all
 from deepseek_batch_pusher import push_batch_to_deepseek
-from kline_fetcher import fetch_all
+from kline_fetcher import fetch_all_async, INTERVAL_MS
+from kline_stream import INGESTER
+from kline_store import KLINE_STORE
 from position_cache import position_records
 from account_positions import get_account_status, account_snapshot
 from trader import execute_trade_async
+from early_dispatch import EarlyDispatcher
 from profit_tracker import update_profit_curve
 from database import redis_client
 
@@ -43,6 +53,26 @@ def seconds_to_next_15m_close(now: datetime) -> float:
         next_run = next_run.replace(minute=minute)
     return max(1.0, (next_run - now).total_seconds())
 
+async def wait_stream_15m_close(symbols: list[str]):
+    """
+    刚过 15m 收盘时，等待 WebSocket 把本轮币种的收盘K线推送到齐（最多 KLINE_STREAM_CLOSE_WAIT 秒）。
+    没到齐的币种由随后的 REST 增量同步补上。
+    """
+    if not KLINE_STREAM_ENABLED or not INGESTER.connected:
+        return
+
+    step = INTERVAL_MS["15m"]
+    now_ms = int(time.time() * 1000)
+    close_ms = now_ms // step * step
+    if now_ms - close_ms > KLINE_STREAM_CLOSE_WAIT * 1000:
+        return
+
+    t0 = time.perf_counter()
+    got = await INGESTER.wait_candle_closed(
+        "15m", close_ms - step, symbols=symbols, timeout=KLINE_STREAM_CLOSE_WAIT
+    )
+    print(f"📡 15m 收盘推送到达 {len(got)}/{len(symbols)} | 等待 {round(time.perf_counter() - t0, 3)} 秒")
+
 def is_trade_action(action: str, mode: str) -> bool:
     """
     mode = "manage"：仅允许风控动作（禁止开新仓）
@@ -77,6 +107,27 @@ def valid_action(action: str) -> bool:
         "hold", "wait",
     }
 
+def _execute_signal(sig: dict):
+    return execute_trade_async(
+        symbol=sig.get("symbol"),
+        action=sig.get("action"),
+        stop_loss=sig.get("stop_loss"),
+        take_profit=sig.get("take_profit"),
+        position_size=(
+            sig.get("position_size")
+            or sig.get("order_value")
+            or sig.get("amount")
+        ),
+        quantity=sig.get("quantity")
+    )
+
+def wants_execute(sig: dict, mode: str, pos_symbols) -> bool:
+    """与整轮返回后 exec_list 相同的过滤规则（流式提前下单用）"""
+    action = sig.get("action", "")
+    if not valid_action(action) or not is_trade_action(action, mode):
+        return False
+    return mode != "manage" or sig.get("symbol") in pos_symbols
+
 # ========= 核心：单轮执行 =========
 async def run_once(mode: str = "scan"):
     """
@@ -109,20 +160,58 @@ async def run_once(mode: str = "scan"):
         symbols_this_round = list(monitor_symbols)
 
         try:
-            # 拉K线与算指标
-            fetch_all()
-            for sym in symbols_this_round:
-                calculate_signal_single(sym)
+            # 拉K线与算指标（WebSocket 已写入的K线，增量同步会直接跳过）
+            await wait_stream_15m_close(symbols_this_round)
+
+            # 只同步/重算有新收盘K线的 (symbol, interval)，其余复用上一轮快照
+            fetch_pairs = PLANNER.fetch_pairs(symbols_this_round, timeframes)
+            if fetch_pairs:
+                await fetch_all_async(fetch_pairs)
+
+            # scan 轮：内存扫描存储缺口，只回补缺失区间
+            if mode == "scan":
+                gap_pairs = pairs_with_gaps((s, tf) for s in symbols_this_round for tf in timeframes)
+                if gap_pairs:
+                    await backfill_all(gap_pairs)
+            recompute = PLANNER.compute_pairs(symbols_this_round, timeframes)
+            print(
+                f"🧮 本轮同步 {len(fetch_pairs)} / 重算 {len(recompute)} / "
+                f"共 {len(symbols_this_round) * len(timeframes)} 个 (symbol, 周期)"
+            )
+            # EMA/ATR：增量状态 O(1) 更新，窗口过短的组合按周期全市场批量算；结构等其余部分按币种分片并行
+            batch = INDICATOR_STATE.compute_pairs(recompute) if INDICATOR_STATE_ENABLED else {}
+            batch.update(compute_batch_pairs(recompute - batch.keys()))
+            # 注册表特征：按周期全市场向量化一次算完，随 EMA/ATR 一起下发
+            for key, features in compute_feature_pairs(recompute).items():
+                if key in batch:
+                    batch[key]["features"] = features
+            await PARALLEL_COMPUTE.run(symbols_this_round, recompute, batch)
+            memo = MEMO.take_stats()
+            print(
+                f"🧠 指标记忆化: 命中 {memo['hits']} / 重算 {memo['misses']} | "
+                f"累计命中 {memo['total_hits']} / 重算 {memo['total_misses']}"
+            )
+            timings = take_timings()
+            if timings:
+                print("📐 特征耗时: " + " | ".join(f"{k} {v['total_ms']}ms" for k, v in timings.items()))
+            if INDICATOR_STATE_ENABLED:
+                INDICATOR_STATE.checkpoint()
 
             # AI 投喂
             start_ai = time.perf_counter()
-            ai_res = await push_batch_to_deepseek()
+            dispatcher = EarlyDispatcher(lambda sig: wants_execute(sig, mode, pos_symbols), _execute_signal)
+            ai_res = await push_batch_to_deepseek(mode, on_decision=dispatcher)
             end_ai = time.perf_counter()
             print(f"⏱ AI返回耗时: {round(end_ai - start_ai, 3)} 秒")
 
             if not ai_res or not isinstance(ai_res, list):
-                print("⚠ AI 未返回有效信号，不推送，不下单")
-                return
+                if dispatcher.tasks:
+                    # 流式已提前下单的决策：等它们完成（最终解析失败不影响已下的单）
+                    await asyncio.gather(*dispatcher.tasks.values(), return_exceptions=True)
+                    ai_res = []
+                else:
+                    print("⚠ AI 未返回有效信号，不推送，不下单")
+                    return
 
             # 过滤：只保留动作闭集内信号（含 wait/hold）
             signals = [sig for sig in ai_res if valid_action(sig.get("action", ""))]
@@ -134,23 +223,12 @@ async def run_once(mode: str = "scan"):
             # 只对“需要交易/改单”的动作执行；wait/hold 不执行但可以留作日志
             exec_list = [s for s in signals if is_trade_action(s.get("action", ""), mode)]
 
-            # 并发下单
-            tasks = []
-            for sig in exec_list:
-                tasks.append(asyncio.create_task(
-                    execute_trade_async(
-                        symbol=sig.get("symbol"),
-                        action=sig.get("action"),
-                        stop_loss=sig.get("stop_loss"),
-                        take_profit=sig.get("take_profit"),
-                        position_size=(
-                            sig.get("position_size")
-                            or sig.get("order_value")
-                            or sig.get("amount")
-                        ),
-                        quantity=sig.get("quantity")
-                    )
-                ))
+            # 并发下单（流式投喂里已提前下单的币种不再下单，动作不同记为冲突）
+            tasks = list(dispatcher.tasks.values())
+            pending = dispatcher.remaining(exec_list)
+            for sig in pending:
+                tasks.append(asyncio.create_task(_execute_signal(sig)))
+            exec_list = dispatcher.signals + pending
 
             if tasks:
                 start_exec = time.perf_counter()
@@ -178,13 +256,18 @@ async def run_once(mode: str = "scan"):
             if mode == "scan":
                 try:
                     valid = set(symbols_this_round)
-                    for key in redis_client.keys("historical_data:*"):
+                    for key in redis_client.keys("kline_bin:*"):
                         k = key if isinstance(key, str) else key.decode()
                         parts = k.split(":")
                         if len(parts) == 3:
                             _, symbol, _ = parts
                             if symbol not in valid:
                                 redis_client.delete(key)
+                    for symbol, _ in KLINE_STORE.keys():
+                        if symbol not in valid:
+                            KLINE_STORE.drop_symbol(symbol)
+                            forget_signal(symbol)
+                            PARALLEL_COMPUTE.forget_symbol(symbol)
                 except Exception as e:
                     print(f"⚠️ Redis清理异常: {e}")
 
@@ -0,0 +1,105 @@
+# signal_memo.py
+"""
+指标快照记忆化：同一 (symbol, interval) 在没有新收盘K线时，指标结果完全相同
+
+键 = (最后一根K线时间戳, 参数哈希, 依赖周期的快照时间戳)
+  - 参数哈希：该周期的 EMA_CONFIG / STRUCTURE_PARAMS，改参数后旧结果自动失效
+  - 依赖周期：15m 的 signal 用 4h 快照、unified payload 带 1h，依赖的快照换了也要重算
+命中时直接复用上一份快照（只续期 Redis TTL、重新进入 batch），不重算也不重写快照。
+
+hits / misses 按轮统计：命中 = 复用快照次数，未命中 = 实际计算并写入次数。
+"""
+import json
+import hashlib
+from config import EMA_CONFIG, STRUCTURE_PARAMS
+
+# 周期 → 它的结果依赖哪些周期的快照（与 fetch_planner.TF_DEPENDENTS 互为反向）
+TF_DEPENDS_ON = {
+    "15m": ("4h", "1h"),
+}
+
+
+def param_hash(interval: str) -> str:
+    raw = json.dumps(
+        {"ema": EMA_CONFIG.get(interval), "structure": STRUCTURE_PARAMS.get(interval)},
+        sort_keys=True,
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+class SignalMemo:
+    def __init__(self):
+        # (symbol, interval) -> (key, indicators, encoded json | None)
+        self._entries: dict[tuple[str, str], tuple[tuple, dict, str | None]] = {}
+        self._params: dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.total_hits = 0
+        self.total_misses = 0
+
+    def _key(self, symbol: str, interval: str, last_ts: int) -> tuple:
+        params = self._params.get(interval)
+        if params is None:
+            params = self._params[interval] = param_hash(interval)
+        deps = tuple(self.last_ts(symbol, d) for d in TF_DEPENDS_ON.get(interval, ()))
+        return last_ts, params, deps
+
+    # ------------------------------
+    # 查询（不计数）
+    # ------------------------------
+    def get(self, symbol: str, interval: str, last_ts: int) -> dict | None:
+        """键完全一致才返回缓存的快照"""
+        entry = self._entries.get((symbol, interval))
+        if entry is None or entry[0] != self._key(symbol, interval, last_ts):
+            return None
+        return entry[1]
+
+    def peek(self, symbol: str, interval: str) -> dict | None:
+        """上一份快照（不校验键，供“本轮无新K线”直接复用）"""
+        entry = self._entries.get((symbol, interval))
+        return entry[1] if entry else None
+
+    def encoded(self, symbol: str, interval: str) -> str | None:
+        entry = self._entries.get((symbol, interval))
+        return entry[2] if entry else None
+
+    def last_ts(self, symbol: str, interval: str) -> int | None:
+        entry = self._entries.get((symbol, interval))
+        return entry[0][0] if entry else None
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self._entries
+
+    # ------------------------------
+    # 写入 / 计数
+    # ------------------------------
+    def put(self, symbol: str, interval: str, indicators: dict, encoded: str | None = None):
+        """新算出的快照（计一次未命中）"""
+        key = self._key(symbol, interval, indicators["timestamp"])
+        self._entries[(symbol, interval)] = (key, indicators, encoded)
+        self.misses += 1
+        self.total_misses += 1
+
+    def hit(self):
+        self.hits += 1
+        self.total_hits += 1
+
+    def take_stats(self) -> dict:
+        """返回本轮计数并清零（累计值保留）"""
+        total = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "total_hits": self.total_hits,
+            "total_misses": self.total_misses,
+        }
+        self.hits = self.misses = 0
+        return stats
+
+    def forget_symbol(self, symbol: str):
+        for key in [k for k in self._entries if k[0] == symbol]:
+            self._entries.pop(key, None)
+
+
+MEMO = SignalMemo()
@@ -0,0 +1,121 @@
+# signal_round.py
+"""
+单轮指标计算图：周期按依赖顺序推进，上游结果在内存里直接交给下游，Redis 只在最后批量写一次
+
+- 依赖关系见 signal_memo.TF_DEPENDS_ON（15m 依赖 4h / 1h）；tf_stages 按依赖分层，
+  同层周期互不依赖（并行路径按层分阶段派发），层内保持配置里的顺序
+- 本轮的快照（新算的或复用的）存在 SignalRound.snapshots：
+    15m signal 取 4h 快照、unified payload 的裁判取 4h/1h/15m 快照，都不再回读 Redis
+- 落地：快照 / unified payload 的写入与续期先记在本轮里，flush 时一次 pipeline 写完；
+  续期时发现 key 已过期的，再补一次 SET
+"""
+import json
+import logging
+from database import redis_client
+from deepseek_batch_pusher import add_to_batch
+from payload_builder import build_unified_payload
+from fetch_planner import PLANNER
+from signal_memo import MEMO, TF_DEPENDS_ON
+
+SNAPSHOT_TTL = 600
+PAYLOAD_TTL = 300
+
+
+def tf_stages(intervals) -> list[list[str]]:
+    """按依赖分层：每层只依赖前面层里的周期；不在 intervals 里的依赖忽略"""
+    intervals = list(intervals)
+    pending = set(intervals)
+    stages = []
+    while pending:
+        ready = [
+            tf for tf in intervals
+            if tf in pending and not any(d in pending for d in TF_DEPENDS_ON.get(tf, ()))
+        ]
+        if not ready:
+            raise ValueError(f"周期依赖有环: {sorted(pending)}")
+        stages.append(ready)
+        pending.difference_update(ready)
+    return stages
+
+
+def tf_order(intervals) -> list[str]:
+    return [tf for stage in tf_stages(intervals) for tf in stage]
+
+
+def snapshot_key(symbol: str, interval: str) -> str:
+    return f"signal_snapshot:{symbol}:{interval}"
+
+
+class SignalRound:
+    def __init__(self):
+        # (symbol, interval) -> 本轮快照
+        self.snapshots: dict[tuple[str, str], dict] = {}
+        self._sets: list[tuple[str, str, int]] = []          # (key, json, ttl)
+        self._renews: list[tuple[str, str, str | None]] = []   # (symbol, interval, json)
+
+    def snapshot(self, symbol: str, interval: str) -> dict | None:
+        """本轮快照；本轮没有产出时用上一份（记忆化里的）"""
+        indicators = self.snapshots.get((symbol, interval))
+        if indicators is None:
+            indicators = MEMO.peek(symbol, interval)
+        return indicators
+
+    # ------------------------------
+    # 落地
+    # ------------------------------
+    def publish(self, symbol: str, interval: str, indicators: dict, encoded: str | None = None):
+        """新算出的快照：进 batch、15m 时聚合 unified payload，Redis 写入留到 flush"""
+        if encoded is None:
+            encoded = json.dumps(indicators, ensure_ascii=False)
+        self.snapshots[(symbol, interval)] = indicators
+        self._sets.append((snapshot_key(symbol, interval), encoded, SNAPSHOT_TTL))
+
+        add_to_batch(symbol, interval, indicators)
+
+        # 只在 15m 更新时聚合 unified payload + 裁判（4h/1h 取本轮内存快照）
+        if interval == "15m":
+            payload = build_unified_payload(
+                symbol, (self.snapshot(symbol, "4h"), self.snapshot(symbol, "1h"), indicators)
+            )
+            if payload:
+                self._sets.append((f"unified_payload:{symbol}", json.dumps(payload, ensure_ascii=False), PAYLOAD_TTL))
+
+        MEMO.put(symbol, interval, indicators, encoded)
+        PLANNER.mark_computed(symbol, interval, indicators["timestamp"])
+
+    def reuse(self, symbol: str, interval: str) -> bool:
+        """复用上一份快照：重新进入 batch，Redis 只续期；没有可复用的快照返回 False"""
+        indicators = MEMO.peek(symbol, interval)
+        if indicators is None:
+            return False
+        self.snapshots[(symbol, interval)] = indicators
+        self._renews.append((symbol, interval, MEMO.encoded(symbol, interval)))
+        add_to_batch(symbol, interval, indicators)
+        MEMO.hit()
+        return True
+
+    def flush(self):
+        """本轮所有写入 / 续期一次 pipeline；续期失败（已过期）的快照补写"""
+        if not self._sets and not self._renews:
+            return
+        sets, renews = self._sets, self._renews
+        self._sets, self._renews = [], []
+
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for key, encoded, ttl in sets:
+                pipe.set(key, encoded, ex=ttl)
+            for symbol, interval, _ in renews:
+                pipe.expire(snapshot_key(symbol, interval), SNAPSHOT_TTL)
+            results = pipe.execute()
+
+            expired = [r for r, ok in zip(renews, results[len(sets):]) if not ok]
+            if expired:
+                pipe = redis_client.pipeline(transaction=False)
+                for symbol, interval, encoded in expired:
+                    if encoded is None:
+                        encoded = json.dumps(MEMO.peek(symbol, interval), ensure_ascii=False)
+                    pipe.set(snapshot_key(symbol, interval), encoded, ex=SNAPSHOT_TTL)
+                pipe.execute()
+        except Exception as e:
+            logging.warning(f"指标快照批量写入失败: {e}")
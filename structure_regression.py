@@ -0,0 +1,206 @@
+# structure_regression.py
+"""
+MarketStructure 回归语料 + 与基线版本的对比（输出一致性 / 耗时）
+
+- 语料 regression/market_structure_corpus.npz：固定种子生成的 High/Low/Close 序列，
+  长度 5~801 根，含按最小变动价位取整（大量同价）和整根一字线（High == Low），专门覆盖“同价只认最靠右”的规则
+- 期望输出 regression/market_structure_expected.json：基线版本（--baseline，默认 4cc7f05，逐根 Python 扫描的版本）
+  对每个 (序列, 参数) 的 analyze 结果做 sha256；当前版本分别以 Bars 和逐根 dict 行两种输入跑，必须完全一致
+- 耗时（各周期参数，801 根，取最小值）：
+    pivot 阶段  基线：逐根 _pivot_high/_pivot_low + 两步清洗（list）；当前：_find_pivots + 两步清洗（数组）
+    analyze     基线：逐根 dict 行（当时的生产输入）；当前：列式 Bars（现在的生产输入）
+  基线代码用 git show <rev>:market_structure.py 取出，没有 git 历史时只做一致性校验
+
+用法：
+    python structure_regression.py                  # 一致性校验 + 耗时对比
+    python structure_regression.py --build          # 重新生成语料和期望输出（需要 git 历史）
+"""
+import os
+import sys
+import json
+import time
+import types
+import hashlib
+import argparse
+import subprocess
+import numpy as np
+from config import STRUCTURE_PARAMS
+from bars import Bars
+from market_structure import MarketStructure
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(HERE, "regression", "market_structure_corpus.npz")
+EXPECTED = os.path.join(HERE, "regression", "market_structure_expected.json")
+
+BASELINE_REV = "4cc7f05"
+SPEEDUP_TARGET = 20.0
+
+# 生产参数 + 小窗口边界情况
+PARAMS = list(STRUCTURE_PARAMS.values()) + [
+    {"swing_size": s, "keep_pivots": k} for s in (1, 2, 3, 5) for k in (4, 12)
+]
+
+
+# ==========================================================
+# 语料
+# ==========================================================
+def build_corpus(n_series: int = 160, seed: int = 13) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    highs, lows, closes, offsets = [], [], [], [0]
+    for i in range(n_series):
+        n = int(rng.choice([5, 9, 15, 21, 40, 100, 301, 501, 801]))
+        tick = float(rng.choice([0, 0.5, 1, 2, 5]))
+        c = 100 * np.cumprod(1 + rng.normal(0, 0.01, n))
+        h = c * (1 + rng.uniform(0, 0.01, n))
+        lo = c * (1 - rng.uniform(0, 0.01, n))
+        if tick:
+            h, lo, c = (np.round(x / tick) * tick for x in (h, lo, c))
+        if i % 5 == 0:
+            lo[::3] = h[::3]  # 一字线
+        highs.append(h)
+        lows.append(lo)
+        closes.append(c)
+        offsets.append(offsets[-1] + n)
+    return {
+        "high": np.concatenate(highs), "low": np.concatenate(lows), "close": np.concatenate(closes),
+        "offsets": np.array(offsets, dtype=np.int64),
+    }
+
+
+def load_corpus() -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    with np.load(CORPUS) as z:
+        off = z["offsets"]
+        return [(z["high"][a:b], z["low"][a:b], z["close"][a:b]) for a, b in zip(off[:-1], off[1:])]
+
+
+def as_rows(h: np.ndarray, lo: np.ndarray, c: np.ndarray) -> list[dict]:
+    return [{"High": x, "Low": y, "Close": z} for x, y, z in zip(h.tolist(), lo.tolist(), c.tolist())]
+
+
+def as_bars(h: np.ndarray, lo: np.ndarray, c: np.ndarray) -> Bars:
+    zeros = np.zeros(len(h))
+    return Bars(np.zeros(len(h), dtype=np.int64), c.copy(), h.copy(), lo.copy(), c.copy(), zeros, zeros)
+
+
+def digest(result: dict) -> str:
+    return hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# ==========================================================
+# 基线
+# ==========================================================
+def load_baseline(rev: str):
+    """git show <rev>:market_structure.py → 模块；取不到返回 None"""
+    try:
+        src = subprocess.run(
+            ["git", "show", f"{rev}:market_structure.py"], cwd=HERE,
+            capture_output=True, text=True, check=True,
+        ).stdout
+    except Exception:
+        return None
+    mod = types.ModuleType(f"market_structure_{rev}")
+    exec(compile(src, f"{rev}:market_structure.py", "exec"), mod.__dict__)
+    return mod
+
+
+def baseline_pivots(ms, highs: list, lows: list) -> list:
+    """基线 analyze 的 1)~2) 步：逐根判定 + 清洗"""
+    raw = []
+    for i in range(len(highs)):
+        if ms._pivot_high(highs, i):
+            raw.append(("H", i, highs[i]))
+        if ms._pivot_low(lows, i):
+            raw.append(("L", i, lows[i]))
+    pivots = ms._resolve_same_index_conflict(raw, highs, lows)
+    return ms._dedupe_consecutive_same_type(sorted(pivots, key=lambda x: x[1]))
+
+
+def current_pivots(ms: MarketStructure, highs: np.ndarray, lows: np.ndarray):
+    return ms._dedupe_consecutive_same_type(*ms._resolve_same_index_conflict(*ms._find_pivots(highs, lows)))
+
+
+def best_us(fn, number: int, repeat: int = 7) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - t0) / number)
+    return min(times) * 1e6
+
+
+# ==========================================================
+# 主流程
+# ==========================================================
+def build(rev: str):
+    base = load_baseline(rev)
+    if base is None:
+        sys.exit(f"❌ 取不到基线 {rev}:market_structure.py（需要 git 历史）")
+    corpus = build_corpus()
+    os.makedirs(os.path.dirname(CORPUS), exist_ok=True)
+    np.savez_compressed(CORPUS, **corpus)
+    expected = [
+        [digest(base.MarketStructure(**p).analyze(as_rows(*series))) for p in PARAMS]
+        for series in load_corpus()
+    ]
+    with open(EXPECTED, "w", encoding="utf-8") as f:
+        json.dump({"baseline": rev, "params": PARAMS, "digests": expected}, f)
+    print(f"📦 语料 {len(expected)} 条序列 × {len(PARAMS)} 组参数，期望输出来自 {rev}")
+
+
+def check() -> int:
+    corpus = load_corpus()
+    with open(EXPECTED, "r", encoding="utf-8") as f:
+        expected = json.load(f)
+    bad = 0
+    for i, (series, digests) in enumerate(zip(corpus, expected["digests"])):
+        for p, want in zip(expected["params"], digests):
+            ms = MarketStructure(**p)
+            for name, rows in (("Bars", as_bars(*series)), ("rows", as_rows(*series))):
+                if digest(ms.analyze(rows)) != want:
+                    bad += 1
+                    print(f"❌ 序列 {i}（{len(series[0])} 根）参数 {p} 输入 {name}: 与 {expected['baseline']} 不一致")
+    cases = len(corpus) * len(expected["params"]) * 2
+    print(f"{'✅' if not bad else '❌'} 一致性: {cases - bad}/{cases} 与基线 {expected['baseline']} 相同")
+    return bad
+
+
+def compare(rev: str) -> dict:
+    base = load_baseline(rev)
+    if base is None:
+        print(f"ℹ 取不到基线 {rev}，跳过耗时对比")
+        return {}
+    h, lo, c = max(load_corpus(), key=lambda s: len(s[0]))
+    out = {}
+    for tf, p in STRUCTURE_PARAMS.items():
+        old, new = base.MarketStructure(**p), MarketStructure(**p)
+        hl, ll, rows, bars = h.tolist(), lo.tolist(), as_rows(h, lo, c), as_bars(h, lo, c)
+        stage = (best_us(lambda: baseline_pivots(old, hl, ll), 20), best_us(lambda: current_pivots(new, h, lo), 500))
+        full = (best_us(lambda: old.analyze(rows), 20), best_us(lambda: new.analyze(bars), 500))
+        out[tf] = {"pivots": stage, "analyze": full}
+        print(
+            f"⏱ {tf:>3} ({len(h)} 根) | pivot 阶段 {stage[0]:8.1f} → {stage[1]:6.1f} µs ×{stage[0] / stage[1]:5.1f} | "
+            f"analyze {full[0]:8.1f} → {full[1]:6.1f} µs ×{full[0] / full[1]:5.1f}"
+        )
+    worst = min(v["pivots"][0] / v["pivots"][1] for v in out.values())
+    print(f"{'✅' if worst >= SPEEDUP_TARGET else '⚠️'} pivot 阶段最低加速 ×{worst:.1f}（目标 ×{SPEEDUP_TARGET:.0f}）")
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="MarketStructure 回归语料校验 + 基线耗时对比")
+    ap.add_argument("--baseline", default=BASELINE_REV, help="基线 git 版本")
+    ap.add_argument("--build", action="store_true", help="重新生成语料和期望输出")
+    ap.add_argument("--no-timing", action="store_true", help="只做一致性校验")
+    args = ap.parse_args(argv)
+
+    if args.build:
+        build(args.baseline)
+    bad = check()
+    if not args.no_timing:
+        compare(args.baseline)
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+# tests/conftest.py
+"""
+测试离线环境：Redis 换成进程内 fakeredis，account_positions 换成空账户桩（不连币安）
+
+- 项目模块在导入时就创建 Redis 客户端 / 连接账户，替换必须在收集测试模块（导入项目模块）之前，
+  所以放在 pytest_configure 里；每个测试前清空 fakeredis
+- 依赖见 requirements-dev.txt
+"""
+import os
+import sys
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_server = None
+
+
+def pytest_configure(config):
+    global _server
+    try:
+        import fakeredis
+    except ImportError:
+        raise pytest.UsageError("测试需要 fakeredis：pip install -r requirements-dev.txt")
+    import redis
+
+    sys.path.insert(0, ROOT)
+    _server = fakeredis.FakeServer()
+
+    def _client(*args, **kwargs):
+        return fakeredis.FakeStrictRedis(server=_server, decode_responses=kwargs.get("decode_responses", False))
+
+    redis.StrictRedis = redis.Redis = _client
+
+    stub = types.ModuleType("account_positions")
+    stub.account_snapshot = {"balance": 10000.0, "available": 10000.0, "total_unrealized": 0.0, "positions": []}
+    stub.tp_sl_cache = {}
+    stub.get_account_status = lambda: stub.account_snapshot
+    sys.modules["account_positions"] = stub
+
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    """每个测试一个空的 fakeredis"""
+    from database import redis_client
+    redis_client.flushall()
+    yield redis_client
+
@@ -0,0 +1,57 @@
+# tests/test_decision_stream.py
+"""DecisionStreamParser：任意切片 / HTML 转义（含跨分片实体）/ 字符串里的花括号与转义引号，结果与 _extract_all_json 一致"""
+import json
+import random
+from decision_stream import DecisionStreamParser
+from deepseek_batch_pusher import _extract_all_json
+
+
+def response(symbols: list[str]) -> str:
+    reasoning = " ".join(f"{s} 4H 区间下沿，15m 假突破回收。" for s in symbols) * 3
+    decisions = [
+        {"symbol": s, "action": "open_long" if i % 2 else "wait", "stop_loss": 95.0,
+         "take_profit": 110.0, "position_size": 100, "confidence": 0.7}
+        for i, s in enumerate(symbols)
+    ]
+    return f"<reasoning>{reasoning}</reasoning>\n<decision>{json.dumps(decisions, ensure_ascii=False)}</decision>"
+
+
+def feed_in_chunks(text: str, rng: random.Random) -> list[dict]:
+    parser = DecisionStreamParser()
+    got, i = [], 0
+    while i < len(text):
+        n = rng.randint(1, 12)
+        got += parser.feed(text[i:i + n])
+        i += n
+    return got + parser.close()
+
+
+def test_split_chunks_and_entities_match_final_parse():
+    rng = random.Random(1)
+    for trial in range(300):
+        text = response([f"S{i}USDT" for i in range(rng.randint(1, 6))])
+        if trial % 7 == 0:
+            text = text.replace('"wait"', '"w}a{i\\"t"')
+        if trial % 3 == 0:
+            text = text.replace("<", "&lt;").replace(">", "&gt;")
+        if trial % 5 == 0:
+            text = text.replace("<decision>", "<DECISION>").replace("&lt;decision&gt;", "&lt;DECISION&gt;")
+        assert feed_in_chunks(text, rng) == _extract_all_json(text), trial
+
+
+def test_decisions_emitted_before_stream_ends():
+    text = response(["AUSDT", "BUSDT", "CUSDT"])
+    parser = DecisionStreamParser()
+    cut = text.index('"BUSDT"')
+    first = parser.feed(text[:cut])
+    assert [d["symbol"] for d in first] == ["AUSDT"]
+    rest = parser.feed(text[cut:]) + parser.close()
+    assert [d["symbol"] for d in rest] == ["BUSDT", "CUSDT"]
+
+
+def test_entity_split_across_chunks():
+    text = response(["AUSDT"]).replace("<", "&lt;").replace(">", "&gt;")
+    i = text.index("&lt;decision&gt;") + 2  # 分片停在 "&l"
+    parser = DecisionStreamParser()
+    got = parser.feed(text[:i]) + parser.feed(text[i:]) + parser.close()
+    assert [d["symbol"] for d in got] == ["AUSDT"]
@@ -0,0 +1,75 @@
+# tests/test_early_dispatch.py
+"""EarlyDispatcher 经 StubLLMServer：已提前下单的币种，重试给出的不同动作不再下单"""
+import json
+import asyncio
+import deepseek_batch_pusher as pusher
+from llm_router import LLMRouter
+from llm_executor import HedgedExecutor, RoundBudget
+from llm_stub_server import StubLLMServer
+from early_dispatch import EarlyDispatcher
+
+DATASET = {"S0USDT": {"15m": {"indicators": {}}}}
+
+
+def reply(action: str):
+    def build(body: dict) -> str:
+        decisions = [{"symbol": "S0USDT", "action": action, "confidence": 0.9}]
+        decisions += [{"symbol": f"S{i}USDT", "action": "wait", "confidence": 0.5} for i in range(1, 20)]
+        return f"<reasoning>r</reasoning>\n<decision>{json.dumps(decisions)}</decision>"
+    return build
+
+
+def test_failed_owner_then_retry_with_other_action(monkeypatch):
+    # 第一个端点流式吐出 open_long 后断开；重试的端点对同一币种给出 open_short
+    servers = {
+        "broken": StubLLMServer(reply=reply("open_long"), drop_after=2),
+        "backup": StubLLMServer(reply=reply("open_short")),
+    }
+    executed = []
+
+    async def execute(sig):
+        executed.append((sig["symbol"], sig["action"]))
+
+    async def main():
+        for s in servers.values():
+            await s.start()
+        monkeypatch.setattr(pusher, "LLM_ROUTER", LLMRouter(
+            [{"name": n, "url": s.url, "model": "stub", "api_key": "k"} for n, s in servers.items()]
+        ))
+        monkeypatch.setattr(pusher, "LLM_EXECUTOR", HedgedExecutor())
+        monkeypatch.setattr(pusher, "LLM_STREAM_ENABLED", True)
+        await pusher.init_http_session()
+        try:
+            dispatcher = EarlyDispatcher(lambda sig: sig.get("action") != "wait", execute)
+            res = await pusher._push_single_batch_claude(DATASET, {}, 0, 1, dispatcher, RoundBudget(60, 2))
+            await asyncio.gather(*dispatcher.tasks.values())
+        finally:
+            await pusher.close_http_session()
+            for s in servers.values():
+                await s.stop()
+
+        assert [(a["endpoint"], a["outcome"]) for a in res["attempts"]] == [("broken", "error"), ("backup", "ok")]
+        final = [s for s in res["signals"] if s.get("action") != "wait"]
+        assert [(s["symbol"], s["action"]) for s in final] == [("S0USDT", "open_short")]
+        # 整轮结果里的冲突动作不再下单：只有流式提前下的那一单
+        assert dispatcher.remaining(final) == []
+        assert executed == [("S0USDT", "open_long")]
+
+    asyncio.run(main())
+
+
+def test_remaining_keeps_symbols_not_dispatched():
+    async def main():
+        dispatcher = EarlyDispatcher(lambda sig: True, lambda sig: asyncio.sleep(0))
+        dispatcher({"symbol": "AUSDT", "action": "open_long"})
+        dispatcher({"symbol": "AUSDT", "action": "close_long"})
+        await asyncio.gather(*dispatcher.tasks.values())
+        assert list(dispatcher.tasks) == ["AUSDT"]
+        pending = dispatcher.remaining([
+            {"symbol": "AUSDT", "action": "open_long"},
+            {"symbol": "AUSDT", "action": "reverse"},
+            {"symbol": "BUSDT", "action": "open_short"},
+        ])
+        assert pending == [{"symbol": "BUSDT", "action": "open_short"}]
+
+    asyncio.run(main())
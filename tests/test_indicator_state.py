@@ -0,0 +1,70 @@
+# tests/test_indicator_state.py
+"""IndicatorState 增量 EMA / ATR / ATR 均值 与 talib 整窗重算一致（含一次追加多根、窗口滑动、从 checkpoint 重启）"""
+import numpy as np
+import pytest
+from config import EMA_CONFIG
+from kline_codec import KLINE_DTYPE
+from kline_store import KLINE_STORE
+from indicator_state import IndicatorState, ATR_PERIOD, ATR_MA_WINDOW
+
+talib = pytest.importorskip("talib")
+
+REL_TOL = 1e-9
+STEPS = {"15m": 900_000, "1h": 3_600_000, "4h": 14_400_000}
+
+
+def bars(rng, t0: int, n: int, step: int, p0: float) -> np.ndarray:
+    b = np.zeros(n, dtype=KLINE_DTYPE)
+    b["Timestamp"] = t0 + np.arange(n) * step
+    c = p0 * np.cumprod(1 + rng.normal(0, 0.01, n))
+    b["Close"] = c
+    b["Open"] = np.r_[p0, c[:-1]]
+    b["High"] = np.maximum(b["Open"], c) * (1 + rng.uniform(0, 0.005, n))
+    b["Low"] = np.minimum(b["Open"], c) * (1 - rng.uniform(0, 0.005, n))
+    return b
+
+
+def reference(view: np.ndarray, interval: str) -> dict:
+    c = np.ascontiguousarray(view["Close"])
+    atr = talib.ATR(np.ascontiguousarray(view["High"]), np.ascontiguousarray(view["Low"]), c, ATR_PERIOD)
+    valid = atr[np.isfinite(atr)]
+    return {
+        "atr": atr[-1],
+        "atr_ma20": np.nanmean(valid[-ATR_MA_WINDOW:]),
+        "ema": {f"EMA_{p}": talib.EMA(c, p)[-1] for p in EMA_CONFIG.get(interval, []) if p <= len(c)},
+    }
+
+
+def rel(a: float, b: float) -> float:
+    return abs(a - b) / abs(b)
+
+
+@pytest.mark.parametrize("interval", list(STEPS))
+def test_incremental_matches_talib(interval):
+    rng = np.random.default_rng(5)
+    step = STEPS[interval]
+    symbol = "XUSDT"
+    seed = bars(rng, 0, 40, step, 100.0)
+    KLINE_STORE.load(symbol, interval, seed)
+    state = IndicatorState()
+    t, price = 40 * step, float(seed["Close"][-1])
+
+    worst = 0.0
+    for it in range(600):
+        k = int(rng.choice([1, 1, 1, 1, 2, 3, 20])) if it % 150 else 0
+        if k:
+            new = bars(rng, t, k, step, price)
+            KLINE_STORE.append(symbol, interval, new)
+            t, price = t + k * step, float(new["Close"][-1])
+        if it == 300:
+            state = IndicatorState()  # 重启：从 checkpoint 恢复
+        if it % 50 == 0:
+            state.checkpoint()
+
+        got = state.compute(symbol, interval)
+        want = reference(KLINE_STORE.view(symbol, interval), interval)
+        errs = [rel(got["atr"], want["atr"]), rel(got["atr_ma20"], want["atr_ma20"])]
+        errs += [rel(got["ema"][k], v) for k, v in want["ema"].items()]
+        worst = max(worst, *errs)
+    KLINE_STORE.drop_symbol(symbol)
+    assert worst < REL_TOL
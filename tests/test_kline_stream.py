@@ -0,0 +1,142 @@
+# tests/test_kline_stream.py
+"""KlineStreamIngester 经 FakeKlineStreamServer：收盘事件 / 增量订阅 / 断线重连后重新订阅 / 与 REST 增量同步并发写"""
+import time
+import asyncio
+import aiohttp
+import numpy as np
+import kline_stream
+import kline_fetcher
+from kline_stream import KlineStreamIngester, stream_name
+from kline_stream_fake import FakeKlineStreamServer
+from kline_codec import KLINE_DTYPE
+from kline_store import KLINE_STORE
+
+STEP = 900_000
+T0 = 1_700_000_000_000 // STEP * STEP
+
+
+def frame(symbol: str, open_ts: int, closed: bool = True, interval: str = "15m") -> dict:
+    return {
+        "stream": stream_name(symbol, interval),
+        "data": {"e": "kline", "s": symbol, "k": {
+            "t": open_ts, "T": open_ts + STEP - 1, "s": symbol, "i": interval, "x": closed,
+            "o": "1", "h": "2", "l": "0.5", "c": "1.5", "v": "10", "V": "4",
+        }},
+    }
+
+
+async def until(cond, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not cond():
+        assert asyncio.get_running_loop().time() < deadline, "等待超时"
+        await asyncio.sleep(0.02)
+
+
+def subscribed(server: FakeKlineStreamServer, method: str) -> list[str]:
+    return [p for r in server.requests if r.get("method") == method for p in r.get("params", [])]
+
+
+async def _session(server: FakeKlineStreamServer, ingester: KlineStreamIngester, body):
+    await server.start()
+    ingester.url = server.url
+    async with aiohttp.ClientSession() as session:
+        task = asyncio.create_task(ingester.run(session))
+        try:
+            await until(lambda: ingester.connected)
+            await body()
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await server.stop()
+
+
+def setup_function():
+    for symbol in ("ETHUSDT", "SOLUSDT", "BTCUSDT"):
+        KLINE_STORE.drop_symbol(symbol)
+
+
+def test_closed_frames_write_store_and_notify():
+    seed = np.zeros(1, dtype=KLINE_DTYPE)
+    seed["Timestamp"] = T0
+    KLINE_STORE.load("ETHUSDT", "15m", seed)
+
+    server = FakeKlineStreamServer([
+        frame("ETHUSDT", T0 + STEP, closed=False),
+        frame("ETHUSDT", T0 + STEP),
+        frame("SOLUSDT", T0 + STEP),   # 存储里没有 SOL：不写入，但照样记收盘事件
+    ])
+    ingester = KlineStreamIngester(intervals=["15m"])
+
+    async def body():
+        got = await ingester.wait_candle_closed("15m", T0 + STEP, symbols={"ETHUSDT", "SOLUSDT"}, timeout=5)
+        assert got == {"ETHUSDT", "SOLUSDT"}
+        # 未收盘的帧不算
+        assert ingester.stats["closed_bars"] == 2
+        assert ingester.stats["written"] == 1
+        assert KLINE_STORE.last_ts("ETHUSDT", "15m") == T0 + STEP
+        assert KLINE_STORE.last_ts("SOLUSDT", "15m") is None
+        # 没到的收盘时刻：超时返回空集
+        assert await ingester.wait_candle_closed("15m", T0 + 2 * STEP, timeout=0.1) == set()
+
+    asyncio.run(_session(server, ingester, body))
+
+
+def test_resubscribe_on_pool_change_and_reconnect(monkeypatch, fake_redis):
+    monkeypatch.setattr(kline_stream, "RESUBSCRIBE_CHECK_SEC", 0.05)
+    monkeypatch.setattr(kline_stream, "UNSUBSCRIBE_GRACE_SEC", 0)
+    btc = stream_name("BTCUSDT", "15m")
+    server = FakeKlineStreamServer([frame("BTCUSDT", T0)])
+    ingester = KlineStreamIngester(intervals=["15m"])
+
+    async def body():
+        await until(lambda: stream_name("ETHUSDT", "15m") in subscribed(server, "SUBSCRIBE"))
+        assert btc not in subscribed(server, "SUBSCRIBE")
+
+        # 监控池扩大：增量订阅，订阅后服务端回放该 stream 的帧
+        fake_redis.rpush("AI500_SYMBOLS", "BTCUSDT")
+        await until(lambda: btc in subscribed(server, "SUBSCRIBE"))
+        assert await ingester.wait_candle_closed("15m", T0, symbols={"BTCUSDT"}, timeout=5) == {"BTCUSDT"}
+
+        # 监控池收缩（宽限期 0）：退订
+        fake_redis.delete("AI500_SYMBOLS")
+        await until(lambda: btc in subscribed(server, "UNSUBSCRIBE"))
+
+        # 服务端断线：重连后全量重新订阅
+        n_sub = len(subscribed(server, "SUBSCRIBE"))
+        await server.drop_connections()
+        await until(lambda: ingester.stats["reconnects"] == 1)
+        await until(lambda: ingester.connected and len(subscribed(server, "SUBSCRIBE")) > n_sub)
+        assert set(subscribed(server, "SUBSCRIBE")[n_sub:]) == {
+            stream_name("ETHUSDT", "15m"), stream_name("SOLUSDT", "15m"),
+        }
+
+    asyncio.run(_session(server, ingester, body))
+
+
+def test_ws_close_during_slow_rest_sync_is_written_once(monkeypatch):
+    now = int(time.time() * 1000) // STEP * STEP
+    t = now - STEP  # 已收盘、尚未写入的一根
+    seed = np.zeros(1, dtype=KLINE_DTYPE)
+    seed["Timestamp"] = t - STEP
+    KLINE_STORE.load("ETHUSDT", "15m", seed)
+
+    server = FakeKlineStreamServer([])
+    ingester = KlineStreamIngester(intervals=["15m"])
+
+    async def slow_get_klines(params, retries=3):
+        assert params["startTime"] == t
+        # REST 请求在途时，WebSocket 推送同一根K线的收盘并先写进存储
+        await server.replay([frame("ETHUSDT", t)])
+        assert await ingester.wait_candle_closed("15m", t, symbols={"ETHUSDT"}, timeout=5) == {"ETHUSDT"}
+        return [[t, "1", "2", "0.5", "1.5", "10", t + STEP - 1, "15", 3, "4", "6", "0"]]
+
+    monkeypatch.setattr(kline_fetcher, "get_klines", slow_get_klines)
+
+    async def body():
+        await until(lambda: stream_name("ETHUSDT", "15m") in subscribed(server, "SUBSCRIBE"))
+        assert await kline_fetcher.sync_incremental("ETHUSDT", "15m", 301)
+        assert ingester.stats["written"] == 1
+        ts = KLINE_STORE.view("ETHUSDT", "15m")["Timestamp"]
+        assert ts.tolist() == [t - STEP, t]
+
+    asyncio.run(_session(server, ingester, body))
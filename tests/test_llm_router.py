@@ -0,0 +1,150 @@
+# tests/test_llm_router.py
+"""LLM_ROUTER / LLM_EXECUTOR 经 StubLLMServer：选路 / 熔断开-半开-关 / 对冲"""
+import time
+import asyncio
+import pytest
+import deepseek_batch_pusher as pusher
+import llm_router
+import llm_executor
+from llm_router import LLMRouter, CLOSED, OPEN, HALF_OPEN
+from llm_executor import HedgedExecutor, RoundBudget
+from llm_stub_server import StubLLMServer
+
+DATASET = {"S0USDT": {"15m": {"indicators": {}}}}
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    ex = HedgedExecutor()
+    monkeypatch.setattr(pusher, "LLM_EXECUTOR", ex)
+    return ex
+
+
+def warm(ex: HedgedExecutor, delay: float, monkeypatch):
+    """灌满历史延迟窗口，使对冲阈值 = delay（不受测试中少量慢样本影响）"""
+    monkeypatch.setattr(llm_executor, "LLM_HEDGE_MIN_DELAY_SEC", delay)
+    ex.latencies.extend([0.01] * ex.latencies.maxlen)
+
+
+def route(servers: dict[str, StubLLMServer], monkeypatch) -> LLMRouter:
+    router = LLMRouter([{"name": n, "url": s.url, "model": "stub", "api_key": "k"} for n, s in servers.items()])
+    monkeypatch.setattr(pusher, "LLM_ROUTER", router)
+    return router
+
+
+async def serve(servers: dict[str, StubLLMServer], body):
+    for s in servers.values():
+        await s.start()
+    await pusher.init_http_session()
+    try:
+        await body()
+    finally:
+        await pusher.close_http_session()
+        for s in servers.values():
+            await s.stop()
+
+
+async def push(idx: int, budget: RoundBudget) -> tuple[dict, list[tuple[str, str]]]:
+    res = await pusher._push_single_batch_claude(DATASET, {}, idx, 10, None, budget)
+    return res, [(a["endpoint"], a["outcome"]) for a in res["attempts"]]
+
+
+def test_routes_to_faster_endpoint(executor, monkeypatch):
+    servers = {"slow": StubLLMServer(latency=0.3), "fast": StubLLMServer(latency=0.01)}
+
+    async def body():
+        router = route(servers, monkeypatch)
+        budget = RoundBudget(60, 4)
+        used = []
+        for i in range(5):
+            res, attempts = await push(i, budget)
+            assert res["signals"] and not res.get("error")
+            used.append(attempts[0][0])
+        # 两个端点各探索一次，之后只走快的
+        assert used == ["slow", "fast", "fast", "fast", "fast"]
+        assert len(servers["slow"].requests) == 1
+        assert router.get("fast").latency_ms < router.get("slow").latency_ms
+        assert budget.used == 0
+
+    asyncio.run(serve(servers, body))
+
+
+def test_breaker_opens_then_half_open_probe_closes(executor, monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_BREAKER_COOLDOWN_SEC", 1.0)
+    warm(executor, 0.1, monkeypatch)
+    # backup 慢于对冲阈值：每批都会对冲到 flaky（对冲优先换端点）
+    servers = {"backup": StubLLMServer(latency=0.6), "flaky": StubLLMServer(fail_rate=1.0)}
+
+    async def body():
+        router = route(servers, monkeypatch)
+        flaky = router.get("flaky")
+        budget = RoundBudget(60, 10)
+
+        for i in range(llm_router.LLM_BREAKER_FAILURES):
+            res, attempts = await push(i, budget)
+            assert res["signals"] and not res.get("error")
+            assert attempts == [("backup", "ok"), ("flaky", "error")]
+        assert flaky.state == OPEN
+        assert len(servers["flaky"].requests) == llm_router.LLM_BREAKER_FAILURES
+
+        # 冷却中：对冲只能回到 backup，flaky 收不到请求
+        _, attempts = await push(10, budget)
+        assert [ep for ep, _ in attempts] == ["backup", "backup"]
+        assert len(servers["flaky"].requests) == llm_router.LLM_BREAKER_FAILURES
+
+        # 冷却结束 + 端点恢复：对冲作为半开探测发给 flaky，成功后熔断关闭
+        await asyncio.sleep(1.0)
+        servers["flaky"].fail_rate = 0.0
+        _, attempts = await push(11, budget)
+        assert attempts == [("backup", "cancelled"), ("flaky", "ok")]
+        assert flaky.state == CLOSED and flaky.failures == 0
+
+    asyncio.run(serve(servers, body))
+
+
+def test_half_open_probe_failure_reopens(monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_BREAKER_COOLDOWN_SEC", 0.05)
+    router = LLMRouter([{"name": "a", "url": "http://a", "model": "m"}, {"name": "b", "url": "http://b", "model": "m"}])
+    a = router.get("a")
+    for _ in range(llm_router.LLM_BREAKER_FAILURES):
+        ep = router.pick(exclude={"b"})
+        router.failure(ep)
+        router.release(ep)
+    assert a.state == OPEN
+    assert router.pick().name == "b"
+    router.release(router.get("b"))
+
+    time.sleep(0.05)
+    probe = router.pick(exclude={"b"})
+    assert probe is a and a.state == HALF_OPEN
+    # 半开时只放一个探测请求
+    assert router.pick(exclude={"b"}).name == "b"
+    router.failure(a, "probe")
+    router.release(a)
+    assert a.state == OPEN and a.opened_at > 0
+
+
+def test_hedge_to_other_endpoint_censors_loser(executor, monkeypatch):
+    warm(executor, 0.2, monkeypatch)
+    servers = {"slow": StubLLMServer(latency=2.0), "fast": StubLLMServer(latency=0.05)}
+
+    async def body():
+        router = route(servers, monkeypatch)
+        budget = RoundBudget(60, 4)
+
+        t0 = time.perf_counter()
+        res, attempts = await push(0, budget)
+        assert res["signals"] and not res.get("error")
+        assert attempts == [("slow", "cancelled"), ("fast", "ok")]
+        assert time.perf_counter() - t0 < 1.5
+        assert budget.used == 1
+        # 输掉的慢端点记删失样本：有结果、不计失败、延迟下界 ≈ 对冲等待时间
+        slow = router.get("slow")
+        assert slow.requests == 1 and slow.failures == 0 and slow.error == 0
+        assert slow.latency_ms >= 200
+
+        _, attempts = await push(1, budget)
+        assert attempts == [("fast", "ok")]
+        assert budget.used == 1
+
+    asyncio.run(serve(servers, body))
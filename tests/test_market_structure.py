@@ -0,0 +1,70 @@
+# tests/test_market_structure.py
+"""IncrementalMarketStructure 与 analyze(同一窗口) 完全一致：随机滑窗 / 跳根 / 缺口 / 同价 / 一字线"""
+import json
+import numpy as np
+from config import STRUCTURE_PARAMS
+from kline_codec import KLINE_DTYPE
+from market_structure import MarketStructure, IncrementalMarketStructure
+
+STEP = 900_000
+PARAMS = list(STRUCTURE_PARAMS.values()) + [
+    {"swing_size": 2, "keep_pivots": 4},
+    {"swing_size": 1, "keep_pivots": 0},
+]
+
+
+def history(rng, n: int, tick: float) -> np.ndarray:
+    c = 100 * np.cumprod(1 + rng.normal(0, 0.01, n))
+    h = c * (1 + rng.uniform(0, 0.01, n))
+    lo = c * (1 - rng.uniform(0, 0.01, n))
+    if tick:  # 按最小变动价位取整：大量同价
+        h, lo = np.round(h / tick) * tick, np.round(lo / tick) * tick
+    bars = np.zeros(n, dtype=KLINE_DTYPE)
+    bars["Timestamp"] = np.arange(n) * STEP
+    bars["High"], bars["Low"], bars["Close"] = h, lo, c
+    flat = rng.random(n) < 0.05  # 一字线
+    bars["Low"][flat] = bars["High"][flat]
+    return bars
+
+
+def as_rows(win: np.ndarray) -> list[dict]:
+    return [dict(zip(KLINE_DTYPE.names, (x.item() for x in r))) for r in win]
+
+
+def dump(result: dict) -> str:
+    return json.dumps(result, sort_keys=True)
+
+
+def test_incremental_matches_analyze():
+    rng = np.random.default_rng(11)
+    steps = 0
+    for trial in range(len(PARAMS) * 3):
+        p = PARAMS[trial % len(PARAMS)]
+        cap = int(rng.choice([30, 120, 300, 800]))
+        hist = history(rng, 3000, float(rng.choice([0, 1, 2])))
+        full, inc = MarketStructure(**p), IncrementalMarketStructure(**p)
+
+        end = int(rng.integers(5, cap))
+        while end < len(hist):
+            win = hist[max(0, end - cap):end]
+            if rng.random() < 0.02 and len(win) > 10:
+                win = np.delete(win, len(win) // 2)  # 窗口不连续：整窗重建
+            rows = as_rows(win) if trial % 3 == 0 else win
+            assert dump(inc.update(rows)) == dump(full.analyze(rows)), (p, cap, end)
+            steps += 1
+            end += int(rng.choice([1, 1, 1, 1, 1, 2, 3, 7, 40]))
+            if trial % 3 == 0 and end > 400:
+                break
+    assert steps > 4000
+
+
+def test_incremental_rebuilds_on_interval_change():
+    rng = np.random.default_rng(3)
+    p = STRUCTURE_PARAMS["15m"]
+    hist = history(rng, 400, 0)
+    full, inc = MarketStructure(**p), IncrementalMarketStructure(**p)
+    inc.update(hist[:300])
+
+    coarse = hist[::4].copy()
+    coarse["Timestamp"] = np.arange(len(coarse)) * STEP * 4
+    assert dump(inc.update(coarse)) == dump(full.analyze(coarse))